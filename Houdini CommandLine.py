@@ -1,35 +1,94 @@
-import glob
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import subprocess
+import argparse
 import os
+import queue
 import time
-import json
 from ttkthemes import ThemedTk
 import threading
 
+from houdini_render.batchscan import find_hip_files, write_report
+from houdini_render.coordinator import RemotePool
+from houdini_render.core import EngineError, RenderEngine
+from houdini_render.daemon import (DEFAULT_HOST, DEFAULT_PORT, LOCAL_HOSTS, TOKEN_ENV,
+                                   RenderDaemon, default_token)
+from houdini_render.installs import InstallCache, version_text
+from houdini_render.detection import DEFAULT_ROOTS
+from houdini_render.logpipe import LogPipeline
+from houdini_render.jobs import FINISHED_STATES, RUNNING
+from houdini_render.settings import state_path
+from houdini_render.telemetry import format_bytes
+
 class ModernHoudiniRenderUI:
-    def __init__(self, root):
+    def __init__(self, root, coordinator_address=None, scan_cache_hash=False):
         self.root = root
         self.root.title("Houdini Command Line Cache/Renderer")
-        self.render_process = None
         self.latest_path = ""
         self.root.rowconfigure(0, weight=1)
         self.root.columnconfigure(0, weight=1)
         self.root.set_theme("equilux")
         self.hip_path = tk.StringVar()
-        self.hcmd_path = self.detect_houdini_version()
-        if not self.hcmd_path:
+        # Installed builds, newest first; jobs are pinned to the selected one
+        installs = InstallCache(state_path("houdini_installs.json")).installs()
+        if not installs:
             messagebox.showerror("Error", "No Houdini installation detected.")
             self.root.destroy()
             return
+        self.houdini_versions = [version_text(install.version) for install in installs]
+        self.houdini_build = tk.StringVar(value=self.houdini_versions[0])
         self.progress_var = tk.DoubleVar()
+        # Log lines and progress updates arrive from worker threads and are
+        # applied on the Tk main loop every log_interval ms
+        self.log_path = state_path("render.log")
+        self.log_pipeline = LogPipeline(self.log_path)
+        self.log_max_lines = 5000
+        self.log_interval = 100
+        self.pending_progress = None
+        # Ids of queue rows to redraw on the next tick, and the last progress text per job
+        self.dirty_jobs = set()
+        self.dirty_lock = threading.Lock()
+        self.job_progress_text = {}
+        # (function, args) queued by worker threads, run by flush_logs on the Tk main loop
+        self.ui_calls = queue.Queue()
+        # Render queue settings; the hbatch thread budget is split between parallel jobs
+        self.max_parallel = tk.IntVar(value=2)
+        self.ram_ceiling = tk.DoubleVar(value=0)
+        # Jobs are held when their output would leave less than this free on its disk
+        self.min_free_gb = tk.DoubleVar(value=5)
+        self.writers_per_volume = tk.IntVar(value=0)
+        self.job_priority = tk.IntVar(value=0)
+        # Frames per chunk when splitting a ROP across processes (0 renders it in one go)
+        self.chunk_size = tk.IntVar(value=0)
+        self.chunk_workers = tk.IntVar(value=4)
+        # Skip frames whose cache files already exist and look complete
+        self.resume_frames = tk.BooleanVar(value=False)
+        self.queue_inputs = tk.BooleanVar(value=False)
+        self.pipeline_chunks = tk.BooleanVar(value=False)
+        # Tree item id -> (hip path, scanned node dict)
+        self.node_rows = {}
+        self.batch_scanner = None
+        self.force_rescan = tk.BooleanVar(value=False)
+        # Only search /obj, /out and /stage instead of the whole scene
+        self.limit_scan_roots = tk.BooleanVar(value=True)
+        # Sessions, queue, scan cache and scheduler live in the engine, which
+        # the command line and daemon share; the UI only draws its state
+        # As a coordinator the queue is rendered by remote workers instead of locally
+        coordinator = RemotePool(on_log=self.add_log) if coordinator_address else None
+        self.engine = RenderEngine(max_parallel=self.max_parallel.get(),
+                                   on_log=self.add_log,
+                                   on_output=self.on_job_output,
+                                   on_update=self.on_job_update,
+                                   on_chunk=self.on_chunk_update,
+                                   on_progress=self.on_job_progress,
+                                   coordinator=coordinator,
+                                   scan_cache_hash=scan_cache_hash)
+        self.server = None
+        if coordinator_address:
+            self.server = RenderDaemon(self.engine, *coordinator_address, token=default_token())
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+            self.root.title(f"{self.root.title()} - coordinator on "
+                            f"{coordinator_address[0]}:{coordinator_address[1]}")
         
-        # Define supported node types and their render commands
-        self.supported_nodes = {
-            "filecache::2.0": lambda path: f'render -V {path}/render',
-            "usdrender_rop": lambda path: f'render -V {path}'
-        }
 
 
         self.style = ttk.Style()
@@ -55,6 +114,15 @@ class ModernHoudiniRenderUI:
 
         self.create_widgets()
 
+        restored = self.engine.queue.pending()
+        if restored:
+            self.queue_pause_btn.config(text="Resume Queue")
+            self.add_log(f"Restored {len(restored)} queued jobs. Press Resume Queue to continue.\n")
+        for job in self.engine.queue.snapshot():
+            self.refresh_queue_item(job)
+        self.engine.start(paused=bool(restored))
+        self.root.after(self.log_interval, self.flush_logs)
+
     def create_widgets(self):
         # Title Section
         title_frame = ttk.Frame(self.left_frame)
@@ -81,6 +149,53 @@ class ModernHoudiniRenderUI:
                               command=self.browse_hip, style="Custom.TButton")
         browse_btn.pack(side=tk.LEFT, padx=5)
 
+        build_frame = ttk.Frame(input_frame)
+        build_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(build_frame, text="Houdini Build ").pack(side=tk.LEFT, padx=5)
+        ttk.Combobox(build_frame, textvariable=self.houdini_build, values=self.houdini_versions,
+                     state="readonly", width=12).pack(side=tk.LEFT, padx=5)
+
+        # Queue limits
+        limits_frame = ttk.Frame(input_frame)
+        limits_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(limits_frame, text="Parallel Jobs:").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(limits_frame, from_=1, to=16, width=4, textvariable=self.max_parallel,
+                    command=self.apply_queue_limits).pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(limits_frame, text="RAM Ceiling (GB, 0 = off):").pack(side=tk.LEFT, padx=5)
+        ram_entry = ttk.Entry(limits_frame, textvariable=self.ram_ceiling, width=6)
+        ram_entry.pack(side=tk.LEFT, padx=5)
+        ram_entry.bind("<FocusOut>", lambda event: self.apply_queue_limits())
+        ram_entry.bind("<Return>", lambda event: self.apply_queue_limits())
+
+        ttk.Label(limits_frame, text="Min Free Disk (GB):").pack(side=tk.LEFT, padx=5)
+        free_entry = ttk.Entry(limits_frame, textvariable=self.min_free_gb, width=6)
+        free_entry.pack(side=tk.LEFT, padx=5)
+        free_entry.bind("<FocusOut>", lambda event: self.apply_queue_limits())
+        free_entry.bind("<Return>", lambda event: self.apply_queue_limits())
+
+        ttk.Label(limits_frame, text="Writers per Disk (0 = off):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(limits_frame, from_=0, to=16, width=4, textvariable=self.writers_per_volume,
+                    command=self.apply_queue_limits).pack(side=tk.LEFT, padx=5)
+
+        chunk_frame = ttk.Frame(input_frame)
+        chunk_frame.pack(fill=tk.X, pady=5)
+
+        ttk.Label(chunk_frame, text="Chunk Size (frames, 0 = off):").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(chunk_frame, from_=0, to=10000, width=6,
+                    textvariable=self.chunk_size).pack(side=tk.LEFT, padx=5)
+        ttk.Label(chunk_frame, text="Chunk Workers:").pack(side=tk.LEFT, padx=5)
+        ttk.Spinbox(chunk_frame, from_=1, to=64, width=4,
+                    textvariable=self.chunk_workers).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(chunk_frame, text="Resume (skip existing frames)",
+                        variable=self.resume_frames).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(chunk_frame, text="Queue Inputs",
+                        variable=self.queue_inputs).pack(side=tk.LEFT, padx=5)
+        ttk.Checkbutton(chunk_frame, text="Pipeline Chunks",
+                        variable=self.pipeline_chunks).pack(side=tk.LEFT, padx=5)
+
         # Node Selection Section
         node_selection_frame = ttk.LabelFrame(self.left_frame, text="Available Nodes", padding="10")
         node_selection_frame.pack(fill=tk.BOTH, expand=True, pady=10)
@@ -92,18 +207,32 @@ class ModernHoudiniRenderUI:
                                   command=self.scan_nodes, style="Custom.TButton")
         scan_nodes_btn.pack(side=tk.RIGHT, padx=5)
 
+        batch_scan_btn = ttk.Button(scan_button_frame, text="Batch Scan Folder",
+                                  command=self.batch_scan, style="Custom.TButton")
+        batch_scan_btn.pack(side=tk.RIGHT, padx=5)
+
+        ttk.Checkbutton(scan_button_frame, text="Force Rescan",
+                        variable=self.force_rescan).pack(side=tk.RIGHT, padx=5)
+
+        ttk.Checkbutton(scan_button_frame, text="Only /obj, /out, /stage",
+                        variable=self.limit_scan_roots).pack(side=tk.RIGHT, padx=5)
+
         # Create Treeview for nodes
         self.nodes_tree = ttk.Treeview(node_selection_frame, 
-                                     columns=("Node Type", "Node Path"), 
+                                     columns=("Node Type", "Node Path", "Frames", "Hip File"), 
                                      show="headings", 
-                                     selectmode="browse")
+                                     selectmode="extended")
         
         self.nodes_tree.heading("Node Type", text="Node Type")
         self.nodes_tree.heading("Node Path", text="Node Path")
+        self.nodes_tree.heading("Frames", text="Frames")
+        self.nodes_tree.heading("Hip File", text="Hip File")
         
         # Configure column widths
         self.nodes_tree.column("Node Type", width=150, minwidth=100)
         self.nodes_tree.column("Node Path", width=250, minwidth=150)
+        self.nodes_tree.column("Frames", width=90, minwidth=60)
+        self.nodes_tree.column("Hip File", width=150, minwidth=80)
         
         # Add scrollbars
         tree_scroll_y = ttk.Scrollbar(node_selection_frame, 
@@ -139,11 +268,15 @@ class ModernHoudiniRenderUI:
         control_frame.pack(fill=tk.X, pady=10)
 
         render_btn = ttk.Button(control_frame, 
-                              text="Start Render", 
+                              text="Add to Queue", 
                               command=self.start_render, 
                               style="Custom.TButton")
         render_btn.pack(side=tk.RIGHT, padx=5)
 
+        ttk.Spinbox(control_frame, from_=-10, to=10, width=4,
+                    textvariable=self.job_priority).pack(side=tk.RIGHT, padx=5)
+        ttk.Label(control_frame, text="Priority:").pack(side=tk.RIGHT)
+
         cancel_btn = ttk.Button(control_frame, 
                               text="Cancel Render", 
                               command=self.cancel_render, 
@@ -151,6 +284,38 @@ class ModernHoudiniRenderUI:
         cancel_btn.pack(side=tk.RIGHT, padx=5)
 
 
+        # Render queue
+        queue_frame = ttk.LabelFrame(self.right_frame, text="Render Queue", padding="10")
+        queue_frame.pack(fill=tk.BOTH, pady=(0, 10))
+
+        self.queue_tree = ttk.Treeview(queue_frame,
+                                     columns=("Priority", "State", "Progress", "Node", "Hip File"),
+                                     show="headings",
+                                     selectmode="extended",
+                                     height=8)
+        for column, width in (("Priority", 60), ("State", 80), ("Progress", 220),
+                              ("Node", 250), ("Hip File", 200)):
+            self.queue_tree.heading(column, text=column)
+            self.queue_tree.column(column, width=width, minwidth=50)
+        self.queue_tree.pack(fill=tk.BOTH, expand=True, pady=5)
+
+        queue_buttons = ttk.Frame(queue_frame)
+        queue_buttons.pack(fill=tk.X)
+
+        self.queue_pause_btn = ttk.Button(queue_buttons, text="Pause Queue",
+                                          command=self.toggle_queue_pause)
+        self.queue_pause_btn.pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="Raise", 
+                   command=lambda: self.shift_priority(1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="Lower", 
+                   command=lambda: self.shift_priority(-1)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="Hold/Release",
+                   command=self.toggle_hold).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="Remove",
+                   command=self.remove_jobs).pack(side=tk.LEFT, padx=5)
+        ttk.Button(queue_buttons, text="Clear Finished",
+                   command=self.clear_finished_jobs).pack(side=tk.LEFT, padx=5)
+
         log_frame = ttk.LabelFrame(self.right_frame, text="Render Log", padding="10")
         log_frame.pack(fill=tk.BOTH, expand=True)
 
@@ -169,24 +334,56 @@ class ModernHoudiniRenderUI:
 
         self.log_text.insert(tk.END, "Logs will appear here...\n")
 
-    def detect_houdini_version(self):
-        """Automatically detect the installed Houdini version."""
-        houdini_paths = glob.glob(r"C:\Program Files\Side Effects Software\Houdini*\bin\hcmd.exe")
-        if houdini_paths:
-            return max(houdini_paths)
-        return ""
-
     def add_log(self, message):
-        """Add message to log window and auto-scroll"""
-        self.log_text.insert(tk.END, message)
-        self.log_text.see(tk.END)
-        self.root.update_idletasks()
+        """Queue a message for the log window; safe to call from any thread"""
+        self.log_pipeline.put(message)
+
+    def run_in_ui(self, function, *args):
+        """Queue a call that touches Tk widgets; safe to call from any thread"""
+        self.ui_calls.put((function, args))
 
     def update_progress(self, value, message):
-        """Update progress bar and status message"""
-        self.progress_var.set(value)
-        self.status_label.config(text=message)
-        self.root.update_idletasks()
+        """Queue a progress bar and status update; the latest one wins"""
+        self.pending_progress = (value, message)
+
+    def flush_logs(self):
+        """Apply queued logs, widget updates and progress on the Tk main loop, then reschedule"""
+        while True:
+            try:
+                function, args = self.ui_calls.get_nowait()
+            except queue.Empty:
+                break
+            function(*args)
+
+        messages, skipped = self.log_pipeline.drain()
+        if skipped:
+            messages.insert(0, f"... {skipped} lines skipped, see {self.log_path}\n")
+        if messages:
+            at_bottom = self.log_text.yview()[1] >= 0.999
+            self.log_text.insert(tk.END, "".join(messages))
+            # Keep only the most recent lines in the widget
+            line_count = int(self.log_text.index("end-1c").split(".")[0])
+            if line_count > self.log_max_lines:
+                self.log_text.delete("1.0", f"{line_count - self.log_max_lines + 1}.0")
+            if at_bottom:
+                self.log_text.see(tk.END)
+
+        with self.dirty_lock:
+            dirty, self.dirty_jobs = self.dirty_jobs, set()
+        for job_id in dirty:
+            job = self.engine.queue.get(job_id)
+            if job:
+                self.refresh_queue_item(job)
+        if dirty:
+            self.update_queue_status()
+
+        progress, self.pending_progress = self.pending_progress, None
+        if progress:
+            value, message = progress
+            self.progress_var.set(value)
+            self.status_label.config(text=message)
+
+        self.root.after(self.log_interval, self.flush_logs)
 
     def browse_hip(self):
         """Open file dialog to select Houdini file"""
@@ -197,264 +394,175 @@ class ModernHoudiniRenderUI:
             self.hip_path.set(filename)
             self.add_log(f"File selected: {filename}\n")
 
-    def cleanup_temp_files(self):
-        temp_files = [self.nodes_file, os.path.join(self.temp_dir, "detect_nodes.py")]
-        for file in temp_files:
-            if os.path.exists(file):
-                os.remove(file)
-                self.add_log(f"Cleaned up: {file}\n")
-
-    def create_detection_script(self):
-        """Create a Python script that will run inside Houdini to detect specific nodes"""        
-        script_content = '''
-import hou
-import json
-import os
-
-def find_nodes_by_type(node_types):
-    """Find and return all nodes matching the specified types in the current Houdini session."""
-    matching_nodes = []
-    all_nodes = hou.node("/").allSubChildren()
-    for node in all_nodes:
-        if node.type().name() in node_types:
-            matching_nodes.append({
-                "type": node.type().name(),  # This is the node type
-                "path": node.path()
-            })
-    return matching_nodes
-
-# Node types to look for
-node_types = ["filecache::2.0", "usdrender_rop"]
-
-# Get the nodes
-nodes = find_nodes_by_type(node_types)
-
-# Save to temp file
-nodes_file = r"''' + self.nodes_file.replace('\\', '\\\\') + '''"
-with open(nodes_file, "w") as f:
-    json.dump(nodes, f)
-
-# Print results
-print(f"Found {len(nodes)} nodes")
-for node in nodes:
-    print(f"- {node['type']}: {node['path']}")
-'''
-        
-        script_path = os.path.join(self.temp_dir, "detect_nodes.py")
-        with open(script_path, "w") as f:
-            f.write(script_content)
-        return script_path
-
     def scan_nodes(self):
 
         if not self.hip_path.get():
             messagebox.showerror("Error", "Please provide a Hip file path")
             return
 
-        if not os.path.exists(self.hcmd_path):
-            messagebox.showerror("Error", "Houdini command line tool (hcmd.exe) not found")
-            return
+        hip_path = self.hip_path.get()
+        roots = self.scan_roots()
 
-        self.nodes_file = os.path.join(os.getenv("TEMP"), "detected_nodes.json")
-        self.temp_dir = os.getenv("TEMP")
+        if not self.force_rescan.get():
+            nodes = self.engine.cached_nodes(hip_path, roots)
+            if nodes is not None:
+                self.populate_nodes(hip_path, nodes)
+                self.add_log(f"Loaded {len(nodes)} nodes from scan cache (hip file unchanged).\n")
+                return
+
+        try:
+            self.engine.check_houdini()
+        except EngineError as e:
+            messagebox.showerror("Error", str(e))
+            return
 
         def run_scan():
             try:
-                self.update_progress(20, "Opening Houdini Command Line...")
+                self.update_progress(20, "Acquiring Houdini session...")
 
-                script_path = self.create_detection_script()
+                def log_output(line, is_error=False):
+                    prefix = "ERROR: " if is_error else ""
+                    self.add_log(f"{prefix}{line}")
 
-                process = subprocess.Popen(
-                    [self.hcmd_path],
-                    stdin=subprocess.PIPE,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True,
-                    creationflags=subprocess.CREATE_NO_WINDOW
-                )
+                nodes, _ = self.engine.scan(hip_path, force=True, roots=roots,
+                                            on_output=log_output)
+                self.update_progress(80, "Processing detected nodes...")
+                self.run_in_ui(self.populate_nodes, hip_path, nodes)
 
-                self.update_progress(40, "Initializing Houdini session...")
+            except Exception as e:
+                self.update_progress(0, f"Error: {str(e)}")
+                self.add_log(f"Exception occurred: {str(e)}\n")
+                self.run_in_ui(messagebox.showerror, "Error", f"An error occurred: {str(e)}")
 
-                # Send the hbatch command and wait
-                hbatch_cmd = f'hbatch -i -j 48 "{self.hip_path.get()}"\n'
-                process.stdin.write(hbatch_cmd)
-                process.stdin.flush()
-                time.sleep(3) 
+        threading.Thread(target=run_scan, daemon=True).start()
 
-                self.update_progress(60, "Running detection script...")
+    def scan_roots(self):
+        return DEFAULT_ROOTS if self.limit_scan_roots.get() else None
+
+    def populate_nodes(self, hip_path, nodes, clear=True):
+        """Fill the node tree with scan results of one hip file."""
+        if clear:
+            # Clear existing items
+            for item in self.nodes_tree.get_children():
+                self.nodes_tree.delete(item)
+            self.node_rows = {}
+
+        for node in nodes:
+            item = self.nodes_tree.insert("", "end", 
+                                        values=(node['type'], 
+                                               node['path'],
+                                               self.format_frame_range(node.get('frame_range')),
+                                               os.path.basename(hip_path)))
+            self.node_rows[item] = (hip_path, node)
+
+        if not clear:
+            return
+        if nodes:
+            self.update_progress(100, f"Found {len(nodes)} nodes!")
+        else:
+            self.update_progress(100, "No nodes found.")
+
+    def batch_scan(self):
+        """Scan every hip file in a folder using a few long-lived hbatch sessions."""
+        if self.batch_scanner:
+            if messagebox.askyesno("Batch Scan", "A batch scan is running. Cancel it?"):
+                self.batch_scanner.cancel()
+            return
 
-                detect_cmd = f'python "{script_path}"\n'
-                process.stdin.write(detect_cmd)
-                process.stdin.flush()
+        folder = filedialog.askdirectory(title="Select a folder of hip files")
+        if not folder:
+            return
 
-                self.update_progress(80, "Processing detected nodes...")
+        hip_files = find_hip_files(folder)
+        if not hip_files:
+            messagebox.showerror("Error", f"No hip files found in {folder}")
+            return
 
-                def monitor_output(pipe, is_error=False):
-                    while process and process.poll() is None:
-                        line = pipe.readline()
-                        if not line:
-                            break
-                        prefix = "ERROR: " if is_error else ""
-                        self.add_log(f"{prefix}{line}")
-                    if process:
-                        pipe.close()
-
-                log_thread = threading.Thread(target=monitor_output, 
-                                           args=(process.stdout,), 
-                                           daemon=True)
-                error_thread = threading.Thread(target=monitor_output, 
-                                             args=(process.stderr, True), 
-                                             daemon=True)
-                
-                log_thread.start()
-                error_thread.start()
-
-                # Wait for the JSON file
-                max_attempts = 10
-                attempts = 0
-                nodes_processed = False
-                
-                while attempts < max_attempts:
-                    if os.path.exists(self.nodes_file):
-                        try:
-                            with open(self.nodes_file, "r") as f:
-                                nodes = json.load(f)
-                                
-                                # Clear existing items
-                                for item in self.nodes_tree.get_children():
-                                    self.nodes_tree.delete(item)
-                                
-                                for node in nodes:
-                                    self.nodes_tree.insert("", "end", 
-                                                         values=(node['type'], 
-                                                                node['path']))
-
-                                if nodes:
-                                    self.update_progress(100, f"Found {len(nodes)} nodes!")
-                                else:
-                                    self.update_progress(100, "No nodes found.")
-                                nodes_processed = True
-                                break
-                        except json.JSONDecodeError:
-                            self.add_log("Waiting for complete node data...\n")
-                        except Exception as e:
-                            self.add_log(f"Error reading nodes file: {str(e)}\n")
-                    
-                    attempts += 1
-                    time.sleep(1)
-                
-                if not nodes_processed:
-                    self.update_progress(100, "No nodes detected or detection timed out.")
-
-                process.terminate()
-                time.sleep(2)
-                
-                try:
-                    self.cleanup_temp_files()
-                    self.add_log("Temporary files cleaned up successfully.\n")
-                except Exception as e:
-                    self.add_log(f"Warning: Could not clean up temporary files: {str(e)}\n")
+        for item in self.nodes_tree.get_children():
+            self.nodes_tree.delete(item)
+        self.node_rows = {}
+        scanned = []
+
+        def on_result(result):
+            scanned.append(result)
+            if result["error"]:
+                self.add_log(f"Scan failed for {result['hip']}: {result['error']}\n")
+            else:
+                source = "cache" if result["cached"] else f"{result['seconds']:.1f}s"
+                self.add_log(f"{result['hip']}: {len(result['nodes'])} nodes ({source})\n")
+                self.run_in_ui(self.populate_nodes, result["hip"], result["nodes"], False)
+            self.update_progress(100 * len(scanned) / len(hip_files),
+                                 f"Scanned {len(scanned)} of {len(hip_files)} hip files...")
 
+        def run_batch_scan():
+            try:
+                self.add_log(f"Batch scanning {len(hip_files)} hip files in {folder}...\n")
+                results = self.batch_scanner.run(hip_files)
+                stamp = time.strftime("%Y%m%d_%H%M%S")
+                for extension in ("json", "csv"):
+                    report = write_report(results, state_path(f"batch_scan_{stamp}.{extension}"))
+                    self.add_log(f"Report written to {report}\n")
+                nodes = sum(len(result["nodes"]) for result in results)
+                failed = sum(1 for result in results if result["error"])
+                self.update_progress(100, f"Found {nodes} nodes in {len(results)} hip files"
+                                          f" ({failed} failed).")
             except Exception as e:
                 self.update_progress(0, f"Error: {str(e)}")
                 self.add_log(f"Exception occurred: {str(e)}\n")
-                messagebox.showerror("Error", f"An error occurred: {str(e)}")
+            finally:
+                self.batch_scanner = None
 
-        threading.Thread(target=run_scan, daemon=True).start()
+        self.batch_scanner = self.engine.batch_scanner(workers=self.max_parallel.get(),
+                                                       force=self.force_rescan.get(),
+                                                       on_result=on_result,
+                                                       roots=self.scan_roots())
+        threading.Thread(target=run_batch_scan, daemon=True).start()
 
     def start_render(self):
+        """Add every selected node to the render queue."""
         selected_items = self.nodes_tree.selection()
         if not selected_items:
             messagebox.showerror("Error", "Please select a node to render")
             return
 
-        if not self.hip_path.get():
-            messagebox.showerror("Error", "Please provide a Hip file path")
-            return
-
-        if not os.path.exists(self.hcmd_path):
-            messagebox.showerror("Error", "Houdini command line tool (hcmd.exe) not found")
+        try:
+            self.engine.check_houdini()
+        except EngineError as e:
+            messagebox.showerror("Error", str(e))
             return
 
         try:
-            item = selected_items[0]
-            node_type, node_path = self.nodes_tree.item(item, "values")
-            self.add_log(f"Selected node type: {node_type} at path: {node_path}\n")
-
-            if node_type not in self.supported_nodes:
-                error_msg = (
-                    f"Node type '{node_type}' is not supported.\n"
-                    f"Supported types are:\n"
-                    f"• filecache::2.0\n"
-                    f"• usdrender_rop"
-                )
-                self.add_log(f"Error: {error_msg}\n")
-                messagebox.showerror("Unsupported Node Type", error_msg)
-                return
-
-            def render_process():
+            # Jobs of one hip file are made together so they can wait for each other
+            selected = {}
+            for item in selected_items:
+                hip_path, scanned = self.node_rows[item]
+                self.add_log(f"Selected node type: {scanned['type']} at path: {scanned['path']}\n")
+                selected.setdefault(hip_path, []).append(scanned)
+
+            for hip_path, nodes in selected.items():
                 try:
-                    self.update_progress(20, "Starting Houdini Command Line...")
-                    self.add_log("Starting render process...\n")
-
-                    self.render_process = subprocess.Popen(
-                        [self.hcmd_path],
-                        stdin=subprocess.PIPE,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        creationflags=subprocess.CREATE_NO_WINDOW
-                    )
-
-                    self.update_progress(40, "Initializing Houdini session...")
-                    hbatch_cmd = f'hbatch -i -j 48 "{self.hip_path.get()}"\n'
-                    self.add_log(f"Sending hbatch command: {hbatch_cmd}\n")
-                    self.render_process.stdin.write(hbatch_cmd)
-                    self.render_process.stdin.flush()
-                    time.sleep(3)
-
-                    self.update_progress(60, f"Starting render for {node_type} node...")
-
-                    render_cmd = self.supported_nodes[node_type](node_path) + '\n'
-                    self.add_log(f"Executing render command: {render_cmd}\n")
-                    self.render_process.stdin.write(render_cmd)
-                    self.render_process.stdin.flush()
-
-                    self.update_progress(80, "Monitoring render progress...")
-
-                    def monitor_output(pipe, is_error=False):
-                        while self.render_process and self.render_process.poll() is None:
-                            line = pipe.readline()
-                            if not line:
-                                break
-                            prefix = "ERROR: " if is_error else ""
-                            self.add_log(f"{prefix}{line}")
-                        if self.render_process:
-                            pipe.close()
-
-                    log_thread = threading.Thread(target=monitor_output, 
-                                               args=(self.render_process.stdout,), 
-                                               daemon=True)
-                    error_thread = threading.Thread(target=monitor_output, 
-                                                 args=(self.render_process.stderr, True), 
-                                                 daemon=True)
-                    
-                    log_thread.start()
-                    error_thread.start()
-
-                    self.update_progress(100, "Render process started successfully!")
-
-                except Exception as e:
-                    self.update_progress(0, f"Error: {str(e)}")
-                    self.add_log(f"Exception occurred: {str(e)}\n")
-                    messagebox.showerror("Error", f"An error occurred during rendering: {str(e)}")
-                    if self.render_process:
-                        self.render_process.terminate()
-                        self.render_process = None
-
-            threading.Thread(target=render_process, daemon=True).start()
-
-        except ValueError as e:
+                    jobs = self.engine.make_jobs(hip_path, nodes,
+                                                 include_inputs=self.queue_inputs.get(),
+                                                 pipeline=self.pipeline_chunks.get(),
+                                                 priority=self.job_priority.get(),
+                                                 chunk_size=self.chunk_size.get(),
+                                                 chunk_workers=self.chunk_workers.get(),
+                                                 resume=self.resume_frames.get(),
+                                                 houdini=self.houdini_build.get())
+                except EngineError as e:
+                    self.add_log(f"Error: {e}\n")
+                    messagebox.showerror("Cannot Queue Node", str(e))
+                    continue
+                for job in jobs:
+                    self.engine.queue.add(job)
+                    self.refresh_queue_item(job)
+                    after = f" after {len(job.depends_on)} inputs" if job.depends_on else ""
+                    self.add_log(f"Queued {job.name}{after}: {job.command}\n")
+
+            self.engine.scheduler.wake()
+            self.update_queue_status()
+
+        except (KeyError, ValueError) as e:
             error_msg = f"Invalid node selection format: {str(e)}"
             self.add_log(f"Error: {error_msg}\n")
             messagebox.showerror("Error", error_msg)
@@ -463,58 +571,162 @@ for node in nodes:
             self.add_log(f"Error: {error_msg}\n")
             messagebox.showerror("Error", error_msg)
 
-    import subprocess
-
-    def cancel_render(self):
-        """Cancel the current render process and also terminate the Husk and karma_cc processes if running."""
-        if self.render_process and self.render_process.poll() is None:
-            self.render_process.terminate()
-            self.render_process = None
-            self.update_progress(0, "Render cancelled.")
-            self.add_log("Render process terminated.\n")
-
+    def on_job_output(self, job, line, is_error=False):
+        prefix = "ERROR: " if is_error else ""
+        self.add_log(f"[{job.node_path}] {prefix}{line}")
+
+    def on_job_update(self, job):
+        """Called by the scheduler whenever a job changes state."""
+        if job.state == RUNNING:
+            self.add_log(f"Started {job.name} with -j {job.threads or self.engine.scheduler.threads_per_job()}\n")
+        elif job.error:
+            failure = f" ({job.failure})" if job.failure else ""
+            self.add_log(f"{job.name} {job.state}{failure}: {job.error}\n")
+        else:
+            self.add_log(f"{job.name} {job.state}.\n")
+        with self.dirty_lock:
+            self.dirty_jobs.add(job.id)
+        self.update_queue_status()
+
+    def on_job_progress(self, job, tracker):
+        """Called by the scheduler when a job's frame progress changes."""
+        text = tracker.summary()
+        telemetry = self.engine.scheduler.telemetry.get(job.id)
+        if telemetry and telemetry.samples:
+            text += f" RSS {format_bytes(telemetry.rss)}"
+        self.job_progress_text[job.id] = text
+        with self.dirty_lock:
+            self.dirty_jobs.add(job.id)
+
+    def on_chunk_update(self, job, chunk):
+        attempt = f" (attempt {chunk.attempts})" if chunk.attempts > 1 else ""
+        error = f": {chunk.error}" if chunk.error else ""
+        self.add_log(f"[{job.node_path}] chunk {chunk.index + 1} frames {chunk.label} "
+                     f"{chunk.state}{attempt}{error}\n")
+
+    @staticmethod
+    def format_frame_range(frame_range):
+        if not frame_range:
+            return ""
+        start, end, step = frame_range
+        text = f"{start:g}-{end:g}"
+        return text if step == 1 else f"{text} x{step:g}"
+
+    def refresh_queue_item(self, job):
+        values = (job.priority, job.state, self.job_progress_text.get(job.id, ""),
+                  job.node_path, os.path.basename(job.hip_path))
+        if self.queue_tree.exists(job.id):
+            self.queue_tree.item(job.id, values=values)
+        else:
+            self.queue_tree.insert("", "end", iid=job.id, values=values)
+
+    def update_queue_status(self):
+        jobs = self.engine.queue.snapshot()
+        if not jobs:
+            self.update_progress(0, "Ready to render")
+            return
+        finished = sum(1 for job in jobs if job.state in FINISHED_STATES)
+        running = sum(1 for job in jobs if job.state == RUNNING)
+        paused = " (paused)" if self.engine.scheduler.paused else ""
+        # Running jobs contribute the fraction of their frames already done
+        partial = sum((tracker.percent or 0) / 100
+                      for tracker in list(self.engine.scheduler.progress.values()))
+        self.update_progress(100 * min(len(jobs), finished + partial) / len(jobs),
+                             f"{running} running, {len(jobs) - finished - running} waiting, "
+                             f"{finished} finished{paused}")
+
+    def selected_jobs(self):
+        jobs = [self.engine.queue.get(item) for item in self.queue_tree.selection()]
+        return [job for job in jobs if job]
+
+    def apply_queue_limits(self):
         try:
-            husk_process = subprocess.Popen(
-                'tasklist /FI "IMAGENAME eq husk.exe" /NH', 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            output, error = husk_process.communicate()
-            
-            if "husk.exe" in output:
-                subprocess.run('taskkill /F /IM husk.exe', check=True)
-                self.add_log("Husk process terminated.\n")
-            else:
-                self.add_log("No Husk process found.\n")
-            
-            karma_process = subprocess.Popen(
-                'tasklist /FI "IMAGENAME eq karma_cc.exe" /NH', 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE, 
-                text=True
-            )
-            output, error = karma_process.communicate()
-            
-            if "karma_cc.exe" in output:
-                subprocess.run('taskkill /F /IM karma_cc.exe', check=True)
-                self.add_log("Karma_CC process terminated.\n")
+            max_parallel = max(1, self.max_parallel.get())
+            ram_ceiling = self.ram_ceiling.get()
+            min_free_gb = self.min_free_gb.get()
+            writers_per_volume = self.writers_per_volume.get()
+        except tk.TclError:
+            return
+        self.engine.set_limits(max_parallel, ram_ceiling, min_free_gb, writers_per_volume)
+
+    def toggle_queue_pause(self):
+        if self.engine.scheduler.paused:
+            self.engine.scheduler.resume()
+            self.queue_pause_btn.config(text="Pause Queue")
+        else:
+            self.engine.scheduler.pause()
+            self.queue_pause_btn.config(text="Resume Queue")
+        self.update_queue_status()
+
+    def shift_priority(self, delta):
+        for job in self.selected_jobs():
+            self.engine.queue.set_priority(job, job.priority + delta)
+            self.refresh_queue_item(job)
+        self.engine.scheduler.wake()
+
+    def toggle_hold(self):
+        for job in self.selected_jobs():
+            if job.state == RUNNING or job.state in FINISHED_STATES:
+                continue
+            if job.state == "held":
+                self.engine.scheduler.release(job)
             else:
-                self.add_log("No Karma_CC process found.\n")
-
-        except Exception as e:
-            self.add_log(f"Error while terminating processes: {str(e)}\n")
-
+                self.engine.scheduler.hold(job)
+
+    def remove_jobs(self):
+        for job in self.selected_jobs():
+            if job.state == RUNNING:
+                self.add_log(f"Cancel {job.name} before removing it.\n")
+                continue
+            self.engine.queue.remove(job.id)
+            self.queue_tree.delete(job.id)
+        self.update_queue_status()
+
+    def clear_finished_jobs(self):
+        for job in self.engine.queue.snapshot():
+            if job.state in FINISHED_STATES:
+                self.queue_tree.delete(job.id)
+        self.engine.queue.clear_finished()
+        self.update_queue_status()
 
+    def cancel_render(self):
+        """Cancel the selected jobs (or every running job), stopping only their own process trees."""
+        jobs = self.selected_jobs()
+        if not jobs:
+            jobs = [job for job in self.engine.queue.snapshot() if job.state == RUNNING]
+        for job in jobs:
+            if job.state in FINISHED_STATES:
+                continue
+            self.engine.cancel(job)
+            self.add_log(f"Cancelled {job.name}.\n")
 
     def on_closing(self):
-        if self.render_process and self.render_process.poll() is None:
-            self.cancel_render()
+        # Running jobs stay marked as running so they are re-queued next time
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.engine.shutdown()
+        self.log_pipeline.close()
         self.root.destroy()
 
 def main():
+    parser = argparse.ArgumentParser(description="Houdini command line cache/renderer")
+    parser.add_argument("--coordinator", nargs="?", const=f"{DEFAULT_HOST}:{DEFAULT_PORT}",
+                        metavar="HOST:PORT",
+                        help="hand queued renders to workers connecting on this address "
+                             f"(default {DEFAULT_HOST}; other addresses need ${TOKEN_ENV})")
+    parser.add_argument("--scan-cache-hash", action="store_true",
+                        help="reuse cached scans of hip files that were saved or copied "
+                             "without changes, by comparing their content hash")
+    args = parser.parse_args()
+    address = None
+    if args.coordinator:
+        host, _, port = args.coordinator.rpartition(":")
+        address = (host or DEFAULT_HOST, int(port))
+        if address[0] not in LOCAL_HOSTS and not default_token():
+            parser.error(f"listening on {address[0]} needs a shared token in ${TOKEN_ENV}")
     root = ThemedTk(theme="equilux")
-    app = ModernHoudiniRenderUI(root)
+    app = ModernHoudiniRenderUI(root, address, args.scan_cache_hash)
     root.protocol("WM_DELETE_WINDOW", app.on_closing)
     root.mainloop()
 
@@ -0,0 +1,7 @@
+"""Benchmarks of the scan/render engine against the stub hbatch in tools/.
+
+``python -m benchmarks run`` measures scan latency, time to first frame,
+job throughput at several concurrency levels, log throughput and cancel
+latency, and writes the results as JSON. ``python -m benchmarks compare``
+diffs two result files, e.g. from two commits.
+"""
@@ -0,0 +1,112 @@
+"""``python -m benchmarks run|compare|list``, from the repository root."""
+import argparse
+import inspect
+import os
+import shutil
+import sys
+import tempfile
+
+from .results import (compare, format_comparison, format_results, load_results, merge_runs,
+                      save_results)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def cmd_run(args):
+    work_dir = tempfile.mkdtemp(prefix="houdini_render_bench_")
+    # Keep scan caches, metrics and logs of the runs out of the real state directory;
+    # the engine reads this when it is first imported
+    os.environ["HOUDINI_RENDER_HOME"] = os.path.join(work_dir, "state")
+    from .suite import BENCHMARKS, BenchmarkError
+
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        print(f"Unknown benchmarks: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    overrides = {"load_delay": args.load_delay, "frame_time": args.frame_time}
+    settings = {"quick": args.quick, "repeat": args.repeat, "benchmarks": {}}
+    results = []
+    try:
+        for name in names:
+            function, quick = BENCHMARKS[name]
+            accepted = inspect.signature(function).parameters
+            kwargs = dict(quick) if args.quick else {}
+            kwargs.update({key: value for key, value in overrides.items()
+                           if value is not None and key in accepted})
+            settings["benchmarks"][name] = {key: list(value) if isinstance(value, tuple) else value
+                                            for key, value in kwargs.items()}
+            print(f"Running {name}...", flush=True)
+            runs = []
+            for repeat in range(args.repeat):
+                run_dir = os.path.join(work_dir, f"{name}_{repeat}")
+                os.makedirs(run_dir)
+                try:
+                    runs.append(function(run_dir, **kwargs))
+                except BenchmarkError as e:
+                    print(f"{name} failed: {e}", file=sys.stderr)
+                    return 1
+            merged = merge_runs(runs)
+            print(format_results(merged), flush=True)
+            results.extend(merged)
+    finally:
+        if args.keep:
+            print(f"Work files kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Results written to {save_results(args.output, results, settings, REPO_DIR)}")
+    return 0
+
+
+def cmd_compare(args):
+    rows = compare(load_results(args.old), load_results(args.new), args.threshold)
+    print(format_comparison(rows))
+    regressed = [row for row in rows if row[5]]
+    if regressed:
+        print(f"{len(regressed)} measurements regressed by more than {args.threshold:g}%")
+        return 1
+    return 0
+
+
+def cmd_list(args):
+    from .suite import BENCHMARKS
+    for name, (function, _) in BENCHMARKS.items():
+        print(f"{name:<12} {inspect.getdoc(function).splitlines()[0]}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="benchmarks",
+                                     description="Benchmark the render engine against the "
+                                                 "stub hbatch.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run benchmarks and write a JSON result file")
+    run.add_argument("--only", help="comma separated benchmarks to run (default: all)")
+    run.add_argument("--quick", action="store_true", help="smaller scenes and fewer levels")
+    run.add_argument("--repeat", type=int, default=1,
+                     help="runs per benchmark; the median is recorded")
+    run.add_argument("--load-delay", type=float, help="stub hip load time in seconds")
+    run.add_argument("--frame-time", type=float, help="stub seconds per frame")
+    run.add_argument("--output", default="benchmark_results.json")
+    run.add_argument("--keep", action="store_true", help="keep the generated scenes and caches")
+    run.set_defaults(func=cmd_run)
+
+    compare_parser = commands.add_parser("compare", help="compare two result files")
+    compare_parser.add_argument("old")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=10.0,
+                                help="percent change that counts as a regression (default 10)")
+    compare_parser.set_defaults(func=cmd_compare)
+
+    list_parser = commands.add_parser("list", help="list the benchmarks")
+    list_parser.set_defaults(func=cmd_list)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+sys.exit(main())
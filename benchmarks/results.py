@@ -0,0 +1,120 @@
+"""Save benchmark results as JSON and compare two result files."""
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+FORMAT_VERSION = 1
+
+# Differences below these are timer noise and never count as a regression
+NOISE_FLOOR = {"s": 0.005}
+
+
+def result_key(entry):
+    """``name[param=value,...]``, which identifies a measurement across runs."""
+    params = ",".join(f"{key}={value}" for key, value in sorted(entry["params"].items()))
+    return f"{entry['name']}[{params}]" if params else entry["name"]
+
+
+def git_commit(repo_dir):
+    """(commit, dirty) of the checkout at ``repo_dir``, or (None, None) outside git."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                                cwd=repo_dir, capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+
+def merge_runs(runs):
+    """Combine repeated runs into one entry per measurement holding the median and the samples."""
+    merged = {}
+    for run in runs:
+        for entry in run:
+            key = result_key(entry)
+            if key not in merged:
+                merged[key] = dict(entry, samples=[])
+            merged[key]["samples"].append(entry["value"])
+    for entry in merged.values():
+        entry["value"] = statistics.median(entry["samples"])
+    return list(merged.values())
+
+
+def save_results(path, results, settings, repo_dir):
+    commit, dirty = git_commit(repo_dir)
+    data = {
+        "version": FORMAT_VERSION,
+        "created": time.time(),
+        "commit": commit,
+        "dirty": dirty,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "settings": settings,
+        "results": results,
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_results(path):
+    with open(path, "r") as f:
+        data = json.load(f)
+    if data.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} has unknown result format {data.get('version')}")
+    return data
+
+
+def compare(old, new, threshold=10.0):
+    """Rows of (key, unit, old value, new value, change %, regressed) for the shared measurements.
+
+    A measurement regressed if it got worse, in its ``better`` direction,
+    by more than ``threshold`` percent and by more than its unit's noise floor.
+    """
+    old_results = {result_key(entry): entry for entry in old["results"]}
+    rows = []
+    for entry in new["results"]:
+        key = result_key(entry)
+        before = old_results.get(key)
+        if before is None:
+            continue
+        change = None
+        if before["value"]:
+            change = (entry["value"] - before["value"]) / abs(before["value"]) * 100
+        worse = change if entry["better"] == "lower" else -change if change is not None else None
+        noise = NOISE_FLOOR.get(entry["unit"], 0)
+        regressed = (worse is not None and worse > threshold
+                     and abs(entry["value"] - before["value"]) > noise)
+        rows.append((key, entry["unit"], before["value"], entry["value"], change, regressed))
+    return rows
+
+
+def format_value(value):
+    if isinstance(value, float):
+        return f"{value:.4g}"
+    return str(value)
+
+
+def format_results(results):
+    lines = []
+    for entry in results:
+        lines.append(f"{result_key(entry):<58} {format_value(entry['value']):>10} {entry['unit']}")
+    return "\n".join(lines)
+
+
+def format_comparison(rows):
+    lines = [f"{'measurement':<58} {'old':>10} {'new':>10} {'change':>8}"]
+    for key, unit, before, after, change, regressed in rows:
+        change = f"{change:+.1f}%" if change is not None else "-"
+        flag = "  REGRESSED" if regressed else ""
+        lines.append(f"{key:<58} {format_value(before):>10} {format_value(after):>10} "
+                     f"{change:>8} {unit}{flag}")
+    return "\n".join(lines)
@@ -0,0 +1,35 @@
+"""Stub hip files of any size for the benchmarks."""
+import json
+import os
+
+
+def make_scene(path, caches=1, frames=24, extra_nodes=0):
+    """Write a stub scene with ``caches`` filecache ROPs and ``extra_nodes`` other SOPs.
+
+    Each cache sits in its own geo object, at the end of a chain of its
+    share of the extra nodes, so the scan has a network to walk. Returns
+    the paths of the caches.
+    """
+    nodes = []
+    cache_paths = []
+    for index in range(1, caches + 1):
+        geo = f"/obj/geo{index}"
+        chain = extra_nodes // caches + (1 if index <= extra_nodes % caches else 0)
+        previous = None
+        for link in range(1, chain + 1):
+            node = {"type": "xform", "path": f"{geo}/xform{link}", "parms": {"tx": link}}
+            if previous:
+                node["inputs"] = [previous]
+            nodes.append(node)
+            previous = node["path"]
+        cache = {"type": "filecache::2.0", "path": f"{geo}/filecache1",
+                 "parms": {"trange": 1, "f1": 1, "f2": frames, "f3": 1,
+                           "sopoutput": f"$HIP/cache/geo{index}.$F4.bgeo.sc"}}
+        if previous:
+            cache["inputs"] = [previous]
+        nodes.append(cache)
+        cache_paths.append(cache["path"])
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"frame": 1, "nodes": nodes}, f)
+    return cache_paths
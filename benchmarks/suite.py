@@ -0,0 +1,253 @@
+"""The benchmarks. Each one returns a list of result dicts (see ``result``).
+
+They drive a RenderEngine whose sessions are tools/stub_hbatch.py, with
+the stub's delays set through its STUB_HBATCH_* environment knobs, so
+timings measure the engine rather than Houdini.
+"""
+import os
+import statistics
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from houdini_render.core import RenderEngine
+from houdini_render.jobs import CANCELLED, DONE
+from houdini_render.logpipe import LogPipeline
+from houdini_render.proctree import pid_alive
+
+from .scenes import make_scene
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    "tools", "stub_hbatch.py")
+FRAME_LINE = "Rendering frame"
+# Longest any single wait in a benchmark may take before it counts as hung
+WAIT_TIMEOUT = 300
+
+
+class BenchmarkError(Exception):
+    """Raised when a benchmark run went wrong, so its numbers are not recorded."""
+
+
+def result(name, value, unit, better="lower", **params):
+    """One measurement; ``better`` says whether "lower" or "higher" values are an improvement."""
+    return {"name": name, "params": params, "value": value, "unit": unit, "better": better}
+
+
+@contextmanager
+def stub_knobs(**knobs):
+    """Set STUB_HBATCH_<NAME> variables for the stub sessions started inside the block."""
+    saved = {}
+    for name, value in knobs.items():
+        key = "STUB_HBATCH_" + name.upper()
+        saved[key] = os.environ.get(key)
+        os.environ[key] = str(value)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def make_engine(max_parallel=2, **callbacks):
+    return RenderEngine(launcher=[sys.executable, STUB], max_parallel=max_parallel,
+                        persist_queue=False, **callbacks)
+
+
+def scanned_nodes(hip_path):
+    """Scan ``hip_path`` once so later engines find its nodes in the scan cache."""
+    engine = make_engine()
+    try:
+        nodes, _ = engine.scan(hip_path)
+    finally:
+        engine.shutdown()
+    return nodes
+
+
+def wait_for(condition, timeout=WAIT_TIMEOUT, interval=0.002):
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        if time.perf_counter() > deadline:
+            raise BenchmarkError(f"Timed out after {timeout}s")
+        time.sleep(interval)
+
+
+def run_jobs(engine, jobs):
+    for job in jobs:
+        engine.enqueue(job)
+    engine.wait(jobs, poll_interval=0.01)
+    failed = [job for job in jobs if job.state != DONE]
+    if failed:
+        raise BenchmarkError(f"{failed[0].name} {failed[0].state}: {failed[0].error}")
+
+
+def bench_scan(work_dir, node_counts=(100, 1000, 5000), load_delay=0.5):
+    """Scan latency of a cold session, a warm session and the scan cache."""
+    results = []
+    for count in node_counts:
+        hip_path = os.path.join(work_dir, f"scan_{count}.hip")
+        make_scene(hip_path, caches=max(1, count // 50), extra_nodes=count)
+        with stub_knobs(load_delay=load_delay):
+            engine = make_engine()
+            try:
+                timings = {}
+                for label, force in (("cold", True), ("warm", True), ("cached", False)):
+                    started = time.perf_counter()
+                    engine.scan(hip_path, force=force)
+                    timings[label] = time.perf_counter() - started
+            finally:
+                engine.shutdown()
+        for label, seconds in timings.items():
+            results.append(result(f"scan.{label}", seconds, "s", nodes=count))
+    return results
+
+
+def bench_first_frame(work_dir, load_delay=0.5, frame_time=0.05):
+    """Seconds from queueing a job to its first rendered frame, cold and with a warm session."""
+    hip_path = os.path.join(work_dir, "first_frame.hip")
+    make_scene(hip_path, caches=1, frames=10)
+    node = scanned_nodes(hip_path)[0]
+    first_frame = threading.Event()
+
+    def on_output(job, line, is_error=False):
+        if FRAME_LINE in line:
+            first_frame.set()
+
+    results = []
+    with stub_knobs(load_delay=load_delay, frame_time=frame_time):
+        engine = make_engine(on_output=on_output)
+        engine.start()
+        try:
+            for label in ("cold", "warm"):
+                first_frame.clear()
+                job = engine.make_job(hip_path, node)
+                started = time.perf_counter()
+                engine.enqueue(job)
+                if not first_frame.wait(WAIT_TIMEOUT):
+                    raise BenchmarkError(f"No frame rendered after {WAIT_TIMEOUT}s")
+                results.append(result(f"first_frame.{label}", time.perf_counter() - started, "s",
+                                      load_delay=load_delay))
+                run_jobs(engine, [job])
+        finally:
+            engine.shutdown()
+    return results
+
+
+def bench_throughput(work_dir, levels=(1, 2, 4, 8), jobs=16, frames=10, frame_time=0.02,
+                     load_delay=0.5):
+    """Jobs per minute and frames per second for a queue of ``jobs`` jobs at each concurrency."""
+    hip_path = os.path.join(work_dir, "throughput.hip")
+    make_scene(hip_path, caches=jobs, frames=frames)
+    nodes = scanned_nodes(hip_path)
+    results = []
+    with stub_knobs(load_delay=load_delay, frame_time=frame_time):
+        for parallel in levels:
+            engine = make_engine(max_parallel=parallel)
+            engine.start()
+            try:
+                queued = [engine.make_job(hip_path, node) for node in nodes]
+                started = time.perf_counter()
+                run_jobs(engine, queued)
+                elapsed = time.perf_counter() - started
+            finally:
+                engine.shutdown()
+            results.append(result("throughput.jobs_per_minute", len(queued) * 60 / elapsed,
+                                  "jobs/min", "higher", parallel=parallel, jobs=jobs))
+            results.append(result("throughput.frames_per_second", len(queued) * frames / elapsed,
+                                  "frames/s", "higher", parallel=parallel, jobs=jobs))
+    return results
+
+
+def bench_log(work_dir, lines_per_frame=200, frames=50, frame_time=0.01, interval=0.1):
+    """Render output through the UI's LogPipeline, drained every ``interval`` like the Tk window."""
+    hip_path = os.path.join(work_dir, "log.hip")
+    make_scene(hip_path, caches=1, frames=frames)
+    node = scanned_nodes(hip_path)[0]
+    pipeline = LogPipeline(os.path.join(work_dir, "render.log"))
+    counts = {"lines": 0, "shown": 0, "skipped": 0, "peak": 0}
+    stopped = threading.Event()
+
+    def on_output(job, line, is_error=False):
+        counts["lines"] += 1
+        pipeline.put(f"[{job.node_path}] {line}")
+
+    def drain():
+        messages, skipped = pipeline.drain()
+        counts["shown"] += len(messages)
+        counts["skipped"] += skipped
+        counts["peak"] = max(counts["peak"], len(messages) + skipped)
+
+    def drain_loop():
+        while not stopped.wait(interval):
+            drain()
+
+    drainer = threading.Thread(target=drain_loop, daemon=True)
+    drainer.start()
+    with stub_knobs(log_lines=lines_per_frame, frame_time=frame_time, load_delay=0):
+        engine = make_engine(on_output=on_output)
+        engine.start()
+        try:
+            job = engine.make_job(hip_path, node)
+            started = time.perf_counter()
+            run_jobs(engine, [job])
+            elapsed = time.perf_counter() - started
+        finally:
+            engine.shutdown()
+            stopped.set()
+            drainer.join()
+            drain()
+            pipeline.close()
+    params = {"lines_per_frame": lines_per_frame, "frames": frames}
+    return [result("log.lines_per_second", counts["lines"] / elapsed, "lines/s", "higher",
+                   **params),
+            result("log.skipped_lines", counts["skipped"], "lines", **params),
+            result("log.peak_batch", counts["peak"], "lines", **params)]
+
+
+def bench_cancel(work_dir, repeats=3, frame_time=0.05):
+    """Seconds from cancelling a rendering job to it being cancelled and its processes gone."""
+    hip_path = os.path.join(work_dir, "cancel.hip")
+    make_scene(hip_path, caches=1, frames=100000)
+    node = scanned_nodes(hip_path)[0]
+    first_frame = threading.Event()
+
+    def on_output(job, line, is_error=False):
+        if FRAME_LINE in line:
+            first_frame.set()
+
+    state_times = []
+    exit_times = []
+    with stub_knobs(frame_time=frame_time, load_delay=0):
+        engine = make_engine(on_output=on_output)
+        engine.start()
+        try:
+            for _ in range(repeats):
+                first_frame.clear()
+                job = engine.enqueue(engine.make_job(hip_path, node))
+                if not first_frame.wait(WAIT_TIMEOUT):
+                    raise BenchmarkError(f"No frame rendered after {WAIT_TIMEOUT}s")
+                session = engine.scheduler.running[job.id]["session"]
+                pids = session.group.members()
+                started = time.perf_counter()
+                engine.cancel(job)
+                wait_for(lambda: job.state == CANCELLED)
+                state_times.append(time.perf_counter() - started)
+                wait_for(lambda: not any(pid_alive(pid) for pid in pids))
+                exit_times.append(time.perf_counter() - started)
+        finally:
+            engine.shutdown()
+    return [result("cancel.state", statistics.median(state_times), "s"),
+            result("cancel.process_exit", statistics.median(exit_times), "s")]
+
+
+# Name -> (function, settings for --quick)
+BENCHMARKS = {
+    "scan": (bench_scan, {"node_counts": (100, 1000)}),
+    "first_frame": (bench_first_frame, {}),
+    "throughput": (bench_throughput, {"levels": (1, 4), "jobs": 8}),
+    "log": (bench_log, {"frames": 20}),
+    "cancel": (bench_cancel, {"repeats": 1}),
+}
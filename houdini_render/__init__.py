@@ -0,0 +1,3 @@
+"""Engine pieces shared by the Houdini Command Line Cache/Renderer."""
+from .session import HbatchSession, SessionError, SessionPool
+from .core import EngineError, RenderEngine
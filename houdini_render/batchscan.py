@@ -0,0 +1,190 @@
+"""Scan many hip files using a few long-lived hbatch sessions."""
+import csv
+import glob
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+
+from .detection import (DEFAULT_ROOTS, create_detection_script, detector_signature,
+                        parse_scan_output)
+from .session import HBATCH_THREADS, HbatchSession, SessionError
+
+HIP_EXTENSIONS = (".hip", ".hipnc", ".hiplc")
+
+# Loads the next hip file into the running session, then runs the detection script
+LOAD_AND_DETECT = '''
+import hou
+hou.hipFile.load({hip_path!r}, suppress_save_prompt=True, ignore_load_warnings=True)
+with open({script_path!r}, "r") as f:
+    exec(f.read())
+'''
+
+
+def find_hip_files(target):
+    """Return the hip files in a directory (recursively) or matching a glob."""
+    if os.path.isdir(target):
+        found = []
+        for folder, _, files in os.walk(target):
+            found.extend(os.path.join(folder, name) for name in files
+                         if name.lower().endswith(HIP_EXTENSIONS))
+        return sorted(found)
+    return sorted(path for path in glob.glob(target, recursive=True)
+                  if path.lower().endswith(HIP_EXTENSIONS))
+
+
+class BatchScanner:
+    """Scans hip files on ``workers`` sessions, loading each file with hou.hipFile.load.
+
+    Each worker starts hbatch on the first file it takes and then loads the
+    following ones into the same process, so Houdini only starts once per
+    worker. Results already in ``cache`` are reused unless ``force`` is set.
+    ``on_result`` is called with each result dict as soon as it is ready.
+    """
+
+    def __init__(self, launcher, temp_dir, workers=2, threads=HBATCH_THREADS,
+                 load_timeout=None, scan_timeout=300, cache=None, force=False,
+                 on_result=None, on_output=None, roots=DEFAULT_ROOTS, env=None):
+        self.launcher = list(launcher)
+        self.env = env
+        self.temp_dir = temp_dir
+        self.workers = max(1, workers)
+        self.threads = threads
+        self.load_timeout = load_timeout
+        self.scan_timeout = scan_timeout
+        self.cache = cache
+        self.force = force
+        self.on_result = on_result
+        self.on_output = on_output
+        self.roots = roots
+        self.detector = detector_signature(roots)
+        self.cancelled = False
+        self.results = []
+        self._pending = queue.Queue()
+        self._sessions = set()
+        self._lock = threading.Lock()
+
+    def run(self, hip_files):
+        """Scan ``hip_files`` and return one result dict per file."""
+        self.results = []
+        for hip_path in hip_files:
+            if self.cache and not self.force:
+                nodes = self.cache.lookup(hip_path, self.detector)
+                if nodes is not None:
+                    self._add_result(hip_path, nodes, cached=True)
+                    continue
+            self._pending.put(hip_path)
+
+        self.script_path = create_detection_script(self.temp_dir, self.roots)
+        workers = [threading.Thread(target=self._worker, args=(index,), daemon=True)
+                   for index in range(min(self.workers, self._pending.qsize()))]
+        try:
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+        finally:
+            if os.path.exists(self.script_path):
+                os.remove(self.script_path)
+        return self.results
+
+    def cancel(self):
+        self.cancelled = True
+        with self._lock:
+            sessions = list(self._sessions)
+        for session in sessions:
+            session.terminate()
+
+    def _worker(self, index):
+        session = None
+        fd, loader_path = tempfile.mkstemp(prefix=f"batch_scan_{index}_", suffix=".py",
+                                           dir=self.temp_dir)
+        os.close(fd)
+        try:
+            while not self.cancelled:
+                try:
+                    hip_path = self._pending.get_nowait()
+                except queue.Empty:
+                    return
+                started = time.time()
+
+                def log_output(line, is_error=False):
+                    if self.on_output:
+                        self.on_output(hip_path, line, is_error)
+
+                try:
+                    if session is None or not session.is_alive():
+                        session = None
+                        session = self._start_session(hip_path)
+                        command = f'python "{self.script_path}"'
+                    else:
+                        with open(loader_path, "w") as f:
+                            f.write(LOAD_AND_DETECT.format(hip_path=hip_path,
+                                                           script_path=self.script_path))
+                        command = f'python "{loader_path}"'
+                    lines = session.run(command, on_output=log_output,
+                                        timeout=self.scan_timeout, capture=True)
+                    nodes = parse_scan_output(lines)
+                    if nodes is None:
+                        raise SessionError("Detection script did not report any nodes")
+                except Exception as e:
+                    if session is not None and not session.ping():
+                        self._close_session(session)
+                        session = None
+                    self._add_result(hip_path, None, error=str(e), seconds=time.time() - started)
+                    continue
+                if self.cache:
+                    self.cache.store(hip_path, nodes, self.detector)
+                self._add_result(hip_path, nodes, seconds=time.time() - started)
+        finally:
+            if session is not None:
+                self._close_session(session)
+            if os.path.exists(loader_path):
+                os.remove(loader_path)
+
+    def _start_session(self, hip_path):
+        session = HbatchSession(self.launcher, hip_path, self.threads,
+                                load_timeout=self.load_timeout, env=self.env)
+        with self._lock:
+            self._sessions.add(session)
+        try:
+            session.start()
+        except Exception:
+            self._close_session(session)
+            raise
+        return session
+
+    def _close_session(self, session):
+        with self._lock:
+            self._sessions.discard(session)
+        session.close()
+
+    def _add_result(self, hip_path, nodes, error=None, cached=False, seconds=0.0):
+        result = {"hip": hip_path, "nodes": nodes or [], "error": error,
+                  "cached": cached, "seconds": round(seconds, 3)}
+        with self._lock:
+            self.results.append(result)
+        if self.on_result:
+            self.on_result(result)
+
+
+def write_report(results, path):
+    """Write batch scan results as JSON, or as one CSV row per node if ``path`` ends in .csv."""
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["hip", "type", "path", "frame_start", "frame_end", "frame_step",
+                             "output_pattern", "error"])
+            for result in results:
+                if not result["nodes"]:
+                    writer.writerow([result["hip"], "", "", "", "", "", "", result["error"] or ""])
+                for node in result["nodes"]:
+                    start, end, step = node.get("frame_range") or ("", "", "")
+                    writer.writerow([result["hip"], node["type"], node["path"], start, end, step,
+                                     node.get("output_pattern") or "", ""])
+    else:
+        with open(path, "w") as f:
+            json.dump(results, f, indent=2)
+    return path
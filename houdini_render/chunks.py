@@ -0,0 +1,226 @@
+"""Split one ROP's frame range into chunks rendered by separate hbatch sessions."""
+import collections
+import queue
+import re
+import threading
+
+from .failures import DEPENDENCY, classify, is_transient, retry_delay
+from .session import HBATCH_THREADS, SessionError
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Houdini reports ROP cook failures as "Error: ..." lines
+ERROR_LINE = re.compile(r"^\s*Error\b")
+
+
+class FrameChunk:
+    """A contiguous slice of frames of a ROP."""
+
+    def __init__(self, index, start, end, step=1):
+        self.index = index
+        self.start = start
+        self.end = end
+        self.step = step
+        self.state = QUEUED
+        self.attempts = 0
+        self.error = None
+        self.failure = None
+
+    @property
+    def label(self):
+        return f"{self.start:g}-{self.end:g}"
+
+    @property
+    def frame_count(self):
+        return int((self.end - self.start) // self.step) + 1
+
+
+def split_frame_range(start, end, chunk_size, step=1):
+    """Split ``start``..``end`` into chunks of at most ``chunk_size`` frames."""
+    chunk_size = max(1, int(chunk_size))
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(end, chunk_start + (chunk_size - 1) * step)
+        chunks.append(FrameChunk(len(chunks), chunk_start, chunk_end, step))
+        chunk_start = chunk_end + step
+    return chunks
+
+
+def split_frame_ranges(ranges, chunk_size, step=1):
+    """Split several (start, end) ranges into chunks, numbered consecutively."""
+    chunks = []
+    for start, end in ranges:
+        for chunk in split_frame_range(start, end, chunk_size, step):
+            chunk.index = len(chunks)
+            chunks.append(chunk)
+    return chunks
+
+
+def chunk_command(command, start, end, step=1):
+    """Restrict an hscript ``render`` command to a frame range."""
+    if not command.startswith("render "):
+        raise ValueError(f"Not a render command: {command}")
+    return f"render -f {start:g} {end:g} -i {step:g} {command[len('render '):]}"
+
+
+class ChunkedRender:
+    """Renders a frame range as chunks on up to ``workers`` sessions in parallel.
+
+    ``ranges`` limits rendering to those (start, end) parts of the frame
+    range, e.g. the frames still missing when resuming a cache. Chunks that
+    fail for a transient reason (see ``failures.classify``) are re-queued
+    after a backoff starting at ``retry_base`` seconds, until they have been
+    tried ``max_retries`` extra times. ``on_chunk`` is called with every
+    chunk state change.
+
+    ``ready(chunk)`` holds a chunk back until it returns True, e.g. until
+    the caches it reads have those frames; if it raises SessionError the
+    chunk fails.
+    """
+
+    def __init__(self, pool, hip_path, command, frame_range, chunk_size, workers=4,
+                 threads=HBATCH_THREADS, max_retries=2, on_output=None, on_chunk=None,
+                 ranges=None, retry_base=30, install=None, ready=None):
+        start, end, step = frame_range
+        self.pool = pool
+        self.hip_path = hip_path
+        self.command = command
+        self.chunks = split_frame_ranges(ranges or [(start, end)], chunk_size, step)
+        self.workers = max(1, min(workers, len(self.chunks) or 1))
+        self.threads = max(1, threads // self.workers)
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        # Houdini build to render with; None uses the pool's default
+        self.install = install
+        self.on_output = on_output
+        self.on_chunk = on_chunk
+        self.ready = ready
+        # Seconds between checks of a chunk that is not ready yet
+        self.ready_interval = 1.0
+        self.cancelled = False
+        self._cancel_event = threading.Event()
+        self._pending = queue.Queue()
+        self._active = set()
+        self._lock = threading.Lock()
+
+    def run(self):
+        """Render every chunk; returns True if all of them succeeded."""
+        for chunk in self.chunks:
+            self._pending.put(chunk)
+        workers = [threading.Thread(target=self._worker, daemon=True)
+                   for _ in range(self.workers)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return not self.cancelled and all(chunk.state == DONE for chunk in self.chunks)
+
+    def cancel(self):
+        self.cancelled = True
+        self._cancel_event.set()
+        with self._lock:
+            sessions = list(self._active)
+        for session in sessions:
+            session.terminate()
+
+    def sessions(self):
+        """Sessions currently rendering a chunk."""
+        with self._lock:
+            return list(self._active)
+
+    def failed_chunks(self):
+        return [chunk for chunk in self.chunks if chunk.state == FAILED]
+
+    def _worker(self):
+        while not self.cancelled:
+            try:
+                chunk = self._pending.get_nowait()
+            except queue.Empty:
+                return
+            if self.ready is not None and not self._chunk_ready(chunk):
+                continue
+            self._render_chunk(chunk)
+            if (chunk.state == FAILED and is_transient(chunk.failure)
+                    and chunk.attempts <= self.max_retries and not self.cancelled):
+                chunk.state = QUEUED
+                self._notify(chunk)
+                if self._cancel_event.wait(retry_delay(chunk.attempts, self.retry_base)):
+                    chunk.state = FAILED
+                    self._notify(chunk)
+                    return
+                self._pending.put(chunk)
+
+    def _chunk_ready(self, chunk):
+        """Wait until ``chunk`` may be rendered; False if it failed or the render was cancelled.
+
+        Chunks are taken in frame order, so waiting on the one at hand
+        rather than trying later ones follows the order inputs are written in.
+        """
+        while True:
+            try:
+                if self.ready(chunk):
+                    return True
+            except SessionError as e:
+                chunk.state = FAILED
+                chunk.error = str(e)
+                chunk.failure = DEPENDENCY
+                self._notify(chunk)
+                return False
+            if self._cancel_event.wait(self.ready_interval):
+                return False
+
+    def _render_chunk(self, chunk):
+        chunk.attempts += 1
+        chunk.error = None
+        chunk.failure = None
+        errors = []
+        tail = collections.deque(maxlen=50)
+
+        def log_output(line, is_error=False, at=None):
+            tail.append(line)
+            if ERROR_LINE.match(line):
+                errors.append(line.strip())
+            if self.on_output:
+                self.on_output(chunk, line, is_error, at)
+
+        session = None
+        try:
+            session = self.pool.acquire(self.hip_path, threads=self.threads,
+                                        install=self.install)
+            with self._lock:
+                self._active.add(session)
+            if self.cancelled:
+                raise SessionError("Cancelled")
+            # Running from the moment a warm session is rendering it
+            chunk.state = RUNNING
+            self._notify(chunk)
+            session.run(chunk_command(self.command, chunk.start, chunk.end, chunk.step),
+                        on_output=log_output)
+        except Exception as e:
+            chunk.state = FAILED
+            chunk.error = str(e)
+            returncode = session.returncode if session else None
+            chunk.failure = classify(returncode, tail, chunk.error)
+            if session:
+                self.pool.discard(session)
+        else:
+            self.pool.release(session)
+            if errors:
+                chunk.state = FAILED
+                chunk.error = errors[-1]
+                chunk.failure = classify(None, tail)
+            else:
+                chunk.state = DONE
+        finally:
+            if session:
+                with self._lock:
+                    self._active.discard(session)
+        self._notify(chunk)
+
+    def _notify(self, chunk):
+        if self.on_chunk:
+            self.on_chunk(chunk)
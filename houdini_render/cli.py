@@ -0,0 +1,515 @@
+"""Command line interface: ``python -m houdini_render <command>``.
+
+Commands:
+
+    scan HIP                  list the supported nodes of a hip file
+    batch-scan DIR_OR_GLOB    inventory many hip files and write a report
+    render HIP [NODE ...]     render nodes (all supported ones by default) and wait
+    queue list|add|cancel|remove|hold|release|clear|run
+                              work with the saved render queue, or with a
+                              running daemon if one is listening
+    daemon                    run the engine and accept jobs over a local socket
+    coordinator               like daemon, but hand renders to remote workers
+    worker HOST[:PORT]        render work pulled from a coordinator
+    workers                   list the workers registered with a coordinator
+    validate HIP [NODE ...]   check rendered frames and write checksum manifests
+    metrics list|show|export  resource usage recorded for finished jobs
+    installs                  list the Houdini builds found on this machine
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from .core import EngineError, RenderEngine
+from .daemon import (DEFAULT_HOST, DEFAULT_PORT, DaemonClient, RenderDaemon, default_token,
+                     job_info)
+from .detection import DEFAULT_ROOTS
+from .failures import DISK_FULL
+from .jobs import DONE, FAILED, FINISHED_STATES, HELD
+from .session import SessionError
+from .settings import state_path
+from .telemetry import MetricsStore, format_bytes, format_summary
+
+
+def print_log(message):
+    sys.stdout.write(message if message.endswith("\n") else message + "\n")
+    sys.stdout.flush()
+
+
+def print_blocked(blocked):
+    for job, dep in blocked.items():
+        print_log(f"{job.name} skipped: its input {dep.name} is {dep.state}")
+
+
+def make_engine(args, verbose=False, persist_queue=True, coordinator=None):
+    def on_output(job, line, is_error=False):
+        if verbose or is_error:
+            print_log(f"[{job.node_path}] {'ERROR: ' if is_error else ''}{line}")
+
+    def on_update(job):
+        failure = f" ({job.failure})" if job.failure else ""
+        error = f"{failure}: {job.error}" if job.error else ""
+        print_log(f"{job.name} {job.state}{error}")
+
+    printed = {}
+
+    def on_progress(job, tracker):
+        # Progress changes every frame; print it at most every few seconds per job
+        now = time.monotonic()
+        if tracker.finished or now - printed.get(job.id, 0) >= 5:
+            printed[job.id] = now
+            print_log(f"{job.name} {tracker.summary()}")
+
+    launcher = args.launcher.split() if args.launcher else None
+    return RenderEngine(hcmd_path=args.hcmd, launcher=launcher, houdini=args.houdini,
+                        max_parallel=getattr(args, "parallel", 2),
+                        persist_queue=persist_queue,
+                        on_log=print_log, on_output=on_output,
+                        on_update=on_update, on_progress=on_progress,
+                        coordinator=coordinator,
+                        min_free_gb=getattr(args, "min_free_gb", 5),
+                        writers_per_volume=getattr(args, "writers_per_volume", None),
+                        scan_cache_hash=args.scan_cache_hash)
+
+
+def format_node(node):
+    frames = node.get("frame_range")
+    frames = f"{frames[0]:g}-{frames[1]:g}" if frames else "-"
+    return f"{node['type']:<16} {frames:<12} {node['path']}"
+
+
+def cmd_scan(args):
+    roots = None if args.all_roots else DEFAULT_ROOTS
+    engine = make_engine(args)
+    try:
+        nodes, cached = engine.scan(args.hip, force=args.force, roots=roots)
+    finally:
+        engine.shutdown()
+    if args.json:
+        print(json.dumps(nodes, indent=2))
+    else:
+        for node in nodes:
+            print(format_node(node))
+        print(f"{len(nodes)} nodes{' (cached)' if cached else ''}")
+    return 0
+
+
+def cmd_batch_scan(args):
+    from .batchscan import find_hip_files, write_report
+
+    hip_files = find_hip_files(args.target)
+    if not hip_files:
+        print(f"No hip files found in {args.target}", file=sys.stderr)
+        return 1
+    engine = make_engine(args)
+
+    def on_result(result):
+        status = result["error"] or f"{len(result['nodes'])} nodes"
+        print_log(f"{result['hip']}: {status}")
+
+    scanner = engine.batch_scanner(workers=args.workers, force=args.force,
+                                   roots=None if args.all_roots else DEFAULT_ROOTS,
+                                   on_result=on_result)
+    try:
+        results = scanner.run(hip_files)
+    finally:
+        engine.shutdown()
+    if args.report:
+        print(f"Report written to {write_report(results, args.report)}")
+    return 1 if any(result["error"] for result in results) else 0
+
+
+def build_jobs(engine, args, hip, node_paths):
+    if node_paths:
+        nodes = [engine.find_node(hip, path) for path in node_paths]
+    else:
+        nodes, _ = engine.scan(hip)
+    return engine.make_jobs(hip, nodes, include_inputs=args.with_inputs, pipeline=args.pipeline,
+                            priority=args.priority, chunk_size=args.chunk_size,
+                            chunk_workers=args.workers, resume=args.resume,
+                            houdini=args.houdini)
+
+
+def cmd_render(args):
+    # Render directly without touching the saved queue
+    engine = make_engine(args, verbose=args.verbose, persist_queue=False)
+    try:
+        jobs = [engine.enqueue(job) for job in build_jobs(engine, args, args.hip, args.nodes)]
+        engine.start()
+        blocked = engine.wait(jobs)
+        # Nothing releases a held job once this command exits
+        for job in jobs:
+            if job.state == HELD:
+                engine.queue.set_state(job, FAILED, job.error, job.failure or DISK_FULL)
+                print_log(f"{job.name} failed: {job.error or 'held'}")
+        print_blocked(blocked)
+    except KeyboardInterrupt:
+        for job in engine.queue.snapshot():
+            engine.cancel(job)
+        return 130
+    finally:
+        engine.shutdown()
+    return 0 if all(job.state == DONE for job in jobs) else 1
+
+
+def cmd_queue(args):
+    client = DaemonClient(args.host, args.port)
+    if args.action != "run" and client.available():
+        return queue_via_daemon(client, args)
+
+    engine = make_engine(args, verbose=getattr(args, "verbose", False))
+    try:
+        if args.action == "list":
+            print_jobs([job_info(engine, job) for job in engine.queue.snapshot()])
+        elif args.action == "add":
+            for job in build_jobs(engine, args, args.hip, args.nodes):
+                engine.queue.add(job)
+                print(f"Queued {job.id} {job.name}")
+        elif args.action in ("cancel", "remove"):
+            for job_id in args.ids:
+                job = engine.get_job(job_id)
+                if args.action == "remove":
+                    engine.queue.remove(job.id)
+                elif job.state not in FINISHED_STATES:
+                    engine.cancel(job)
+        elif args.action in ("hold", "release"):
+            for job_id in args.ids:
+                job = engine.get_job(job_id)
+                getattr(engine, args.action)(job)
+                print(f"{job.id} {job.name} {job.state}")
+        elif args.action == "clear":
+            engine.queue.clear_finished()
+        elif args.action == "run":
+            jobs = engine.queue.pending()
+            engine.start()
+            blocked = engine.wait(jobs)
+            held = [job for job in jobs if job.state == HELD]
+            for job in held:
+                print(f"{job.id} {job.name} is held: {job.error or 'on hold'}")
+            print_blocked(blocked)
+            if held or blocked:
+                print("Release them with 'queue release ID' once they can run.")
+            return 0 if all(job.state == DONE for job in jobs) else 1
+    finally:
+        engine.shutdown()
+    return 0
+
+
+def queue_via_daemon(client, args):
+    if args.action == "list":
+        print_jobs(client.request("list"))
+    elif args.action == "add":
+        nodes = args.nodes or [node["path"] for node in client.request("scan", hip=args.hip)["nodes"]]
+        jobs = client.request("enqueue", hip=args.hip, nodes=nodes, priority=args.priority,
+                              chunk_size=args.chunk_size, chunk_workers=args.workers,
+                              resume=args.resume, houdini=args.houdini,
+                              with_inputs=args.with_inputs, pipeline=args.pipeline)
+        for job in jobs:
+            print(f"Queued {job['id']} {job['node_path']}")
+    elif args.action in ("cancel", "remove"):
+        for job_id in args.ids:
+            client.request(args.action, id=job_id)
+    elif args.action in ("hold", "release"):
+        for job_id in args.ids:
+            job = client.request(args.action, id=job_id)
+            print(f"{job['id']} {job['node_path']} {job['state']}")
+    elif args.action == "clear":
+        client.request("clear")
+    return 0
+
+
+def print_jobs(jobs):
+    for job in jobs:
+        print(f"{job['id']}  {job['state']:<9} {job['priority']:>3}  {job['node_path']}  "
+              f"{job['hip_path']}  {job.get('progress', '')}")
+    print(f"{len(jobs)} jobs")
+
+
+def cmd_daemon(args):
+    coordinator = None
+    if args.command == "coordinator":
+        from .coordinator import RemotePool
+        coordinator = RemotePool(worker_timeout=args.worker_timeout, on_log=print_log)
+    engine = make_engine(args, verbose=args.verbose, coordinator=coordinator)
+    try:
+        server = RenderDaemon(engine, args.host, args.port, token=default_token())
+    except (EngineError, OSError):
+        engine.shutdown()
+        raise
+    engine.start()
+    print_log(f"Listening on {args.host}:{args.port}")
+    if coordinator is not None and args.host == DEFAULT_HOST:
+        print_log("Only workers on this machine can connect; set HOUDINI_RENDER_TOKEN "
+                  "and use --host 0.0.0.0 for the LAN")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        engine.shutdown()
+    return 0
+
+
+def cmd_worker(args):
+    from .worker import RenderWorker, parse_address
+
+    host, port = parse_address(args.coordinator)
+    path_map = []
+    for mapping in args.map_path:
+        source, sep, target = mapping.partition("=")
+        if not sep:
+            print(f"--map-path needs FROM=TO, got {mapping}", file=sys.stderr)
+            return 1
+        path_map.append((source, target))
+    worker = RenderWorker(host, port, launcher=args.launcher.split() if args.launcher else None,
+                          houdini=args.houdini, slots=args.slots, name=args.name,
+                          path_map=path_map, on_log=print_log)
+    try:
+        worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+def cmd_workers(args):
+    workers = DaemonClient(args.host, args.port).request("workers")
+    now = time.time()
+    for worker in workers:
+        memory = f"{worker['memory_gb']:.0f} GB" if worker["memory_gb"] else "-"
+        print(f"{worker['name']:<20} {worker['busy']}/{worker['slots']} busy  "
+              f"{worker['cores'] or '-'} cores  {memory:>7}  "
+              f"seen {now - worker['last_seen']:.0f}s ago  {', '.join(worker['versions'])}")
+    print(f"{len(workers)} workers")
+    return 0
+
+
+def cmd_validate(args):
+    from .validate import (can_validate, diff_manifests, format_problems, load_manifest,
+                           manifest_path, validate_outputs, write_manifest)
+
+    engine = make_engine(args)
+    try:
+        if args.nodes:
+            nodes = [engine.find_node(args.hip, path) for path in args.nodes]
+        else:
+            nodes, _ = engine.scan(args.hip)
+    finally:
+        engine.shutdown()
+    status = 0
+    for node in nodes:
+        pattern = node.get("output_pattern")
+        if not can_validate(pattern, node.get("frame_range")):
+            print(f"{node['path']}: output files not known, skipped")
+            continue
+        path = manifest_path(pattern)
+        previous = load_manifest(path)
+        manifest = validate_outputs(pattern, node.get("frame_range"),
+                                    os.path.getmtime(args.hip), workers=args.workers,
+                                    previous=previous)
+        manifest.update(hip=args.hip, node=node["path"])
+        problems = format_problems(manifest)
+        print(f"{node['path']}: {len(manifest['files'])} files, "
+              f"{format_bytes(manifest['total_bytes'])}, {problems or 'ok'}")
+        if manifest["warnings"]:
+            print(f"  warning: {format_problems(manifest, key='warnings')}")
+        if os.path.isdir(os.path.dirname(path)):
+            write_manifest(manifest, path)
+            print(f"  manifest {path} ({manifest['hashed']} files hashed in "
+                  f"{manifest['hash_seconds']:.1f}s)")
+        if previous:
+            diff = diff_manifests(previous, manifest)
+            print(f"  since the last manifest: {len(diff['changed'])} changed, "
+                  f"{len(diff['added'])} added, {len(diff['removed'])} removed")
+        if problems:
+            status = 1
+    return status
+
+
+def cmd_metrics(args):
+    store = MetricsStore(args.db or state_path("metrics.db"))
+    try:
+        if args.action == "export":
+            if not args.target:
+                print("metrics export needs an output path", file=sys.stderr)
+                return 1
+            path = store.export(args.target, table=args.table, job_id=args.job)
+            print(f"Exported {args.table} to {path}")
+        elif args.action == "show":
+            job_id = args.target or args.job
+            jobs = store.rows("jobs", job_id)
+            if not jobs:
+                print(f"No metrics for job {job_id}", file=sys.stderr)
+                return 1
+            job = jobs[0]
+            print(f"{job['job_id']}  {job['state']}  {job['node_path']}  {job['hip_path']}")
+            if job["seconds"] is not None:
+                print(format_summary(job))
+            for frame in store.rows("frames", job_id):
+                print(f"  frame {frame['frame']:g}: {frame['seconds']:.1f}s, "
+                      f"RSS {format_bytes(frame['peak_rss'])}")
+        else:
+            for job in store.rows("jobs", args.job, limit=args.limit):
+                peak = format_bytes(job["peak_rss"]) if job["peak_rss"] is not None else "-"
+                cpu = f"{job['avg_cpu_percent']:.0f}%" if job["avg_cpu_percent"] is not None else "-"
+                print(f"{job['job_id']}  {job['state']:<9} CPU {cpu:>6}  RSS {peak:>10}  "
+                      f"{job['node_path']}  {job['hip_path']}")
+    finally:
+        store.close()
+    return 0
+
+
+def cmd_installs(args):
+    from .installs import InstallCache, version_text
+
+    installs = InstallCache(state_path("houdini_installs.json")).installs(refresh=args.refresh)
+    for install in installs:
+        print(f"{version_text(install.version):<12} {install.hfs}")
+    if not installs:
+        print("No Houdini installs found. Set $HFS or install under /opt/hfs* or Program Files.",
+              file=sys.stderr)
+        return 1
+    return 0
+
+
+def add_job_options(parser):
+    parser.add_argument("--priority", type=int, default=0)
+    parser.add_argument("--chunk-size", type=int, default=None,
+                        help="split the frame range into chunks of this many frames")
+    parser.add_argument("--workers", type=int, default=4,
+                        help="parallel processes per chunked job")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip frames whose output already exists")
+    parser.add_argument("--with-inputs", action="store_true",
+                        help="also render the caches the nodes read, before the nodes")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="start chunked jobs while their inputs render, chunk by chunk")
+
+
+def add_disk_options(parser):
+    parser.add_argument("--min-free-gb", type=float, default=5,
+                        help="hold jobs whose output would leave less free space on its volume")
+    parser.add_argument("--writers-per-volume", type=int, default=None,
+                        help="jobs writing to the same volume at once (default: no limit)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="houdini_render",
+                                     description="Scan and render Houdini hip files without the GUI.")
+    parser.add_argument("--houdini", metavar="VERSION",
+                        help="Houdini build to use and pin jobs to, e.g. 20.5 or 20.0.547 "
+                             "(default: newest installed)")
+    parser.add_argument("--hcmd", help="path to hcmd.exe of the Houdini build to use")
+    parser.add_argument("--launcher", help="command used instead of hcmd, e.g. a stub for testing")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="daemon address")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="daemon port")
+    parser.add_argument("--scan-cache-hash", action="store_true",
+                        help="reuse cached scans of hip files that were saved or copied "
+                             "without changes, by comparing their content hash")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    scan = commands.add_parser("scan", help="list supported nodes of a hip file")
+    scan.add_argument("hip")
+    scan.add_argument("--force", action="store_true", help="ignore the scan cache")
+    scan.add_argument("--all-roots", action="store_true", help="search the whole scene")
+    scan.add_argument("--json", action="store_true")
+    scan.set_defaults(func=cmd_scan)
+
+    batch = commands.add_parser("batch-scan", help="scan every hip file in a folder or glob")
+    batch.add_argument("target")
+    batch.add_argument("--workers", type=int, default=2)
+    batch.add_argument("--force", action="store_true")
+    batch.add_argument("--all-roots", action="store_true")
+    batch.add_argument("--report", help="write a .json or .csv report")
+    batch.set_defaults(func=cmd_batch_scan)
+
+    render = commands.add_parser("render", help="render nodes of a hip file and wait")
+    render.add_argument("hip")
+    render.add_argument("nodes", nargs="*", help="node paths (default: all supported nodes)")
+    render.add_argument("--parallel", type=int, default=2, help="jobs run at the same time")
+    render.add_argument("-v", "--verbose", action="store_true", help="print render output")
+    add_job_options(render)
+    add_disk_options(render)
+    render.set_defaults(func=cmd_render)
+
+    queue = commands.add_parser("queue", help="manage the render queue")
+    queue.add_argument("action", choices=("list", "add", "cancel", "remove", "hold", "release",
+                                            "clear", "run"))
+    queue.add_argument("hip", nargs="?", help="hip file for add")
+    queue.add_argument("nodes", nargs="*", help="node paths for add, job ids for the other actions")
+    queue.add_argument("--parallel", type=int, default=2)
+    queue.add_argument("-v", "--verbose", action="store_true")
+    add_job_options(queue)
+    add_disk_options(queue)
+    queue.set_defaults(func=cmd_queue)
+
+    daemon = commands.add_parser("daemon", help="serve the engine on a local socket")
+    daemon.add_argument("--parallel", type=int, default=2)
+    daemon.add_argument("-v", "--verbose", action="store_true")
+    add_disk_options(daemon)
+    daemon.set_defaults(func=cmd_daemon)
+
+    coordinator = commands.add_parser("coordinator",
+                                      help="serve the queue and hand renders to remote workers")
+    coordinator.add_argument("--parallel", type=int, default=8,
+                             help="jobs run at the same time across all workers")
+    coordinator.add_argument("--worker-timeout", type=float, default=30,
+                             help="seconds without a heartbeat before a worker's renders "
+                                  "are handed to another worker")
+    coordinator.add_argument("-v", "--verbose", action="store_true")
+    add_disk_options(coordinator)
+    coordinator.set_defaults(func=cmd_daemon)
+
+    worker = commands.add_parser("worker", help="render work pulled from a coordinator")
+    worker.add_argument("coordinator", help="coordinator address, HOST or HOST:PORT")
+    worker.add_argument("--slots", type=int, default=1, help="renders run at the same time")
+    worker.add_argument("--name", help="worker name (default: host name)")
+    worker.add_argument("--map-path", action="append", default=[], metavar="FROM=TO",
+                        help="replace a hip path prefix used on the coordinator")
+    worker.set_defaults(func=cmd_worker)
+
+    workers = commands.add_parser("workers", help="list workers registered with a coordinator")
+    workers.set_defaults(func=cmd_workers)
+
+    validate = commands.add_parser("validate", help="check output files and write manifests")
+    validate.add_argument("hip")
+    validate.add_argument("nodes", nargs="*", help="node paths (default: all supported nodes)")
+    validate.add_argument("--workers", type=int, default=4, help="files hashed in parallel")
+    validate.set_defaults(func=cmd_validate)
+
+    metrics = commands.add_parser("metrics", help="show or export recorded resource usage")
+    metrics.add_argument("action", choices=("list", "show", "export"))
+    metrics.add_argument("target", nargs="?", help="job id for show, output .csv/.json for export")
+    metrics.add_argument("--table", choices=MetricsStore.tables, default="jobs")
+    metrics.add_argument("--job", help="only this job id")
+    metrics.add_argument("--limit", type=int, default=50)
+    metrics.add_argument("--db", help="metrics file (default: ~/.houdini_render/metrics.db)")
+    metrics.set_defaults(func=cmd_metrics)
+
+    installs = commands.add_parser("installs", help="list installed Houdini builds")
+    installs.add_argument("--refresh", action="store_true",
+                          help="search again and re-source houdini_setup")
+    installs.set_defaults(func=cmd_installs)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "queue":
+        if args.action == "add" and not args.hip:
+            parser.error("queue add needs a hip file")
+        if args.action in ("cancel", "remove", "hold", "release"):
+            # The positional arguments hold job ids for these actions
+            args.ids = ([args.hip] if args.hip else []) + args.nodes
+    try:
+        return args.func(args)
+    except (EngineError, SessionError, OSError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,355 @@
+"""Hand renders to worker machines that pull them from a coordinating engine.
+
+On a coordinator the scheduler acquires its sessions from a RemotePool
+instead of starting hbatch locally. Every render command, a whole ROP or
+one frame chunk, becomes a work item that the next worker with a free
+slot and a matching Houdini build pulls over the daemon socket. Workers
+stream the output back while they render and send a heartbeat; the items
+of a worker that stops answering are handed to another one.
+
+Workers open the hip file under the path the coordinator queued it with,
+so both need the same shared storage (or a path mapping on the worker).
+"""
+import threading
+import time
+import uuid
+
+from .core import EngineError
+from .installs import HoudiniInstall, parse_version, sort_installs, version_text
+from .session import SessionError
+
+PENDING = "pending"
+ASSIGNED = "assigned"
+FINISHED = "finished"
+
+# Start of the error returned to a worker the coordinator does not know (any more)
+UNKNOWN_WORKER = "Unknown worker"
+
+
+class WorkItem:
+    """One render command waiting for, or running on, a worker."""
+
+    def __init__(self, hip_path, command, houdini=None, on_output=None, capture=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.hip_path = hip_path
+        self.command = command
+        # Exact build the item needs, or None for the worker's default
+        self.houdini = houdini
+        self.on_output = on_output
+        self.captured = [] if capture else None
+        self.state = PENDING
+        self.worker = None
+        self.assignments = 0
+        self.cancelled = False
+        self.error = None
+        self.returncode = None
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {"id": self.id, "hip": self.hip_path, "command": self.command,
+                "houdini": self.houdini}
+
+
+class WorkerInfo:
+    """A registered worker, its capacity and the items it is rendering."""
+
+    def __init__(self, name, host=None, cores=None, memory_gb=None, free_memory_gb=None,
+                 slots=1, versions=(), **extra):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.host = host
+        self.cores = cores
+        self.memory_gb = memory_gb
+        self.free_memory_gb = free_memory_gb
+        self.slots = max(1, slots)
+        self.versions = list(versions)
+        self.items = set()
+        self.registered = time.time()
+        self.last_seen = self.registered
+
+    def update(self, free_memory_gb=None, **extra):
+        self.free_memory_gb = free_memory_gb
+        self.last_seen = time.time()
+
+    def accepts(self, item):
+        """True if the worker has the build ``item`` is pinned to."""
+        if not item.houdini:
+            return True
+        return any(HoudiniInstall(parse_version(version), None, [version]).matches(item.houdini)
+                   for version in self.versions)
+
+    def to_dict(self):
+        return {"id": self.id, "name": self.name, "host": self.host, "cores": self.cores,
+                "memory_gb": self.memory_gb, "free_memory_gb": self.free_memory_gb,
+                "slots": self.slots, "busy": len(self.items), "versions": self.versions,
+                "last_seen": self.last_seen}
+
+
+class RemoteSession:
+    """Stands in for an HbatchSession whose commands run on whichever worker pulls them."""
+
+    process = None
+
+    def __init__(self, pool, hip_path, houdini=None):
+        self.pool = pool
+        self.hip_path = hip_path
+        self.houdini = houdini
+        self.busy = True
+        self.item = None
+
+    @property
+    def returncode(self):
+        return self.item.returncode if self.item else None
+
+    def is_alive(self):
+        return True
+
+    def ping(self, timeout=None):
+        return True
+
+    def run(self, command, on_output=None, timeout=None, capture=False):
+        """Queue ``command`` for a worker and block until it reports back."""
+        item = WorkItem(self.hip_path, command, self.houdini, on_output, capture)
+        self.item = item
+        self.pool.submit(item)
+        if not item.done.wait(timeout):
+            self.pool.cancel(item)
+            raise SessionError(f"Timed out after {timeout}s waiting for {command}")
+        if item.error:
+            raise SessionError(item.error)
+        return item.captured
+
+    def terminate(self, grace=None):
+        if self.item:
+            self.pool.cancel(self.item)
+
+    def close(self, timeout=5):
+        self.terminate()
+
+
+class RemotePool:
+    """Session pool whose sessions are slots on remote workers.
+
+    A worker that has not been heard from for ``worker_timeout`` seconds
+    is dropped and its items go back to the front of the queue, until an
+    item has been handed out ``max_assignments`` times.
+    """
+
+    def __init__(self, worker_timeout=30, max_assignments=3, on_log=None):
+        self.worker_timeout = worker_timeout
+        self.max_assignments = max_assignments
+        self.on_log = on_log
+        self.workers = {}
+        self.items = {}
+        self._pending = []
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reaper = threading.Thread(target=self._reap_workers, daemon=True)
+        self._reaper.start()
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    # Engine side
+
+    def acquire(self, hip_path, timeout=None, threads=None, install=None):
+        """A session for ``hip_path``; ``threads`` is left to each worker."""
+        if self._closed:
+            raise SessionError("Coordinator has been shut down")
+        houdini = version_text(install.version) if install and install.version else None
+        return RemoteSession(self, hip_path, houdini)
+
+    def release(self, session):
+        session.busy = False
+
+    def discard(self, session):
+        session.busy = False
+        session.terminate()
+
+    def resolve(self, spec):
+        """Newest build matching ``spec`` that a registered worker has, or None."""
+        with self._cond:
+            versions = {version for worker in self.workers.values() for version in worker.versions}
+        installs = sort_installs(HoudiniInstall(parse_version(version), None, [version])
+                                 for version in versions)
+        for install in installs:
+            if install.matches(spec):
+                return install
+        return None
+
+    def submit(self, item):
+        with self._cond:
+            if self._closed:
+                self._finish(item, "Coordinator has been shut down")
+                return
+            self.items[item.id] = item
+            self._pending.append(item)
+            self._cond.notify_all()
+            waiting = not any(worker.accepts(item) for worker in self.workers.values())
+        if waiting and item.on_output:
+            build = f"Houdini {item.houdini}" if item.houdini else "a Houdini build"
+            item.on_output(f"No registered worker has {build}; waiting for one\n", False)
+
+    def cancel(self, item):
+        """Give up on an item; a worker rendering it is told to stop on its next report."""
+        with self._cond:
+            item.cancelled = True
+            if item.state == PENDING and item in self._pending:
+                self._pending.remove(item)
+                self.items.pop(item.id, None)
+                item.state = FINISHED
+            if not item.done.is_set():
+                self._finish(item, "Cancelled")
+
+    def _finish(self, item, error=None, returncode=None):
+        item.error = error
+        item.returncode = returncode
+        item.done.set()
+        self._cond.notify_all()
+
+    def shutdown(self):
+        """Fail every waiting and running item; workers are told to stop them."""
+        with self._cond:
+            self._closed = True
+            for item in list(self.items.values()):
+                item.cancelled = True
+                if not item.done.is_set():
+                    self._finish(item, "Coordinator has been shut down")
+            self._pending.clear()
+            self._cond.notify_all()
+
+    # Worker side, called through the daemon
+
+    def _worker(self, worker_id):
+        worker = self.workers.get(worker_id)
+        if worker is None:
+            raise EngineError(f"{UNKNOWN_WORKER} {worker_id}; register again")
+        worker.last_seen = time.time()
+        return worker
+
+    def register(self, info):
+        worker = WorkerInfo(**info)
+        with self._cond:
+            # A worker that restarted does not finish what it was rendering before
+            for old in list(self.workers.values()):
+                if old.name == worker.name and old.host == worker.host:
+                    self._drop_worker(old, "restarted")
+            self.workers[worker.id] = worker
+            self._cond.notify_all()
+        versions = ", ".join(worker.versions) or "default build only"
+        self.log(f"Worker {worker.name} joined: {worker.cores} cores, "
+                 f"{worker.memory_gb or 0:.0f} GB RAM, {worker.slots} slots, {versions}\n")
+        return {"id": worker.id, "timeout": self.worker_timeout}
+
+    def heartbeat(self, worker_id, running=(), **info):
+        """Update a worker's capacity; returns the ids of its items it should stop."""
+        with self._cond:
+            worker = self._worker(worker_id)
+            worker.update(**info)
+            stop = []
+            for item_id in running:
+                item = self.items.get(item_id)
+                if item is None or item.worker is not worker or item.cancelled:
+                    stop.append(item_id)
+        return {"cancel": stop}
+
+    def pull(self, worker_id, wait=0):
+        """Hand the worker the oldest item it can render, waiting up to ``wait`` seconds."""
+        deadline = time.time() + wait
+        with self._cond:
+            while True:
+                worker = self._worker(worker_id)
+                if self._closed:
+                    return None
+                if len(worker.items) < worker.slots:
+                    for item in self._pending:
+                        if worker.accepts(item):
+                            self._pending.remove(item)
+                            item.state = ASSIGNED
+                            item.worker = worker
+                            item.assignments += 1
+                            worker.items.add(item.id)
+                            return item.to_dict()
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+
+    def report(self, worker_id, item_id, lines=(), done=False, error=None, returncode=None,
+               sent=None):
+        """Output and, with ``done``, the result of an item; tells the worker whether to stop.
+
+        Each line is (text, is_error) or (text, is_error, time printed). The
+        times are on the worker's clock, which read ``sent`` when it sent the
+        report; they are moved onto this machine's clock by the difference.
+        """
+        with self._cond:
+            worker = self._worker(worker_id)
+            item = self.items.get(item_id)
+            if item is None or item.worker is not worker or item.state != ASSIGNED:
+                # Cancelled or handed to another worker in the meantime
+                return {"cancel": True}
+            cancelled = item.cancelled
+        offset = time.time() - sent if sent else 0
+        if not item.done.is_set():
+            for text, is_error, *printed in lines:
+                if item.captured is not None and not is_error:
+                    item.captured.append(text)
+                if item.on_output and printed:
+                    item.on_output(text, is_error, printed[0] + offset)
+                elif item.on_output:
+                    item.on_output(text, is_error)
+        if done:
+            with self._cond:
+                item.state = FINISHED
+                worker.items.discard(item.id)
+                self.items.pop(item.id, None)
+                if not item.done.is_set():
+                    self._finish(item, f"{error} (on {worker.name})" if error else None,
+                                 returncode)
+                self._cond.notify_all()
+        return {"cancel": cancelled}
+
+    def worker_list(self):
+        with self._cond:
+            return [worker.to_dict() for worker in self.workers.values()]
+
+    def _drop_worker(self, worker, reason):
+        """Forget a worker and queue its items again. Called with the lock held."""
+        self.workers.pop(worker.id, None)
+        requeued = []
+        for item_id in worker.items:
+            item = self.items.get(item_id)
+            if item is None or item.worker is not worker:
+                continue
+            item.worker = None
+            if item.cancelled or item.done.is_set():
+                item.state = FINISHED
+                self.items.pop(item.id, None)
+            elif item.assignments >= self.max_assignments:
+                item.state = FINISHED
+                self.items.pop(item.id, None)
+                self._finish(item, f"Worker {worker.name} {reason} and the render was "
+                                   f"already handed out {item.assignments} times")
+            else:
+                item.state = PENDING
+                requeued.append(item)
+                if item.on_output:
+                    item.on_output(f"Worker {worker.name} {reason}; handing the render "
+                                   f"to another worker\n", True)
+        self._pending[:0] = requeued
+        worker.items.clear()
+        self._cond.notify_all()
+        self.log(f"Worker {worker.name} {reason}; {len(requeued)} renders queued again\n")
+
+    def _reap_workers(self):
+        while True:
+            time.sleep(max(1, self.worker_timeout / 3))
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.time()
+                for worker in list(self.workers.values()):
+                    if now - worker.last_seen > self.worker_timeout:
+                        self._drop_worker(worker, "timed out")
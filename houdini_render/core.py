@@ -0,0 +1,309 @@
+"""GUI-free render engine shared by the Tk UI, the command line and the daemon."""
+import os
+import shutil
+import tempfile
+import time
+
+from . import nodetypes
+from .batchscan import BatchScanner
+from .detection import (DEFAULT_ROOTS, create_detection_script, detector_signature,
+                        parse_scan_output)
+from .installs import HoudiniInstall, InstallCache, install_from_hcmd, version_text
+from .jobs import FINISHED_STATES, HELD, QUEUED, JobQueue, RenderJob, Scheduler
+from .journal import Journal
+from .scancache import ScanCache
+from .session import HBATCH_THREADS, SessionError, SessionPool
+from .settings import state_path
+from .telemetry import MetricsStore
+
+
+class EngineError(Exception):
+    """Raised for requests the engine cannot carry out, e.g. an unknown node."""
+
+
+class RenderEngine:
+    """Scans hip files and runs the render queue; knows nothing about the UI.
+
+    Progress is reported through the ``on_*`` callbacks, which are called
+    from worker threads:
+
+    * ``on_log(message)`` for engine messages
+    * ``on_output(job, line, is_error)`` for render output
+    * ``on_update(job)`` when a job changes state
+    * ``on_chunk(job, chunk)`` when a frame chunk changes state
+    * ``on_progress(job, tracker)`` when a job's frame progress changes
+
+    The Houdini build is the newest install found, or the one selected by
+    ``houdini`` (a version such as "20.5" or an $HFS path), ``hcmd_path``
+    or an explicit ``launcher`` command.
+
+    With a ``coordinator`` (a RemotePool) queued jobs are rendered by the
+    workers registered with it; scans still run on this machine.
+
+    Jobs are held rather than started when their output would leave less
+    than ``min_free_gb`` free on its volume, and at most
+    ``writers_per_volume`` jobs write to one volume at once.
+    """
+
+    def __init__(self, hcmd_path=None, launcher=None, houdini=None, max_parallel=2,
+                 thread_budget=HBATCH_THREADS, ram_ceiling_gb=None, load_timeout=600,
+                 scan_timeout=300, queue_path=None, persist_queue=True, on_log=None, on_output=None,
+                 on_update=None, on_chunk=None, on_progress=None, sample_interval=1.0,
+                 coordinator=None, min_free_gb=5, writers_per_volume=None,
+                 scan_cache_hash=False):
+        self.installs = InstallCache(state_path("houdini_installs.json"))
+        if launcher:
+            # Command that starts an hcmd-like shell; tests point it at tools/stub_hbatch.py
+            self.install = HoudiniInstall(None, None, launcher)
+        elif hcmd_path:
+            self.install = install_from_hcmd(hcmd_path)
+        else:
+            self.install = self.installs.resolve(houdini)
+        self.launcher = self.install.launcher if self.install else []
+        self.load_timeout = load_timeout
+        self.scan_timeout = scan_timeout
+        self.temp_dir = tempfile.gettempdir()
+        self.on_log = on_log
+        self.pool = SessionPool(self.launcher, max_sessions=max_parallel + 2,
+                                idle_timeout=600, load_timeout=load_timeout,
+                                env=self.install.env if self.install else None)
+        # One-off renders from the command line keep their jobs in memory only
+        if persist_queue:
+            queue_path = queue_path or state_path("queue.json")
+            self.queue = JobQueue(queue_path, Journal(os.path.splitext(queue_path)[0] + ".journal"))
+        else:
+            self.queue = JobQueue()
+        self.scan_cache = ScanCache(state_path("scan_cache.json"), use_hash=scan_cache_hash)
+        self.metrics = MetricsStore(state_path("metrics.db"))
+        self.coordinator = coordinator
+        self.scheduler = Scheduler(coordinator or self.pool, self.queue,
+                                   max_parallel=max_parallel,
+                                   thread_budget=thread_budget,
+                                   ram_ceiling_gb=ram_ceiling_gb,
+                                   min_free_gb=min_free_gb,
+                                   writers_per_volume=writers_per_volume,
+                                   on_output=on_output,
+                                   on_update=on_update,
+                                   on_chunk=on_chunk,
+                                   on_progress=on_progress,
+                                   metrics=self.metrics,
+                                   sample_interval=sample_interval,
+                                   resolve_install=self.resolve_install)
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def check_houdini(self):
+        if not self.launcher or not shutil.which(self.launcher[0]):
+            raise EngineError("No Houdini installation found (hcmd.exe, or hbatch with houdini_setup)")
+
+    def resolve_install(self, spec):
+        """The install a job pinned to ``spec`` runs with, or None if it is not installed.
+
+        A coordinator prefers the newest matching build of its workers.
+        """
+        if self.coordinator is not None:
+            install = self.coordinator.resolve(spec)
+            if install is not None:
+                return install
+        if self.install and self.install.matches(spec):
+            return self.install
+        return self.installs.resolve(spec)
+
+    def start(self, paused=False):
+        """Start dispatching queued jobs."""
+        if paused:
+            self.scheduler.pause()
+        self.scheduler.start()
+
+    def shutdown(self):
+        """Stop the scheduler and close all sessions, killing their process trees.
+
+        Jobs interrupted here stay marked as running in the saved queue and
+        are re-queued the next time the queue is loaded.
+        """
+        self.scheduler.stop()
+        if self.coordinator is not None:
+            self.coordinator.shutdown()
+        self.pool.shutdown()
+
+    def cached_nodes(self, hip_path, roots=DEFAULT_ROOTS):
+        """Scan results for an unchanged hip file, or None."""
+        return self.scan_cache.lookup(hip_path, detector_signature(roots))
+
+    def scan(self, hip_path, force=False, roots=DEFAULT_ROOTS, on_output=None):
+        """Return (nodes, cached) for a hip file, scanning it in a warm session if needed."""
+        if not force:
+            nodes = self.cached_nodes(hip_path, roots)
+            if nodes is not None:
+                return nodes, True
+        self.check_houdini()
+        script_path = create_detection_script(self.temp_dir, roots)
+        try:
+            session = self.pool.acquire(hip_path)
+            try:
+                lines = session.run(f'python "{script_path}"', on_output=on_output,
+                                    timeout=self.scan_timeout, capture=True)
+            except SessionError:
+                self.pool.discard(session)
+                raise
+            self.pool.release(session)
+        finally:
+            if os.path.exists(script_path):
+                os.remove(script_path)
+        nodes = parse_scan_output(lines)
+        if nodes is None:
+            raise EngineError("Detection script did not report any nodes.")
+        self.scan_cache.store(hip_path, nodes, detector_signature(roots))
+        return nodes, False
+
+    def batch_scanner(self, workers=None, force=False, roots=DEFAULT_ROOTS,
+                      on_result=None, on_output=None):
+        return BatchScanner(self.launcher, self.temp_dir,
+                            workers=workers or self.scheduler.max_parallel,
+                            load_timeout=self.load_timeout,
+                            scan_timeout=self.scan_timeout,
+                            cache=self.scan_cache, force=force,
+                            on_result=on_result, on_output=on_output, roots=roots,
+                            env=self.pool.env)
+
+    def find_node(self, hip_path, node_path, roots=DEFAULT_ROOTS):
+        """Look a node up in the (cached) scan results of a hip file."""
+        nodes, _ = self.scan(hip_path, roots=roots)
+        for node in nodes:
+            if node["path"] == node_path:
+                return node
+        raise EngineError(f"{node_path} is not a supported node in {hip_path}")
+
+    def make_job(self, hip_path, node, priority=0, chunk_size=None, chunk_workers=4,
+                 resume=False, houdini=None):
+        """Build a render job for a scanned node dict, optionally pinned to a Houdini build."""
+        node_type, node_path = node["type"], node["path"]
+        if not nodetypes.is_supported(node_type):
+            raise EngineError(nodetypes.unsupported_message(node_type))
+        if houdini:
+            install = self.resolve_install(houdini)
+            if install is None:
+                raise EngineError(f"Houdini {houdini} is not installed")
+            # Pin the exact build so a later install does not change the result
+            houdini = version_text(install.version) if install.version else houdini
+        frame_range = node.get("frame_range")
+        if chunk_size and not frame_range:
+            self.log(f"No frame range known for {node_path}; rendering it in one process.\n")
+        job = RenderJob(hip_path, node_type, node_path,
+                        nodetypes.render_command(node_type, node_path),
+                        priority=priority,
+                        frame_range=frame_range,
+                        chunk_size=chunk_size or None,
+                        chunk_workers=chunk_workers,
+                        output_pattern=node.get("output_pattern"),
+                        resume=resume,
+                        houdini=houdini)
+        if job.resume and not job.resumable:
+            self.log(f"No per-frame output pattern for {node_path}; it will be rendered in full.\n")
+        return job
+
+    def make_jobs(self, hip_path, nodes, include_inputs=False, pipeline=False, **options):
+        """Jobs for scanned ``nodes`` of one hip file, chained by the caches they read.
+
+        With ``include_inputs`` the detected nodes they read from are added
+        too, unless they already have an unfinished job in the queue. Jobs
+        wait for the queued or new jobs of their inputs, and are returned
+        inputs first, ready to be enqueued in that order.
+        """
+        hip_key = os.path.normcase(os.path.abspath(hip_path))
+        queued = {job.node_path: job.id for job in self.queue.snapshot()
+                  if job.state not in FINISHED_STATES
+                  and os.path.normcase(os.path.abspath(job.hip_path)) == hip_key}
+        scanned = {node["path"]: node for node in self.cached_nodes(hip_path) or ()}
+        selected = {}
+        todo = list(nodes)
+        while todo:
+            node = todo.pop(0)
+            if node["path"] in selected:
+                continue
+            selected[node["path"]] = node
+            if include_inputs:
+                todo.extend(scanned[path] for path in node.get("inputs", ())
+                            if path in scanned and path not in queued)
+
+        order = []
+        visiting = set()
+
+        def visit(path, chain):
+            if path in order:
+                return
+            if path in visiting:
+                raise EngineError("Nodes read each other's output: "
+                                  + " -> ".join(chain + [path]))
+            visiting.add(path)
+            for input_path in selected[path].get("inputs", ()):
+                if input_path in selected:
+                    visit(input_path, chain + [path])
+            visiting.discard(path)
+            order.append(path)
+
+        for path in selected:
+            visit(path, [])
+        jobs = []
+        ids = dict(queued)
+        for path in order:
+            job = self.make_job(hip_path, selected[path], **options)
+            # Inputs that are neither selected nor queued are taken as already on disk
+            job.depends_on = [ids[input_path] for input_path in selected[path].get("inputs", ())
+                              if input_path in ids]
+            job.pipeline = bool(pipeline and job.depends_on)
+            ids[path] = job.id
+            jobs.append(job)
+        return jobs
+
+    def enqueue(self, job):
+        self.queue.add(job)
+        self.scheduler.wake()
+        return job
+
+    def get_job(self, job_id):
+        job = self.queue.get(job_id)
+        if job is None:
+            raise EngineError(f"No job with id {job_id}")
+        return job
+
+    def cancel(self, job):
+        if job.state not in FINISHED_STATES:
+            self.scheduler.cancel(job)
+
+    def hold(self, job):
+        self.scheduler.hold(job)
+
+    def release(self, job):
+        self.scheduler.release(job)
+
+    def set_limits(self, max_parallel=None, ram_ceiling_gb=None, min_free_gb=None,
+                   writers_per_volume=None):
+        if max_parallel:
+            self.scheduler.max_parallel = max(1, max_parallel)
+            self.pool.max_sessions = self.scheduler.max_parallel + 2
+        self.scheduler.ram_ceiling_gb = ram_ceiling_gb or None
+        if min_free_gb is not None:
+            self.scheduler.min_free_gb = max(0, min_free_gb)
+        self.scheduler.writers_per_volume = writers_per_volume or None
+        self.scheduler.wake()
+
+    def wait(self, jobs, poll_interval=0.5):
+        """Block until every job in ``jobs`` has finished, is held or waits on an input that is.
+
+        Returns {job: input} for the jobs left waiting on a held or failed input.
+        """
+        while True:
+            blocked = {}
+            for job in jobs:
+                if job.state in FINISHED_STATES or job.state == HELD:
+                    continue
+                dep = self.queue.blocked_by(job) if job.state == QUEUED else None
+                if dep is None:
+                    break
+                blocked[job] = dep
+            else:
+                return blocked
+            time.sleep(poll_interval)
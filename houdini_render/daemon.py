@@ -0,0 +1,259 @@
+"""Long-running engine that accepts requests over a local socket.
+
+The protocol is one JSON object per line in each direction. A request
+looks like ``{"command": "enqueue", "hip": "...", "node": "/obj/..."}``.
+The reply is ``{"ok": true, "result": ...}`` or ``{"ok": false, "error": "..."}``.
+
+An engine started as a coordinator also answers the worker commands
+``register``, ``heartbeat``, ``pull`` and ``report`` (see coordinator.py).
+
+Every request carries a token. A daemon listening on anything but
+localhost needs a shared one, read from ``$HOUDINI_RENDER_TOKEN``. Without
+it a local daemon makes up its own and writes it to a file only the user
+can read, where clients on the same machine find it.
+"""
+import hmac
+import json
+import os
+import secrets
+import socket
+import socketserver
+import threading
+
+from .core import EngineError
+from .session import SessionError
+from .settings import state_path
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 47800
+TOKEN_ENV = "HOUDINI_RENDER_TOKEN"
+LOCAL_HOSTS = ("127.0.0.1", "localhost", "::1")
+
+
+def token_path(port):
+    return state_path(f"daemon_{port}.token")
+
+
+def default_token(port=None):
+    """The shared token from the environment, else the one a local daemon on ``port`` wrote."""
+    token = os.environ.get(TOKEN_ENV)
+    if token or port is None:
+        return token or None
+    try:
+        with open(token_path(port), "r") as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def write_token(port):
+    """Make up a token for a local daemon on ``port`` and store it for the user only."""
+    token = secrets.token_hex(16)
+    path = token_path(port)
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    # O_EXCL with the mode set at creation: the file is never readable by anyone else
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return token
+
+
+def job_info(engine, job):
+    info = job.to_dict()
+    tracker = engine.scheduler.progress.get(job.id)
+    info["progress"] = tracker.summary() if tracker else ""
+    return info
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                self.server.check_token(request)
+                result = self.server.dispatch(request)
+                reply = {"ok": True, "result": result}
+            except (EngineError, SessionError, KeyError, TypeError, ValueError, OSError) as e:
+                reply = {"ok": False, "error": str(e) or type(e).__name__}
+            except Exception as e:
+                # Never drop the connection without an answer
+                reply = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(reply) + "\n").encode("utf-8"))
+            self.wfile.flush()
+
+
+class RenderDaemon(socketserver.ThreadingTCPServer):
+    """Serves a RenderEngine on ``host:port``; binds to localhost by default.
+
+    Requests must carry ``token``. One must be given to listen on any
+    other address; a local daemon without one writes its own (see
+    default_token).
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, engine, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+        if host not in LOCAL_HOSTS and not token:
+            raise EngineError(f"Listening on {host} needs a shared token; set {TOKEN_ENV} "
+                              f"for the daemon and every client")
+        super().__init__((host, port), _RequestHandler)
+        self.engine = engine
+        self.token_file = None
+        if not token:
+            token = write_token(self.server_address[1])
+            self.token_file = token_path(self.server_address[1])
+        self.token = token
+
+    def server_close(self):
+        super().server_close()
+        if self.token_file:
+            try:
+                os.remove(self.token_file)
+            except OSError:
+                pass
+
+    def check_token(self, request):
+        token = request.pop("token", None)
+        if not hmac.compare_digest(str(token or ""), self.token):
+            raise EngineError("Invalid or missing token")
+
+    def dispatch(self, request):
+        command = request["command"]
+        handler = getattr(self, f"do_{command.replace('-', '_')}", None)
+        if handler is None:
+            raise EngineError(f"Unknown command: {command}")
+        return handler(request)
+
+    def do_ping(self, request):
+        return "pong"
+
+    def do_scan(self, request):
+        nodes, cached = self.engine.scan(request["hip"], force=request.get("force", False))
+        return {"nodes": nodes, "cached": cached}
+
+    def do_enqueue(self, request):
+        """Queue ``node``, or ``nodes`` returning a list of every job queued for them."""
+        paths = request["nodes"] if "nodes" in request else [request["node"]]
+        nodes = [self.engine.find_node(request["hip"], path) for path in paths]
+        jobs = self.engine.make_jobs(request["hip"], nodes,
+                                     include_inputs=request.get("with_inputs", False),
+                                     pipeline=request.get("pipeline", False),
+                                     priority=request.get("priority", 0),
+                                     chunk_size=request.get("chunk_size"),
+                                     chunk_workers=request.get("chunk_workers", 4),
+                                     resume=request.get("resume", False),
+                                     houdini=request.get("houdini"))
+        for job in jobs:
+            self.engine.enqueue(job)
+        infos = [job_info(self.engine, job) for job in jobs]
+        # With a single node its own job comes after the jobs of its inputs
+        return infos if "nodes" in request else infos[-1]
+
+    def do_list(self, request):
+        return [job_info(self.engine, job) for job in self.engine.queue.snapshot()]
+
+    def do_cancel(self, request):
+        job = self.engine.get_job(request["id"])
+        self.engine.cancel(job)
+        return job_info(self.engine, job)
+
+    def do_hold(self, request):
+        job = self.engine.get_job(request["id"])
+        self.engine.hold(job)
+        return job_info(self.engine, job)
+
+    def do_release(self, request):
+        job = self.engine.get_job(request["id"])
+        self.engine.release(job)
+        return job_info(self.engine, job)
+
+    def do_remove(self, request):
+        self.engine.queue.remove(request["id"])
+        return request["id"]
+
+    def do_clear(self, request):
+        self.engine.queue.clear_finished()
+        return len(self.engine.queue.snapshot())
+
+    def do_pause(self, request):
+        self.engine.scheduler.pause()
+        return True
+
+    def do_resume(self, request):
+        self.engine.scheduler.resume()
+        return True
+
+    def do_workers(self, request):
+        return self._coordinator().worker_list()
+
+    def do_register(self, request):
+        info = {key: value for key, value in request.items() if key != "command"}
+        if not isinstance(info.get("name"), str) or not info["name"]:
+            raise EngineError("register needs the worker's name")
+        if not isinstance(info.get("slots", 1), int):
+            raise EngineError("register needs slots as a whole number")
+        if not isinstance(info.get("versions", []), list):
+            raise EngineError("register needs versions as a list")
+        return self._coordinator().register(info)
+
+    def do_heartbeat(self, request):
+        info = {key: value for key, value in request.items()
+                if key not in ("command", "worker")}
+        return self._coordinator().heartbeat(request["worker"], **info)
+
+    def do_pull(self, request):
+        return self._coordinator().pull(request["worker"], min(30, request.get("wait", 0)))
+
+    def do_report(self, request):
+        return self._coordinator().report(request["worker"], request["item"],
+                                          lines=request.get("lines", ()),
+                                          done=request.get("done", False),
+                                          error=request.get("error"),
+                                          returncode=request.get("returncode"),
+                                          sent=request.get("sent"))
+
+    def _coordinator(self):
+        if self.engine.coordinator is None:
+            raise EngineError("This daemon does not accept workers; start it with 'coordinator'")
+        return self.engine.coordinator
+
+    def do_shutdown(self, request):
+        threading.Thread(target=self.shutdown, daemon=True).start()
+        return True
+
+
+class DaemonClient:
+    """Sends requests to a running RenderDaemon."""
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, timeout=600, token=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.token = token or default_token(port)
+
+    def request(self, command, timeout=None, **params):
+        params["command"] = command
+        if self.token:
+            params["token"] = self.token
+        with socket.create_connection((self.host, self.port),
+                                      timeout=timeout or self.timeout) as sock:
+            sock.sendall((json.dumps(params) + "\n").encode("utf-8"))
+            reply = sock.makefile("r", encoding="utf-8").readline()
+        if not reply:
+            raise EngineError("Daemon closed the connection")
+        reply = json.loads(reply)
+        if not reply["ok"]:
+            raise EngineError(reply["error"])
+        return reply["result"]
+
+    def available(self):
+        try:
+            return self.request("ping", timeout=2) == "pong"
+        except (OSError, EngineError):
+            return False
@@ -0,0 +1,207 @@
+"""Node detection script that runs inside hbatch and reports back over stdout."""
+import hashlib
+import json
+import os
+import tempfile
+
+from .nodetypes import FILE_READERS, NODE_REFERENCE_PARMS, NODE_TYPES
+
+SCAN_MARKER = "__HCMD_SCAN__"
+
+# Networks searched by default; None searches the whole scene
+DEFAULT_ROOTS = ("/obj", "/out", "/stage")
+
+DETECTION_SCRIPT = '''
+import hou
+import json
+import os
+
+def frame_range(node):
+    """Return [start, end, step] of a ROP, or None if it has no frame range."""
+    trange = node.parm("trange")
+    if trange is not None and trange.eval() == 0:
+        frame = hou.frame()
+        return [frame, frame, 1]
+    frames = node.parmTuple("f")
+    if frames is None:
+        return None
+    return list(frames.eval())
+
+# Unlikely frame number used to locate the frame token in an output path
+PROBE_FRAME = 987654
+
+def output_pattern(node, parm_name):
+    """Return the output path as a str.format pattern with a {frame} field, or None."""
+    parm = node.parm(parm_name) if parm_name else None
+    if parm is None:
+        return None
+    probe = parm.evalAtFrame(PROBE_FRAME)
+    if not probe:
+        return None
+    probe = probe.replace("{", "{{").replace("}", "}}")
+    index = probe.rfind(str(PROBE_FRAME))
+    if index == -1:
+        # Same file for every frame
+        return probe
+    prefix = probe[:index]
+    suffix = probe[index + len(str(PROBE_FRAME)):]
+    # The padding shows up in a low frame number, e.g. $F4 -> 0001
+    sample = parm.evalAtFrame(1).replace("{", "{{").replace("}", "}}")
+    padding = 1
+    if sample.startswith(prefix) and sample.endswith(suffix):
+        padding = max(1, len(sample) - len(prefix) - len(suffix))
+    return prefix + "{frame:0" + str(padding) + "d}" + suffix
+
+def output_probe(node, parm_name):
+    """Output path at PROBE_FRAME, to match against the files other nodes read."""
+    parm = node.parm(parm_name) if parm_name else None
+    value = parm.evalAtFrame(PROBE_FRAME) if parm is not None else ""
+    return os.path.normpath(value) if value else None
+
+# Parms that point a node at another node whose result it uses (see nodetypes.py)
+reference_parms = json.loads(__REFERENCE_PARMS__)
+# File parms of node types that read files back, by node type (see nodetypes.py)
+file_readers = json.loads(__FILE_READERS__)
+
+def linked_nodes(node):
+    """Nodes whose result ``node`` uses: wired inputs and the nodes its reference parms name."""
+    linked = [n for n in node.inputs() if n is not None]
+    for name in reference_parms:
+        parm = node.parm(name)
+        target = parm.evalAsNode() if parm is not None else None
+        if target is None:
+            continue
+        # An object referenced as a whole contributes its displayed SOP
+        display = target.displayNode() if hasattr(target, "displayNode") else None
+        linked.append(display if display is not None else target)
+    return linked
+
+def read_files(node):
+    """Paths of the files a known reader node reads, evaluated at PROBE_FRAME."""
+    paths = set()
+    for name in file_readers.get(node.type().name(), ()):
+        parm = node.parm(name)
+        value = parm.evalAtFrame(PROBE_FRAME) if parm is not None else ""
+        if value:
+            paths.add(os.path.normpath(value))
+    return paths
+
+def find_inputs(node, producers):
+    """Paths of detected nodes that ``node`` needs cooked first.
+
+    Walks upstream from the node along wired inputs and reference parms
+    and stops at every detected node it reaches, so only the nearest
+    caches count: a cache read back from disk hides whatever feeds it.
+    Reader nodes whose file another detected node writes count as well.
+    Only named parms are evaluated, so the walk stays cheap on large
+    scenes.
+    """
+    by_file = {probe: path for path, probe in producers.items() if probe}
+    own_path = node.path()
+    own_output = producers.get(own_path)
+    inputs = set()
+    seen = set()
+    stack = linked_nodes(node)
+    while stack:
+        current = stack.pop()
+        path = current.path()
+        if path in seen or path == own_path:
+            continue
+        seen.add(path)
+        if path in producers:
+            inputs.add(path)
+            continue
+        for probe in read_files(current):
+            if probe in by_file and probe != own_output:
+                inputs.add(by_file[probe])
+        stack.extend(linked_nodes(current))
+    return sorted(inputs)
+
+categories = {
+    "Sop": hou.sopNodeTypeCategory,
+    "Driver": hou.ropNodeTypeCategory,
+    "Lop": hou.lopNodeTypeCategory,
+}
+
+def find_nodes_by_type(node_types, roots):
+    """Find all instances of the given node types, optionally only below ``roots``.
+
+    Asking each node type for its instances avoids walking every node of
+    the scene, which is slow on production files.
+    """
+    prefixes = tuple(root.rstrip("/") + "/" for root in roots)
+    matching_nodes = {}
+    found = {}
+    for type_name, info in node_types.items():
+        for category in info["categories"]:
+            node_type = hou.nodeType(categories[category](), type_name)
+            if node_type is None:
+                continue
+            for node in node_type.instances():
+                path = node.path()
+                if path in matching_nodes or (prefixes and not path.startswith(prefixes)):
+                    continue
+                matching_nodes[path] = {
+                    "type": type_name,
+                    "path": path,
+                    "frame_range": frame_range(node),
+                    "output_pattern": output_pattern(node, info["output_parm"])
+                }
+                found[path] = (node, info["output_parm"])
+    producers = {path: output_probe(node, parm) for path, (node, parm) in found.items()}
+    for path, (node, _) in found.items():
+        matching_nodes[path]["inputs"] = find_inputs(node, producers)
+    return [matching_nodes[path] for path in sorted(matching_nodes)]
+
+# Node types to look for and the network roots to limit the search to
+node_types = json.loads(__NODE_TYPES__)
+roots = json.loads(__ROOTS__)
+
+# Get the nodes
+nodes = find_nodes_by_type(node_types, roots)
+
+# Print results
+print(f"Found {len(nodes)} nodes")
+for node in nodes:
+    after = f" (after {', '.join(node['inputs'])})" if node["inputs"] else ""
+    print(f"- {node['type']}: {node['path']}{after}")
+
+# Hand the result back on a single marked line
+print("''' + SCAN_MARKER + '''" + json.dumps(nodes))
+'''
+
+
+def detection_script(roots=DEFAULT_ROOTS):
+    """Return the detection script for the registered node types."""
+    node_types = {name: spec.to_dict() for name, spec in NODE_TYPES.items()}
+    return (DETECTION_SCRIPT
+            .replace("__NODE_TYPES__", repr(json.dumps(node_types)))
+            .replace("__ROOTS__", repr(json.dumps(list(roots or ()))))
+            .replace("__REFERENCE_PARMS__", repr(json.dumps(list(NODE_REFERENCE_PARMS))))
+            .replace("__FILE_READERS__", repr(json.dumps(FILE_READERS))))
+
+
+def detector_signature(roots=DEFAULT_ROOTS):
+    """Identifies the detection script, so cached results from another one are ignored."""
+    return hashlib.sha1(detection_script(roots).encode("utf-8")).hexdigest()[:12]
+
+
+def create_detection_script(temp_dir, roots=DEFAULT_ROOTS):
+    """Write the detection script to a new file in ``temp_dir`` and return its path.
+
+    Every scan gets its own file, so concurrent scans, or other users sharing
+    the temp folder, cannot overwrite or delete each other's script.
+    """
+    fd, script_path = tempfile.mkstemp(prefix="detect_nodes_", suffix=".py", dir=temp_dir)
+    with os.fdopen(fd, "w") as f:
+        f.write(detection_script(roots))
+    return script_path
+
+
+def parse_scan_output(lines):
+    """Return the node list printed by the detection script, or None if absent."""
+    for line in reversed(lines):
+        index = line.find(SCAN_MARKER)
+        if index != -1:
+            return json.loads(line[index + len(SCAN_MARKER):])
+    return None
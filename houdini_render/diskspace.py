@@ -0,0 +1,93 @@
+"""Estimate how much a job will write and find the volume it writes to.
+
+The size of one output file comes from the checksum manifest of an
+earlier run (see validate.py) or, failing that, from files of the
+pattern already on disk. Jobs with nothing to go by are estimated from
+their first frames once they run.
+"""
+import os
+import shutil
+import statistics
+
+from .resume import frame_numbers, output_path
+from .validate import load_manifest, manifest_path, output_folder
+
+GB = 1024 ** 3
+# Frames a running job writes before the rest of its output is estimated from them
+ESTIMATE_FRAMES = 3
+
+
+def existing_folder(path):
+    """Deepest folder on the way to ``path`` that exists."""
+    path = os.path.abspath(path)
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+def volume_of(path):
+    """Mount point or drive holding ``path``; outputs on one volume share it."""
+    path = existing_folder(path)
+    try:
+        device = os.stat(path).st_dev
+        while True:
+            parent = os.path.dirname(path)
+            if parent == path or os.stat(parent).st_dev != device:
+                return path
+            path = parent
+    except OSError:
+        return os.path.splitdrive(path)[0] or os.sep
+
+
+def free_bytes(path):
+    """Free space on the volume of ``path``, or None if it cannot be read."""
+    try:
+        return shutil.disk_usage(existing_folder(path)).free
+    except OSError:
+        return None
+
+
+def output_files(pattern, frame_range=None):
+    """Paths of every output file of a job; a pattern without {frame} is one file."""
+    if "{frame" not in pattern or not frame_range:
+        return [pattern]
+    return [output_path(pattern, frame) for frame in frame_numbers(frame_range)]
+
+
+def file_sizes(paths):
+    """Sizes of the files in ``paths`` that exist, in order."""
+    sizes = []
+    for path in paths:
+        try:
+            sizes.append(os.path.getsize(path))
+        except OSError:
+            pass
+    return sizes
+
+
+def file_size_estimate(pattern, frame_range=None):
+    """Typical size of one output file, from a previous manifest or files on disk, or None."""
+    manifest = load_manifest(manifest_path(pattern))
+    sizes = [entry["size"] for entry in (manifest or {}).get("files", []) if entry.get("size")]
+    if not sizes:
+        sizes = [size for size in file_sizes(output_files(pattern, frame_range)) if size]
+    return statistics.median(sizes) if sizes else None
+
+
+def bytes_needed(pattern, frame_range, file_size):
+    """Bytes a render adds to its volume: every file at ``file_size``, less what it replaces."""
+    needed = 0
+    for path in output_files(pattern, frame_range):
+        try:
+            existing = os.path.getsize(path)
+        except OSError:
+            existing = 0
+        needed += max(0, file_size - existing)
+    return needed
+
+
+def output_volume(pattern):
+    return volume_of(output_folder(pattern)) if pattern else None
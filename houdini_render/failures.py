@@ -0,0 +1,80 @@
+"""Classify failed renders and decide whether and when to retry them."""
+import random
+import re
+
+OOM = "oom"
+LICENSE = "license"
+MISSING_FILE = "missing_file"
+CRASH = "crash"
+TIMEOUT = "timeout"
+ERROR = "error"
+# The render finished but its output files failed validation
+BAD_OUTPUT = "bad_output"
+# A job this one needs failed or was cancelled
+DEPENDENCY = "dependency"
+# The output volume has no room for the job; it is held until there is
+DISK_FULL = "disk_full"
+
+# Failures that may well succeed on another attempt
+TRANSIENT = (OOM, LICENSE, CRASH, TIMEOUT)
+
+# Checked in this order against the last lines of output and the error message
+SIGNATURES = (
+    (LICENSE, re.compile(r"licen[cs]e|hserver|sesinetd|no (?:available )?tokens", re.IGNORECASE)),
+    (OOM, re.compile(r"out of memory|bad_alloc|MemoryError|cannot allocate|"
+                     r"failed to allocate|memory allocation failed", re.IGNORECASE)),
+    (MISSING_FILE, re.compile(r"no such file|file not found|unable to open|cannot open|"
+                              r"could not open|cannot find|does not exist|missing (?:file|asset)",
+                              re.IGNORECASE)),
+    (CRASH, re.compile(r"segmentation fault|caught signal|crash(?:ed)?\b|core dumped|"
+                       r"access violation|stack trace", re.IGNORECASE)),
+    (TIMEOUT, re.compile(r"timed out", re.IGNORECASE)),
+)
+
+# POSIX signals reported as negative return codes by subprocess
+SIGNAL_FAILURES = {-9: OOM, -11: CRASH, -6: CRASH, -7: CRASH, -4: CRASH, -8: CRASH}
+# Windows NTSTATUS exit codes
+WINDOWS_FAILURES = {
+    0xC0000017: OOM,    # STATUS_NO_MEMORY
+    0xC000012D: OOM,    # STATUS_COMMITMENT_LIMIT
+    0xC0000005: CRASH,  # STATUS_ACCESS_VIOLATION
+    0xC00000FD: CRASH,  # STATUS_STACK_OVERFLOW
+    0xC0000409: CRASH,  # STATUS_STACK_BUFFER_OVERRUN
+    0xC000001D: CRASH,  # STATUS_ILLEGAL_INSTRUCTION
+}
+
+
+def classify(returncode=None, lines=(), message=""):
+    """Return the failure class of a render from its exit code and output.
+
+    Log signatures win over the exit code, because a license or missing
+    file error usually ends in an ordinary non-zero exit. A process killed
+    with SIGKILL (or exit code 137 from a shell) is most likely the kernel's
+    OOM killer.
+    """
+    text = "\n".join(list(lines) + [message or ""])
+    for failure, pattern in SIGNATURES:
+        if pattern.search(text):
+            return failure
+    if returncode is not None:
+        if returncode in SIGNAL_FAILURES:
+            return SIGNAL_FAILURES[returncode]
+        if returncode == 137:
+            return OOM
+        if returncode in (134, 139):
+            return CRASH
+        if returncode & 0xFFFFFFFF in WINDOWS_FAILURES:
+            return WINDOWS_FAILURES[returncode & 0xFFFFFFFF]
+        if returncode < 0:
+            return CRASH
+    return ERROR
+
+
+def is_transient(failure):
+    return failure in TRANSIENT
+
+
+def retry_delay(attempt, base=30, cap=900):
+    """Exponential backoff in seconds before retry number ``attempt`` (1 based), with jitter."""
+    delay = min(cap, base * 2 ** max(0, attempt - 1))
+    return delay * random.uniform(0.8, 1.2)
@@ -0,0 +1,211 @@
+"""Find Houdini installs on Windows, Linux and macOS and cache their environments.
+
+On Windows sessions are started through ``hcmd.exe``, which sets up the
+Houdini environment itself. On Linux and macOS there is no hcmd; sessions
+start a plain ``bash`` with the environment that ``houdini_setup`` produces,
+and ``exec`` the same ``hbatch`` command line in it, so the session process
+is hbatch itself. Sourcing ``houdini_setup`` takes a while, so the
+resulting environment is cached together with the list of installs and
+only refreshed when an install changes.
+"""
+import glob
+import json
+import os
+import re
+import subprocess
+import time
+
+from .settings import write_file
+
+VERSION = re.compile(r"(\d+)\.(\d+)(?:\.(\d+))?")
+
+WINDOWS_ROOTS = (r"C:\Program Files\Side Effects Software",)
+LINUX_PATTERNS = ("/opt/hfs*",)
+MAC_PATTERNS = ("/Applications/Houdini/Houdini*/Frameworks/Houdini.framework/Versions/Current/Resources",)
+
+
+def parse_version(text):
+    """(major, minor, build) parsed from a path or version string, or None."""
+    for candidate in (os.path.basename(os.path.normpath(text)), text):
+        match = VERSION.search(candidate)
+        if match:
+            return tuple(int(part or 0) for part in match.groups())
+    return None
+
+
+def version_text(version):
+    return ".".join(str(part) for part in version) if version else "unknown"
+
+
+class HoudiniInstall:
+    """One Houdini build: its $HFS, the command that opens a session and its environment."""
+
+    def __init__(self, version, hfs, launcher, env=None, stamp=None):
+        self.version = tuple(version) if version else None
+        self.hfs = hfs
+        self.launcher = list(launcher)
+        # Environment for the launcher; None inherits ours (hcmd sets up its own)
+        self.env = env
+        # mtime of the file the environment came from, to notice upgrades in place
+        self.stamp = stamp
+
+    @property
+    def label(self):
+        return f"Houdini {version_text(self.version)}"
+
+    def matches(self, spec):
+        """True if ``spec`` ("20", "20.0", "20.0.547" or a path) selects this build."""
+        if not spec:
+            return True
+        if os.path.sep in spec or "/" in spec:
+            return os.path.normcase(os.path.normpath(spec)) in (
+                os.path.normcase(os.path.normpath(self.hfs or "")),
+                os.path.normcase(os.path.normpath(self.launcher[0])))
+        wanted = parse_version(spec) if "." in spec else (int(spec),) if spec.isdigit() else None
+        if wanted is None or not self.version:
+            return False
+        parts = len(spec.split("."))
+        return self.version[:parts] == tuple(wanted)[:parts]
+
+    def to_dict(self):
+        return {"version": self.version, "hfs": self.hfs, "launcher": self.launcher,
+                "env": self.env, "stamp": self.stamp}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def setup_script(hfs):
+    return os.path.join(hfs, "houdini_setup")
+
+
+def sourced_environment(hfs, timeout=120):
+    """Environment after sourcing ``$HFS/houdini_setup`` in bash."""
+    result = subprocess.run(
+        ["bash", "-c", 'cd "$0" && source ./houdini_setup >/dev/null 2>&1 && env -0', hfs],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=timeout, check=True)
+    env = {}
+    for entry in result.stdout.decode("utf-8", "replace").split("\0"):
+        name, sep, value = entry.partition("=")
+        if sep and name:
+            env[name] = value
+    return env
+
+
+def install_from_hcmd(hcmd_path):
+    """Install for an explicit hcmd.exe path (or any launcher that sets up Houdini itself)."""
+    hfs = os.path.dirname(os.path.dirname(os.path.abspath(hcmd_path)))
+    return HoudiniInstall(parse_version(hfs), hfs, [hcmd_path])
+
+
+def candidate_homes():
+    """Directories that may be a $HFS, with $HFS itself first."""
+    homes = []
+    if os.environ.get("HFS"):
+        homes.append(os.environ["HFS"])
+    if os.name == "nt":
+        roots = list(WINDOWS_ROOTS)
+        program_files = os.environ.get("PROGRAMFILES")
+        if program_files:
+            roots.append(os.path.join(program_files, "Side Effects Software"))
+        for root in roots:
+            homes.extend(glob.glob(os.path.join(root, "Houdini*")))
+    else:
+        for pattern in LINUX_PATTERNS + MAC_PATTERNS:
+            homes.extend(glob.glob(pattern))
+    seen = set()
+    unique = []
+    for home in homes:
+        key = os.path.normcase(os.path.realpath(home))
+        if key not in seen and os.path.isdir(home):
+            seen.add(key)
+            unique.append(home)
+    return unique
+
+
+def probe_install(hfs):
+    """HoudiniInstall for a $HFS directory without its environment, or None."""
+    if os.name == "nt":
+        hcmd = os.path.join(hfs, "bin", "hcmd.exe")
+        return install_from_hcmd(hcmd) if os.path.exists(hcmd) else None
+    if not (os.path.exists(setup_script(hfs)) and os.path.exists(os.path.join(hfs, "bin", "hbatch"))):
+        return None
+    version = parse_version(os.path.realpath(hfs)) or parse_version(hfs)
+    return HoudiniInstall(version, hfs, ["bash", "--noprofile", "--norc"],
+                          stamp=os.path.getmtime(setup_script(hfs)))
+
+
+def sort_installs(installs):
+    """Newest version first; installs without a known version go last."""
+    return sorted(installs, key=lambda install: install.version or (), reverse=True)
+
+
+class InstallCache:
+    """Discovered installs and their sourced environments, cached in a JSON file."""
+
+    def __init__(self, path, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._installs = None
+
+    def _load(self):
+        try:
+            with open(self.path, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data.get("created", 0) > self.max_age:
+            return None
+        # A build installed or removed since the last run changes the candidates
+        if data.get("homes") != candidate_homes():
+            return None
+        installs = [HoudiniInstall.from_dict(entry) for entry in data.get("installs", [])]
+        for install in installs:
+            # An install upgraded in place invalidates the whole list
+            if not os.path.exists(install.launcher[0]) and os.path.sep in install.launcher[0]:
+                return None
+            if install.hfs and not os.path.isdir(install.hfs):
+                return None
+            if install.stamp is not None and (
+                    not os.path.exists(setup_script(install.hfs))
+                    or os.path.getmtime(setup_script(install.hfs)) != install.stamp):
+                return None
+        return installs
+
+    def _save(self, installs):
+        data = {"created": time.time(), "homes": candidate_homes(),
+                "installs": [install.to_dict() for install in installs]}
+        write_file(self.path, json.dumps(data, indent=2))
+
+    def installs(self, refresh=False):
+        """All installs, newest first, sourcing environments only when not cached."""
+        if self._installs is not None and not refresh:
+            return self._installs
+        installs = None if refresh else self._load()
+        if installs is None:
+            installs = []
+            for hfs in candidate_homes():
+                install = probe_install(hfs)
+                if install is None:
+                    continue
+                if install.stamp is not None:
+                    try:
+                        install.env = sourced_environment(hfs)
+                    except (OSError, subprocess.SubprocessError):
+                        continue
+                installs.append(install)
+            installs = sort_installs(installs)
+            try:
+                self._save(installs)
+            except OSError:
+                pass
+        self._installs = installs
+        return installs
+
+    def resolve(self, spec=None):
+        """The newest install matching ``spec``, or None."""
+        for install in self.installs():
+            if install.matches(spec):
+                return install
+        return None
@@ -0,0 +1,969 @@
+"""Persistent render queue and a scheduler that runs several jobs in parallel."""
+import collections
+import json
+import os
+import statistics
+import threading
+import time
+import uuid
+
+from .chunks import ERROR_LINE, ChunkedRender
+from .diskspace import (ESTIMATE_FRAMES, GB, bytes_needed, file_size_estimate, file_sizes,
+                        free_bytes, output_volume)
+from .failures import (BAD_OUTPUT, DEPENDENCY, DISK_FULL, ERROR, classify, is_transient,
+                       retry_delay)
+from .progress import ProgressTracker
+from .resume import (collapse_frames, find_valid_frames, frame_numbers, missing_frame_ranges,
+                     output_path)
+from .session import HBATCH_THREADS, SessionError
+from .settings import write_file
+from .telemetry import JobTelemetry, format_bytes, format_summary
+from .validate import (can_validate, format_problems, load_manifest, manifest_path,
+                       manifest_sizes, validate_outputs, write_manifest)
+
+QUEUED = "queued"
+HELD = "held"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class RenderJob:
+    """A single ROP render or cache of one hip file."""
+
+    fields = ("id", "hip_path", "node_type", "node_path", "command", "priority",
+              "state", "threads", "memory_gb", "frame_range", "chunk_size", "chunk_workers",
+              "output_pattern", "resume", "created", "started", "finished", "error",
+              "failure", "attempts", "retry_at", "houdini", "depends_on", "pipeline",
+              "hip_mtime")
+
+    def __init__(self, hip_path, node_type, node_path, command, priority=0,
+                 threads=None, memory_gb=None, frame_range=None, chunk_size=None,
+                 chunk_workers=4, output_pattern=None, resume=False, **extra):
+        self.id = extra.get("id") or uuid.uuid4().hex[:12]
+        self.hip_path = hip_path
+        self.node_type = node_type
+        self.node_path = node_path
+        self.command = command
+        self.priority = priority
+        self.threads = threads
+        self.memory_gb = memory_gb
+        # With a chunk size the frame range is split across chunk_workers sessions
+        self.frame_range = frame_range
+        self.chunk_size = chunk_size
+        self.chunk_workers = chunk_workers
+        # With resume only frames without a valid file matching output_pattern are rendered
+        self.output_pattern = output_pattern
+        self.resume = resume
+        self.state = extra.get("state", QUEUED)
+        self.created = extra.get("created") or time.time()
+        self.started = extra.get("started")
+        self.finished = extra.get("finished")
+        self.error = extra.get("error")
+        # Failure class of the last failed attempt and when the next retry is due
+        self.failure = extra.get("failure")
+        self.attempts = extra.get("attempts", 0)
+        self.retry_at = extra.get("retry_at")
+        # Houdini build the job is pinned to ("20.0.547", "20.5", ...); None uses the default
+        self.houdini = extra.get("houdini")
+        # Ids of jobs whose output this one reads; it starts once they are done
+        self.depends_on = list(extra.get("depends_on") or [])
+        # With pipeline a chunked job starts while its inputs still render, and
+        # each chunk waits only for the same frames of every input
+        self.pipeline = extra.get("pipeline", False)
+        # mtime of the hip file when the job last started; its output must be newer
+        self.hip_mtime = extra.get("hip_mtime")
+
+    @property
+    def chunked(self):
+        return bool(self.chunk_size and self.frame_range)
+
+    @property
+    def resumable(self):
+        return bool(self.resume and self.frame_range and self.output_pattern
+                    and "{frame" in self.output_pattern)
+
+    @property
+    def name(self):
+        return f"{os.path.basename(self.hip_path)}:{self.node_path}"
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+class JobQueue:
+    """Ordered set of jobs, saved to a JSON file on every change.
+
+    With a ``journal`` every change is also appended to it, together with
+    the state of each frame chunk. On load the journal is replayed, so
+    chunks that finished before a crash or restart are not rendered again.
+    """
+
+    def __init__(self, path=None, journal=None):
+        self.path = path
+        self.journal = journal
+        self.jobs = []
+        # job id -> {(start, end): chunk state}
+        self.chunk_states = {}
+        self.lock = threading.RLock()
+        # Held from taking the snapshot to writing it, so an older snapshot never lands last
+        self.save_lock = threading.Lock()
+        if path and os.path.exists(path) or journal:
+            self.load()
+
+    def load(self):
+        jobs = []
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "r") as f:
+                jobs = json.load(f).get("jobs", [])
+        chunks = {}
+        if self.journal:
+            replayed, chunks = self.journal.replay()
+            if replayed:
+                # The journal is written before the snapshot and is never behind it
+                jobs = list(replayed.values())
+        with self.lock:
+            self.jobs = [RenderJob.from_dict(job) for job in jobs]
+            self.chunk_states = chunks
+            for job in self.jobs:
+                # Whatever was running when the tool went away starts over
+                if job.state == RUNNING:
+                    job.state = QUEUED
+                    job.started = None
+            if self.journal:
+                self.journal.compact(self.jobs, self.chunk_states)
+
+    def save(self):
+        if not self.path:
+            return
+        with self.save_lock:
+            with self.lock:
+                data = {"jobs": [job.to_dict() for job in self.jobs]}
+            write_file(self.path, json.dumps(data, indent=2))
+
+    def add(self, job):
+        with self.lock:
+            self.jobs.append(job)
+            if self.journal:
+                self.journal.job_added(job)
+        self.save()
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job.id == job_id:
+                    return job
+        return None
+
+    def remove(self, job_id):
+        with self.lock:
+            removed = [job for job in self.jobs if job.id == job_id and job.state != RUNNING]
+            self.jobs = [job for job in self.jobs if job not in removed]
+            for job in removed:
+                self.chunk_states.pop(job.id, None)
+                if self.journal:
+                    self.journal.job_removed(job.id)
+        self.save()
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.state not in FINISHED_STATES]
+            kept = {job.id for job in self.jobs}
+            self.chunk_states = {job_id: states for job_id, states in self.chunk_states.items()
+                                 if job_id in kept}
+            if self.journal:
+                self.journal.compact(self.jobs, self.chunk_states)
+        self.save()
+
+    def set_state(self, job, state, error=None, failure=None):
+        if state == RUNNING:
+            try:
+                hip_mtime = os.path.getmtime(job.hip_path)
+            except OSError:
+                hip_mtime = None
+        with self.lock:
+            job.state = state
+            if state == RUNNING:
+                job.started = time.time()
+                job.hip_mtime = hip_mtime
+                job.error = None
+                job.attempts += 1
+                job.retry_at = None
+            elif state in FINISHED_STATES:
+                job.finished = time.time()
+                job.error = error
+                job.failure = failure
+            elif state in (QUEUED, HELD):
+                job.error = error
+                job.failure = failure
+            self._journal_update(job, "state", "started", "finished", "error", "failure",
+                                 "attempts", "retry_at", "hip_mtime")
+        self.save()
+
+    def retry(self, job, error, failure, delay):
+        """Put a failed job back in the queue, to be started again after ``delay`` seconds."""
+        with self.lock:
+            job.state = QUEUED
+            job.error = error
+            job.failure = failure
+            job.retry_at = time.time() + delay
+            self._journal_update(job, "state", "error", "failure", "retry_at")
+        self.save()
+
+    def set_priority(self, job, priority):
+        with self.lock:
+            job.priority = priority
+            self._journal_update(job, "priority")
+        self.save()
+
+    def _journal_update(self, job, *fields):
+        if self.journal and job in self.jobs:
+            self.journal.job_updated(job, *fields)
+
+    def record_chunk(self, job, chunk):
+        with self.lock:
+            self.chunk_states.setdefault(job.id, {})[(chunk.start, chunk.end)] = chunk.state
+            if self.journal:
+                self.journal.chunk_changed(job.id, chunk)
+
+    def done_chunks(self, job_id):
+        """(start, end) of every chunk of a job that finished rendering."""
+        with self.lock:
+            states = self.chunk_states.get(job_id, {})
+            return [key for key, state in states.items() if state == DONE]
+
+    def pending(self):
+        """Queued jobs that are due, highest priority first, then oldest first.
+
+        Among jobs of equal priority, those with the longest chain of jobs
+        waiting on them go first, so the critical path of a job graph
+        starts as early as possible.
+        """
+        now = time.time()
+        with self.lock:
+            ready = [job for job in self.jobs
+                     if job.state == QUEUED and (job.retry_at or 0) <= now]
+            depth = self.dependent_depth()
+        return sorted(ready, key=lambda job: (-job.priority, -depth.get(job.id, 0), job.created))
+
+    def dependent_depth(self):
+        """Job id -> length of the longest chain of unfinished jobs depending on it."""
+        with self.lock:
+            dependents = {}
+            for job in self.jobs:
+                if job.state not in FINISHED_STATES:
+                    for job_id in job.depends_on:
+                        dependents.setdefault(job_id, []).append(job.id)
+        depth = {}
+
+        def visit(job_id, path):
+            if job_id not in depth:
+                # A cycle would recurse forever; its jobs never start anyway
+                children = [child for child in dependents.get(job_id, ()) if child not in path]
+                depth[job_id] = max((visit(child, path | {child}) + 1 for child in children),
+                                    default=0)
+            return depth[job_id]
+
+        for job_id in list(dependents):
+            visit(job_id, {job_id})
+        return depth
+
+    def dependencies(self, job):
+        """The jobs ``job`` depends on that are still in the queue."""
+        with self.lock:
+            return [dep for dep in (self.get(job_id) for job_id in job.depends_on) if dep]
+
+    def blocked_by(self, job):
+        """The held or failed job upstream of ``job`` that keeps it from starting, or None."""
+        seen = set()
+        pending = [job]
+        while pending:
+            for dep in self.dependencies(pending.pop()):
+                if dep.id in seen:
+                    continue
+                seen.add(dep.id)
+                if dep.state in (HELD, FAILED, CANCELLED):
+                    return dep
+                if dep.state != DONE:
+                    pending.append(dep)
+        return None
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.jobs)
+
+
+def available_memory_gb():
+    """Free physical memory in GB, or None if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1024 ** 3
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    return None
+
+
+class Scheduler:
+    """Runs queued jobs on warm sessions, up to ``max_parallel`` at a time.
+
+    ``thread_budget`` is split evenly between the parallel slots and passed
+    to hbatch as ``-j``. A job is only started while the memory reserved by
+    running jobs (``memory_gb``, defaulting to ``job_memory_gb``) stays under
+    ``ram_ceiling_gb`` and the machine still reports that much free.
+
+    With a ``metrics`` store, the process tree of every running job is
+    sampled every ``sample_interval`` seconds and a resource summary is
+    logged and stored when the job ends.
+
+    Failed jobs are classified (see ``failures.classify``). Transient
+    failures such as running out of memory or licenses are re-queued with
+    exponential backoff, up to ``max_job_retries`` times.
+
+    ``resolve_install`` maps a job's pinned ``houdini`` build to the
+    HoudiniInstall its sessions are acquired with.
+
+    With ``validate_outputs`` a job with a known output path is only done
+    once every frame it should have written is on disk, non-empty and not
+    truncated. The files are hashed on ``hash_workers`` threads and a
+    checksum manifest is written next to them (see validate.py).
+
+    A job with ``depends_on`` starts once those jobs are done, and fails
+    if one of them fails. A chunked job with ``pipeline`` starts as soon
+    as its inputs are running and renders each chunk once the inputs have
+    written the same frames.
+
+    A job that writes files starts only if its output volume keeps
+    ``min_free_gb`` free after the job and the running jobs on the same
+    volume have written what they are expected to. Its size comes from
+    the manifest of an earlier run or files already on disk, and from its
+    first frames once it runs; a job that will not fit is held as
+    ``disk_full`` and queued again once the volume has room. At most
+    ``writers_per_volume`` jobs write to one volume at a time.
+    """
+
+    def __init__(self, pool, queue, max_parallel=2, thread_budget=HBATCH_THREADS,
+                 ram_ceiling_gb=None, job_memory_gb=8, on_output=None, on_update=None,
+                 on_chunk=None, max_chunk_retries=2, on_progress=None, metrics=None,
+                 sample_interval=1.0, max_job_retries=3, retry_base=30,
+                 resolve_install=None, validate_outputs=True, hash_workers=4, min_free_gb=5,
+                 writers_per_volume=None):
+        self.pool = pool
+        self.queue = queue
+        self.max_parallel = max_parallel
+        self.thread_budget = thread_budget
+        self.ram_ceiling_gb = ram_ceiling_gb
+        self.job_memory_gb = job_memory_gb
+        self.on_output = on_output
+        self.on_update = on_update
+        self.on_chunk = on_chunk
+        self.on_progress = on_progress
+        # job id -> ProgressTracker of running jobs
+        self.progress = {}
+        self.max_chunk_retries = max_chunk_retries
+        self.max_job_retries = max_job_retries
+        # Seconds before the first retry; doubled for every further attempt
+        self.retry_base = retry_base
+        self.resolve_install = resolve_install
+        self.validate_outputs = validate_outputs
+        self.hash_workers = hash_workers
+        self.min_free_gb = min_free_gb
+        self.writers_per_volume = writers_per_volume
+        # job id -> (volume, bytes to write) of queued jobs, so the disk is not rescanned
+        # on every dispatch
+        self._disk_plans = {}
+        self.metrics = metrics
+        self.sample_interval = sample_interval
+        # job id -> JobTelemetry of running jobs
+        self.telemetry = {}
+        self.paused = False
+        self.running = {}
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def threads_per_job(self):
+        return max(1, self.thread_budget // max(1, self.max_parallel))
+
+    def start(self):
+        self._thread = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop dispatching. Jobs interrupted by the shutdown keep their running state."""
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def pause(self):
+        """Stop starting new jobs; running jobs carry on."""
+        with self._cond:
+            self.paused = True
+
+    def resume(self):
+        with self._cond:
+            self.paused = False
+            self._cond.notify_all()
+
+    def wake(self):
+        """Re-check the queue, e.g. after jobs were added or re-prioritised."""
+        with self._cond:
+            self._cond.notify_all()
+
+    def cancel(self, job):
+        """Cancel a queued job or terminate a running one."""
+        with self._cond:
+            entry = self.running.get(job.id)
+            if entry is None:
+                if job.state not in FINISHED_STATES:
+                    self.queue.set_state(job, CANCELLED)
+                    self._notify(job)
+                return
+            entry["cancelled"] = True
+        self._terminate(entry)
+
+    def _terminate(self, entry):
+        with self._cond:
+            session = entry["session"]
+            chunked = entry.get("chunked")
+        if chunked:
+            chunked.cancel()
+        if session:
+            session.terminate()
+
+    def hold(self, job):
+        if job.state == QUEUED:
+            self.queue.set_state(job, HELD)
+            self._notify(job)
+
+    def release(self, job):
+        if job.state == HELD:
+            self._disk_plans.pop(job.id, None)
+            self.queue.set_state(job, QUEUED)
+            self._notify(job)
+            self.wake()
+
+    def _memory_for(self, job):
+        return job.memory_gb or self.job_memory_gb
+
+    def _fits_in_memory(self, job):
+        if self.ram_ceiling_gb is None:
+            return True
+        reserved = sum(entry["memory"] for entry in self.running.values())
+        needed = self._memory_for(job)
+        if reserved and reserved + needed > self.ram_ceiling_gb:
+            return False
+        available = available_memory_gb()
+        # Always allow one job so a single oversized job cannot block the queue
+        return not reserved or available is None or available >= needed
+
+    def _disk_plan(self, job):
+        """(volume, bytes) a job will write, with None bytes when there is nothing to go by."""
+        plan = self._disk_plans.get(job.id)
+        if plan is None:
+            try:
+                size = file_size_estimate(job.output_pattern, job.frame_range)
+                needed = bytes_needed(job.output_pattern, job.frame_range, size) if size else None
+                plan = (output_volume(job.output_pattern), needed)
+            except (OSError, ValueError):
+                plan = (None, None)
+            self._disk_plans[job.id] = plan
+        return plan
+
+    def _disk_reserved(self, volume, exclude=None):
+        """Bytes the running jobs on ``volume`` are still expected to write."""
+        reserved = 0
+        for job_id, entry in self.running.items():
+            disk = entry.get("disk")
+            if job_id == exclude or not disk or disk[0] != volume or not disk[1]:
+                continue
+            tracker = self.progress.get(job_id)
+            if tracker is not None and tracker.total:
+                left = max(0, tracker.total - tracker.frames_done)
+                reserved += disk[1] * left / max(1, tracker.total - disk[2])
+            else:
+                reserved += disk[1]
+        return reserved
+
+    def _disk_shortfall(self, volume, needed, exclude=None):
+        """Why ``needed`` more bytes do not fit on ``volume``, or None if they do."""
+        free = free_bytes(volume)
+        if free is None or not needed:
+            return None
+        keep = self.min_free_gb * GB
+        if free - self._disk_reserved(volume, exclude) - needed >= keep:
+            return None
+        return (f"Needs {format_bytes(needed)} on {volume}, {format_bytes(free)} free "
+                f"(keeping {self.min_free_gb:g} GB free)")
+
+    def _fits_on_disk(self, job):
+        """(fits, reason to hold the job) for writing a job's output next to the running jobs."""
+        if not job.output_pattern:
+            return True, None
+        volume, needed = self._disk_plan(job)
+        if volume is None:
+            return True, None
+        writers = [entry for entry in self.running.values()
+                   if entry.get("disk") and entry["disk"][0] == volume]
+        if self.writers_per_volume and len(writers) >= self.writers_per_volume:
+            return False, None
+        shortfall = self._disk_shortfall(volume, needed)
+        if shortfall is None:
+            return True, None
+        # The running writers may finish under their estimate or fail; hold the job only
+        # once it does not fit with the volume to itself
+        return False, None if writers else shortfall
+
+    def _disk_freed(self):
+        """Jobs held for disk space that now fit on their volume."""
+        freed = []
+        for job in self.queue.snapshot():
+            if job.state != HELD or job.failure != DISK_FULL:
+                continue
+            volume, needed = self._disk_plan(job)
+            if volume is None or self._disk_shortfall(volume, needed) is None:
+                freed.append(job)
+        return freed
+
+    def _dispatch_loop(self):
+        while True:
+            blocked = []
+            full = []
+            with self._cond:
+                if self._stopped:
+                    return
+                freed = self._disk_freed()
+                job = None
+                if not self.paused and len(self.running) < self.max_parallel:
+                    for candidate in self.queue.pending():
+                        ready, failed = self._inputs_ready(candidate)
+                        if failed is not None:
+                            blocked.append((candidate, failed))
+                        elif ready and self._fits_in_memory(candidate):
+                            fits, shortfall = self._fits_on_disk(candidate)
+                            if shortfall:
+                                full.append((candidate, shortfall))
+                            elif fits:
+                                job = candidate
+                                break
+                if job is None and not blocked and not full and not freed:
+                    self._cond.wait(self._idle_wait())
+                    continue
+                if job is not None:
+                    volume, needed = self._disk_plans.pop(job.id, (None, None))
+                    self.running[job.id] = {"session": None, "cancelled": False,
+                                            "memory": self._memory_for(job),
+                                            "disk": (volume, needed, 0) if volume else None}
+                    self.queue.set_state(job, RUNNING)
+            for candidate, failed in blocked:
+                self.queue.set_state(candidate, FAILED, f"Input {failed.name} {failed.state}",
+                                     DEPENDENCY)
+                self._notify(candidate)
+            for candidate, shortfall in full:
+                self.queue.set_state(candidate, HELD, shortfall, DISK_FULL)
+                self._notify(candidate)
+            for candidate in freed:
+                self.queue.set_state(candidate, QUEUED)
+                self._notify(candidate)
+            if job is not None:
+                self._notify(job)
+                threading.Thread(target=self._run_job, args=(job,), daemon=True).start()
+
+    def _inputs_ready(self, job):
+        """(ready, failed input) for the jobs ``job`` depends on."""
+        for dep in self.queue.dependencies(job):
+            if dep.state in (FAILED, CANCELLED):
+                return False, dep
+            if dep.state == DONE or job.pipeline and job.chunked and dep.state == RUNNING:
+                continue
+            return False, None
+        return True, None
+
+    def _inputs_rendered(self, job, chunk):
+        """True once every input of a pipelined job has written the frames of ``chunk``."""
+        frames = set(frame_numbers((chunk.start, chunk.end, chunk.step)))
+        for dep in self.queue.dependencies(job):
+            if dep.state == DONE:
+                continue
+            if dep.state in (FAILED, CANCELLED):
+                raise SessionError(f"Input {dep.name} {dep.state}")
+            if dep.state != RUNNING:
+                raise SessionError(f"Input {dep.name} was queued again")
+            if not dep.frame_range:
+                return False
+            needed = frames & set(frame_numbers(dep.frame_range))
+            rendered = set()
+            for start, end in self.queue.done_chunks(dep.id):
+                rendered.update(frame_numbers((start, end, dep.frame_range[2])))
+            if dep.resumable and not needed <= rendered:
+                # Frames a resumed cache skips were already on disk
+                rendered |= find_valid_frames(dep.output_pattern, dep.frame_range,
+                                              dep.hip_mtime or 0,
+                                              known_sizes=self._known_sizes(dep))
+            if not needed <= rendered:
+                return False
+            if dep.output_pattern and "{frame" in dep.output_pattern:
+                for frame in needed:
+                    try:
+                        if not os.path.getsize(output_path(dep.output_pattern, frame)):
+                            return False
+                    except OSError:
+                        return False
+        return True
+
+    def _idle_wait(self):
+        """Seconds to sleep when nothing can start: until the next retry is due, at most 5."""
+        due = [job.retry_at for job in self.queue.snapshot()
+               if job.state == QUEUED and job.retry_at]
+        if not due:
+            return 5
+        return min(5, max(0.05, min(due) - time.time()))
+
+    def _run_job(self, job):
+        if job.resumable:
+            self._resume_job(job)
+            return
+        if job.chunked:
+            ranges = self._checkpoint_ranges(job)
+            if ranges == []:
+                self._finish_unrendered(job, DONE)
+            else:
+                self._run_chunked_job(job, ranges)
+            return
+        entry = self.running[job.id]
+        threads = job.threads or self.threads_per_job()
+        total = len(frame_numbers(job.frame_range)) if job.frame_range else None
+        tracker = self._track(job, total)
+        telemetry = self._start_telemetry(job, entry)
+        session = None
+        # The last lines of output, to classify a failure by
+        tail = collections.deque(maxlen=50)
+        errors = []
+        try:
+            session = self.pool.acquire(job.hip_path, threads=threads,
+                                        install=self._install_for(job))
+            with self._cond:
+                entry["session"] = session
+                cancelled = entry["cancelled"]
+            if cancelled:
+                raise SessionError("Cancelled before start")
+            telemetry.lane_started(None)
+
+            def log_output(line, is_error=False, at=None):
+                tail.append(line)
+                if ERROR_LINE.match(line):
+                    errors.append(line.strip())
+                if self.on_output:
+                    self.on_output(job, line, is_error)
+                telemetry.feed(line, at=at)
+                if tracker.feed(line, at):
+                    self._notify_progress(job, tracker)
+
+            session.run(job.command, on_output=log_output)
+        except Exception as e:
+            returncode = session.returncode if session else None
+            if session:
+                self.pool.discard(session)
+            if self._stopped:
+                # Shutting down: leave the job as running so it is re-queued on load
+                telemetry.stop()
+                return
+            if entry["cancelled"]:
+                self._set_stopped(job, entry)
+            else:
+                self._handle_failure(job, str(e), classify(returncode, tail, str(e)))
+        else:
+            self.pool.release(session)
+            if entry["cancelled"]:
+                self._set_stopped(job, entry)
+            elif errors:
+                self._handle_failure(job, errors[-1], classify(None, tail))
+            else:
+                self._finish_rendered(job, tracker)
+        finally:
+            with self._cond:
+                self.running.pop(job.id, None)
+                self.progress.pop(job.id, None)
+                self._cond.notify_all()
+        self._stop_telemetry(job, telemetry)
+        self._notify(job)
+
+    def _resume_job(self, job):
+        """Render only the frames that have no valid output on disk."""
+        try:
+            ranges = missing_frame_ranges(job.output_pattern, job.frame_range,
+                                          job.hip_mtime or 0,
+                                          known_sizes=self._known_sizes(job))
+        except Exception as e:
+            ranges = None
+            error = str(e)
+        total = len(frame_numbers(job.frame_range))
+        if ranges:
+            missing = sum(len(frame_numbers((start, end, job.frame_range[2])))
+                          for start, end in ranges)
+            self._log(job, f"Resuming: {missing} of {total} frames missing\n")
+            self._run_chunked_job(job, ranges)
+            return
+        if ranges is None:
+            self._finish_unrendered(job, FAILED, f"Could not check existing frames: {error}")
+        else:
+            self._log(job, f"All {total} frames already exist, nothing to render\n")
+            self._finish_unrendered(job, DONE)
+
+    def _known_sizes(self, job):
+        """Sizes of a job's frames that the manifest of an earlier run found complete."""
+        return manifest_sizes(load_manifest(manifest_path(job.output_pattern)))
+
+    def _finish_unrendered(self, job, state, error=None):
+        """Finish a job that turned out to need no rendering (or could not start)."""
+        with self._cond:
+            self.running.pop(job.id, None)
+            self._cond.notify_all()
+        self.queue.set_state(job, state, error)
+        self._notify(job)
+
+    def _finish_rendered(self, job, tracker):
+        """Mark a job whose render succeeded done, unless its output fails validation."""
+        tracker.finish()
+        self._notify_progress(job, tracker)
+        error = self._validate(job)
+        if error:
+            self.queue.set_state(job, FAILED, error, BAD_OUTPUT)
+        else:
+            self.queue.set_state(job, DONE)
+
+    def _validate(self, job):
+        """Check a job's output files and write their manifest; returns an error or None."""
+        pattern = job.output_pattern
+        if not self.validate_outputs or not can_validate(pattern, job.frame_range):
+            return None
+        path = manifest_path(pattern)
+        try:
+            manifest = validate_outputs(pattern, job.frame_range, job.hip_mtime,
+                                        workers=self.hash_workers, previous=load_manifest(path))
+        except (OSError, ValueError) as e:
+            self._log(job, f"Could not validate the output files: {e}\n")
+            return None
+        self._log(job, f"Checked {len(manifest['files'])} output files "
+                       f"({format_bytes(manifest['total_bytes'])}), hashed {manifest['hashed']} "
+                       f"in {manifest['hash_seconds']:.1f}s\n")
+        manifest.update(job=job.id, hip=job.hip_path, node=job.node_path)
+        try:
+            write_manifest(manifest, path)
+        except OSError as e:
+            self._log(job, f"Could not write the manifest {path}: {e}\n")
+        if manifest["warnings"]:
+            self._log(job, f"Output check warning: {format_problems(manifest, key='warnings')}\n")
+        if manifest["problems"]:
+            return f"Output check failed: {format_problems(manifest)}"
+        return None
+
+    def _install_for(self, job):
+        """The install a job is pinned to, or None for the pool's default build."""
+        if not job.houdini or self.resolve_install is None:
+            return None
+        install = self.resolve_install(job.houdini)
+        if install is None:
+            raise SessionError(f"Houdini {job.houdini} is not installed on this machine")
+        return install
+
+    def _checkpoint_ranges(self, job):
+        """Frame ranges of a chunked job that the journal does not record as done."""
+        done = self.queue.done_chunks(job.id)
+        if not done:
+            return None
+        step = job.frame_range[2]
+        rendered = set()
+        for start, end in done:
+            rendered.update(frame_numbers((start, end, step)))
+        remaining = [frame for frame in frame_numbers(job.frame_range) if frame not in rendered]
+        self._log(job, f"Journal: {len(rendered)} frames already rendered, "
+                       f"{len(remaining)} to go\n")
+        return collapse_frames(remaining, step)
+
+    def _set_stopped(self, job, entry):
+        """State of a job that was terminated: held if it ran out of disk, else cancelled."""
+        if entry.get("hold"):
+            self.queue.set_state(job, HELD, entry["hold"], DISK_FULL)
+        else:
+            self.queue.set_state(job, CANCELLED)
+
+    def _handle_failure(self, job, error, failure):
+        """Retry a transient failure after a backoff, or mark the job failed."""
+        if is_transient(failure) and job.attempts <= self.max_job_retries:
+            delay = retry_delay(job.attempts, self.retry_base)
+            self._log(job, f"Attempt {job.attempts} failed ({failure}): {error}. "
+                           f"Retrying in {delay:.0f}s\n")
+            self.queue.retry(job, error, failure, delay)
+        else:
+            self.queue.set_state(job, FAILED, error, failure)
+
+    def _log(self, job, message):
+        if self.on_output:
+            self.on_output(job, message, False)
+
+    def _run_chunked_job(self, job, ranges=None):
+        entry = self.running[job.id]
+
+        def log_output(chunk, line, is_error=False, at=None):
+            if self.on_output:
+                self.on_output(job, line, is_error)
+            telemetry.feed(line, chunk.index, at)
+            if tracker.feed(line, at):
+                self._notify_progress(job, tracker)
+
+        def chunk_update(chunk):
+            self.queue.record_chunk(job, chunk)
+            if chunk.state == RUNNING:
+                telemetry.lane_started(chunk.index)
+            if self.on_chunk:
+                self.on_chunk(job, chunk)
+
+        # Without a chunk size each missing range is rendered whole, one at a time
+        chunk_size = job.chunk_size or len(frame_numbers(job.frame_range))
+        workers = job.chunk_workers if job.chunk_size else 1
+        ready = None
+        if job.pipeline and job.depends_on:
+            def ready(chunk):
+                return self._inputs_rendered(job, chunk)
+        try:
+            install = self._install_for(job)
+        except SessionError as e:
+            self._finish_unrendered(job, FAILED, str(e))
+            return
+        chunked = ChunkedRender(self.pool, job.hip_path, job.command, job.frame_range,
+                                chunk_size, workers=workers,
+                                threads=job.threads or self.threads_per_job(),
+                                max_retries=self.max_chunk_retries,
+                                retry_base=self.retry_base,
+                                install=install,
+                                on_output=log_output, on_chunk=chunk_update,
+                                ranges=ranges, ready=ready)
+        tracker = self._track(job, sum(chunk.frame_count for chunk in chunked.chunks))
+        telemetry = self._start_telemetry(job, entry)
+        with self._cond:
+            entry["chunked"] = chunked
+            if entry["cancelled"]:
+                chunked.cancel()
+        failure = None
+        try:
+            ok = chunked.run()
+        except Exception as e:
+            ok = False
+            error = str(e)
+        else:
+            failed = chunked.failed_chunks()
+            error = None
+            if failed:
+                error = (f"{len(failed)} of {len(chunked.chunks)} chunks failed, "
+                         f"first: {failed[0].error}")
+                # Retrying the job only makes sense if every chunk failed for a transient reason
+                failures = [chunk.failure for chunk in failed]
+                permanent = [failure for failure in failures if not is_transient(failure)]
+                failure = permanent[0] if permanent else failures[0]
+        finally:
+            with self._cond:
+                self.running.pop(job.id, None)
+                self.progress.pop(job.id, None)
+                self._cond.notify_all()
+        if self._stopped:
+            telemetry.stop()
+            return
+        if entry["cancelled"]:
+            self._set_stopped(job, entry)
+        elif ok:
+            self._finish_rendered(job, tracker)
+        elif failure == DEPENDENCY and self._inputs_ready(job)[1] is None:
+            # An input went back to the queue; start over (from the journal) once it runs again
+            self._log(job, f"{error}; waiting for its inputs again\n")
+            self.queue.retry(job, error, failure, 0)
+        else:
+            self._handle_failure(job, error or "Chunked render failed", failure or ERROR)
+        self._stop_telemetry(job, telemetry)
+        self._notify(job)
+
+    def _track(self, job, total_frames):
+        tracker = ProgressTracker(total_frames)
+        with self._cond:
+            self.progress[job.id] = tracker
+        return tracker
+
+    def _start_telemetry(self, job, entry):
+        def job_pids():
+            sessions = [entry["session"]]
+            if entry.get("chunked"):
+                sessions.extend(entry["chunked"].sessions())
+            return [session.process.pid for session in sessions
+                    if session and session.process]
+
+        telemetry = JobTelemetry(job, job_pids, self.sample_interval, self.metrics)
+        with self._cond:
+            self.telemetry[job.id] = telemetry
+        return telemetry.start()
+
+    def _stop_telemetry(self, job, telemetry):
+        with self._cond:
+            self.telemetry.pop(job.id, None)
+        try:
+            summary = telemetry.stop(job.state)
+        except Exception as e:
+            self._log(job, f"Could not record resource usage: {e}\n")
+            return
+        if telemetry.store_error:
+            self._log(job, f"Resource usage was not stored: {telemetry.store_error}\n")
+        self._log(job, f"Resources: {format_summary(summary)}\n")
+
+    def _check_disk(self, job, tracker):
+        """Once a job has written its first frames, hold it if the rest will not fit."""
+        pattern = job.output_pattern
+        if (tracker.finished or tracker.frames_done < ESTIMATE_FRAMES or not pattern
+                or "{frame" not in pattern or not job.frame_range):
+            return
+        with self._cond:
+            entry = self.running.get(job.id)
+            if entry is None or entry.get("disk_checked"):
+                return
+            entry["disk_checked"] = True
+            volume = entry["disk"][0] if entry.get("disk") else None
+        sizes = file_sizes(output_path(pattern, frame) for frame in sorted(tracker.frames))
+        sizes = [size for size in sizes if size]
+        if not sizes:
+            return
+        try:
+            volume = volume or output_volume(pattern)
+            needed = bytes_needed(pattern, job.frame_range, statistics.median(sizes))
+        except (OSError, ValueError):
+            return
+        with self._cond:
+            entry["disk"] = (volume, needed, tracker.frames_done)
+            shortfall = self._disk_shortfall(volume, needed, exclude=job.id)
+            if shortfall is None or entry["cancelled"]:
+                return
+            entry["cancelled"] = True
+            entry["hold"] = shortfall
+        self._log(job, f"Stopping: the remaining frames need {format_bytes(needed)} on "
+                       f"{volume}, which would leave less than {self.min_free_gb:g} GB free\n")
+        self._terminate(entry)
+
+    def _notify_progress(self, job, tracker):
+        self._check_disk(job, tracker)
+        if self.on_progress:
+            self.on_progress(job, tracker)
+
+    def _notify(self, job):
+        if self.on_update:
+            self.on_update(job)
@@ -0,0 +1,103 @@
+"""Append-only journal of job and chunk state changes, replayed after a restart."""
+import json
+import os
+import threading
+import time
+
+
+class Journal:
+    """JSON lines file recording every change to the render queue.
+
+    Each line is one event:
+
+    * ``{"event": "add", "job": {...}}`` with the complete job
+    * ``{"event": "update", "id": ..., "fields": {...}}`` for state, priority, retries
+    * ``{"event": "remove", "id": ...}``
+    * ``{"event": "chunk", "id": ..., "start", "end", "state", "attempts", "failure"}``
+
+    Lines are flushed and fsynced as they are written, so a crash loses at
+    most the event being written; a torn last line is ignored on replay.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = None
+
+    def _append(self, event):
+        event["t"] = time.time()
+        line = json.dumps(event) + "\n"
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def job_added(self, job):
+        self._append({"event": "add", "job": job.to_dict()})
+
+    def job_updated(self, job, *fields):
+        self._append({"event": "update", "id": job.id,
+                      "fields": {field: getattr(job, field) for field in fields}})
+
+    def job_removed(self, job_id):
+        self._append({"event": "remove", "id": job_id})
+
+    def chunk_changed(self, job_id, chunk):
+        self._append({"event": "chunk", "id": job_id, "start": chunk.start, "end": chunk.end,
+                      "state": chunk.state, "attempts": chunk.attempts,
+                      "failure": getattr(chunk, "failure", None)})
+
+    def replay(self):
+        """Fold the journal into (jobs, chunks).
+
+        ``jobs`` maps job id to the latest job dict, in the order jobs were
+        added. ``chunks`` maps job id to {(start, end): state}.
+        """
+        jobs = {}
+        chunks = {}
+        if not os.path.exists(self.path):
+            return jobs, chunks
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                kind = event.get("event")
+                if kind == "add":
+                    jobs[event["job"]["id"]] = event["job"]
+                elif kind == "update" and event["id"] in jobs:
+                    jobs[event["id"]].update(event["fields"])
+                elif kind == "remove":
+                    jobs.pop(event["id"], None)
+                    chunks.pop(event["id"], None)
+                elif kind == "chunk" and event["id"] in jobs:
+                    key = (event["start"], event["end"])
+                    chunks.setdefault(event["id"], {})[key] = event["state"]
+        return jobs, chunks
+
+    def compact(self, jobs, chunks):
+        """Rewrite the journal with only ``jobs`` and their chunk states."""
+        tmp_path = self.path + ".tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                now = time.time()
+                for job in jobs:
+                    f.write(json.dumps({"event": "add", "job": job.to_dict(), "t": now}) + "\n")
+                    for (start, end), state in chunks.get(job.id, {}).items():
+                        f.write(json.dumps({"event": "chunk", "id": job.id, "start": start,
+                                            "end": end, "state": state, "t": now}) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            os.replace(tmp_path, self.path)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,50 @@
+"""Thread-safe log pipeline: reader threads enqueue, the UI drains in batches."""
+import logging
+import logging.handlers
+import queue
+
+
+class LogPipeline:
+    """Collects log messages from any thread and streams them to a rotating file.
+
+    Messages are queued for the UI, which calls ``drain`` on a timer. If
+    more than ``max_batch`` messages piled up since the last drain, only
+    the newest ones are returned along with a count of the skipped ones;
+    the file always receives everything.
+    """
+
+    def __init__(self, log_path=None, max_batch=2000, max_bytes=20 * 1024 * 1024,
+                 backup_count=5):
+        self.max_batch = max_batch
+        self.queue = queue.Queue()
+        self.logger = None
+        if log_path:
+            self.logger = logging.getLogger(f"houdini_render.log.{id(self)}")
+            self.logger.setLevel(logging.INFO)
+            self.logger.propagate = False
+            handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            self.logger.addHandler(handler)
+
+    def put(self, message):
+        self.queue.put(message)
+        if self.logger:
+            self.logger.info(message.rstrip("\n"))
+
+    def drain(self):
+        """Return (messages, skipped) queued since the last call."""
+        messages = []
+        while True:
+            try:
+                messages.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        skipped = max(0, len(messages) - self.max_batch)
+        return messages[skipped:], skipped
+
+    def close(self):
+        if self.logger:
+            for handler in list(self.logger.handlers):
+                handler.close()
+                self.logger.removeHandler(handler)
@@ -0,0 +1,68 @@
+"""Registry of the node types the tool can scan for and render."""
+
+# Houdini node type categories, as named by hou.NodeTypeCategory.name()
+SOP = "Sop"
+DRIVER = "Driver"
+LOP = "Lop"
+
+
+class NodeTypeSpec:
+    """How to find a node type in a scene and how to render it with hbatch."""
+
+    def __init__(self, name, categories, command, output_parm=None):
+        self.name = name
+        self.categories = tuple(categories)
+        # hscript render command, formatted with the node path
+        self.command = command
+        # Parameter holding the output file, evaluated per frame during scans
+        self.output_parm = output_parm
+
+    def render_command(self, path):
+        return self.command.format(path=path)
+
+    def to_dict(self):
+        return {"categories": list(self.categories), "output_parm": self.output_parm}
+
+
+NODE_TYPES = {spec.name: spec for spec in (
+    NodeTypeSpec("filecache::2.0", (SOP,), "render -V {path}/render", "sopoutput"),
+    NodeTypeSpec("usdrender_rop", (LOP,), "render -V {path}", "outputimage"),
+    NodeTypeSpec("rop_geometry", (SOP,), "render -V {path}", "sopoutput"),
+    NodeTypeSpec("rop_alembic", (SOP,), "render -V {path}", "filename"),
+    # The same ROPs in an /out network are Driver nodes with their own type names
+    NodeTypeSpec("geometry", (DRIVER,), "render -V {path}", "sopoutput"),
+    NodeTypeSpec("alembic", (DRIVER,), "render -V {path}", "filename"),
+    NodeTypeSpec("usdrender", (DRIVER,), "render -V {path}", "outputimage"),
+    NodeTypeSpec("karma", (DRIVER,), "render -V {path}", "picture"),
+)}
+
+
+# Parms that point a node at another node whose result it uses, e.g. the network a ROP
+# renders; followed when looking for the caches a node depends on
+NODE_REFERENCE_PARMS = ("soppath", "loppath", "objpath1")
+
+# File parms of the node types that read back what another node wrote, by node type.
+# Only these are evaluated when matching the files a node reads against cache outputs.
+FILE_READERS = {
+    "file": ("file",),
+    "filemerge": ("file",),
+    "alembic": ("fileName",),
+    "filecache::2.0": ("file",),
+    "sublayer": ("filepath1",),
+    "reference::2.0": ("filepath1",),
+}
+
+
+def is_supported(node_type):
+    return node_type in NODE_TYPES
+
+
+def render_command(node_type, path):
+    """Return the hscript command that renders ``path``; raises KeyError if unsupported."""
+    return NODE_TYPES[node_type].render_command(path)
+
+
+def unsupported_message(node_type):
+    lines = [f"Node type '{node_type}' is not supported.", "Supported types are:"]
+    lines.extend(f"• {name}" for name in NODE_TYPES)
+    return "\n".join(lines)
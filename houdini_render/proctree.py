@@ -0,0 +1,225 @@
+"""Launch hcmd in its own process group and stop exactly that process tree.
+
+On Linux and macOS every session starts a new process session, so hbatch
+and the husk or karma_cc processes it spawns share one process group that
+can be signalled as a whole. On Windows the process is assigned to a job
+object that terminates its whole tree, and that also kills it when this
+tool exits.
+"""
+import os
+import signal
+import subprocess
+import threading
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CREATE_NO_WINDOW = getattr(subprocess, "CREATE_NO_WINDOW", 0)
+CREATE_NEW_PROCESS_GROUP = getattr(subprocess, "CREATE_NEW_PROCESS_GROUP", 0)
+
+if os.name == "nt":
+    import ctypes
+    from ctypes import wintypes
+
+    _kernel32 = ctypes.WinDLL("kernel32", use_last_error=True)
+    _kernel32.CreateJobObjectW.restype = wintypes.HANDLE
+    _kernel32.CreateJobObjectW.argtypes = (ctypes.c_void_p, wintypes.LPCWSTR)
+    _kernel32.SetInformationJobObject.argtypes = (wintypes.HANDLE, ctypes.c_int,
+                                                  ctypes.c_void_p, wintypes.DWORD)
+    _kernel32.AssignProcessToJobObject.argtypes = (wintypes.HANDLE, wintypes.HANDLE)
+    _kernel32.TerminateJobObject.argtypes = (wintypes.HANDLE, wintypes.UINT)
+    _kernel32.CloseHandle.argtypes = (wintypes.HANDLE,)
+
+    JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE = 0x2000
+    JOB_OBJECT_EXTENDED_LIMIT_INFORMATION = 9
+
+    class _IoCounters(ctypes.Structure):
+        _fields_ = [(name, ctypes.c_ulonglong) for name in (
+            "ReadOperationCount", "WriteOperationCount", "OtherOperationCount",
+            "ReadTransferCount", "WriteTransferCount", "OtherTransferCount")]
+
+    class _BasicLimits(ctypes.Structure):
+        _fields_ = [("PerProcessUserTimeLimit", ctypes.c_int64),
+                    ("PerJobUserTimeLimit", ctypes.c_int64),
+                    ("LimitFlags", wintypes.DWORD),
+                    ("MinimumWorkingSetSize", ctypes.c_size_t),
+                    ("MaximumWorkingSetSize", ctypes.c_size_t),
+                    ("ActiveProcessLimit", wintypes.DWORD),
+                    ("Affinity", ctypes.c_size_t),
+                    ("PriorityClass", wintypes.DWORD),
+                    ("SchedulingClass", wintypes.DWORD)]
+
+    class _ExtendedLimits(ctypes.Structure):
+        _fields_ = [("BasicLimitInformation", _BasicLimits),
+                    ("IoInfo", _IoCounters),
+                    ("ProcessMemoryLimit", ctypes.c_size_t),
+                    ("JobMemoryLimit", ctypes.c_size_t),
+                    ("PeakProcessMemoryUsed", ctypes.c_size_t),
+                    ("PeakJobMemoryUsed", ctypes.c_size_t)]
+
+
+def proc_stat(pid):
+    """Parent pid, CPU clock ticks and RSS pages of a process from /proc/<pid>/stat."""
+    with open(f"/proc/{pid}/stat", "r") as f:
+        data = f.read()
+    # The command name is in parentheses and may itself contain spaces
+    fields = data[data.rindex(")") + 2:].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[21])
+
+
+def process_tree(pids):
+    """The given pids and all of their descendants."""
+    pids = [pid for pid in pids if pid]
+    if psutil is not None:
+        tree = set()
+        for pid in pids:
+            try:
+                process = psutil.Process(pid)
+                tree.add(pid)
+                tree.update(child.pid for child in process.children(recursive=True))
+            except psutil.Error:
+                pass
+        return tree
+    if not os.path.isdir("/proc"):
+        return set(pids)
+    children = {}
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            ppid = proc_stat(int(name))[0]
+        except (OSError, ValueError, IndexError):
+            continue
+        children.setdefault(ppid, []).append(int(name))
+    tree = set()
+    stack = list(pids)
+    while stack:
+        pid = stack.pop()
+        if pid in tree:
+            continue
+        tree.add(pid)
+        stack.extend(children.get(pid, ()))
+    return tree
+
+
+def pid_alive(pid):
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).status() != psutil.STATUS_ZOMBIE
+        except psutil.Error:
+            return False
+    if os.path.isdir("/proc"):
+        try:
+            with open(f"/proc/{pid}/stat", "r") as f:
+                return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+        except (OSError, IndexError):
+            return False
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def popen_options():
+    """Keyword arguments for subprocess.Popen that start a separate process group."""
+    if os.name == "nt":
+        return {"creationflags": CREATE_NO_WINDOW | CREATE_NEW_PROCESS_GROUP}
+    return {"start_new_session": True}
+
+
+class ProcessGroup:
+    """The tree of processes started by one Popen with ``popen_options()``."""
+
+    def __init__(self, process):
+        self.process = process
+        self._job = None
+        self._lock = threading.Lock()
+        if os.name == "nt":
+            self._job = self._create_job()
+
+    def _create_job(self):
+        job = _kernel32.CreateJobObjectW(None, None)
+        if not job:
+            return None
+        limits = _ExtendedLimits()
+        limits.BasicLimitInformation.LimitFlags = JOB_OBJECT_LIMIT_KILL_ON_JOB_CLOSE
+        _kernel32.SetInformationJobObject(job, JOB_OBJECT_EXTENDED_LIMIT_INFORMATION,
+                                          ctypes.byref(limits), ctypes.sizeof(limits))
+        # hcmd only starts hbatch once it reads a command, so its children are
+        # created after this and land in the job too
+        if not _kernel32.AssignProcessToJobObject(job, int(self.process._handle)):
+            _kernel32.CloseHandle(job)
+            return None
+        return job
+
+    def members(self):
+        """Pids of the processes still in the tree."""
+        return {pid for pid in process_tree([self.process.pid]) if pid_alive(pid)}
+
+    def signal(self, sig, pids=()):
+        """Send ``sig`` to the process group and to ``pids`` that left it."""
+        if os.name == "nt":
+            return
+        try:
+            os.killpg(self.process.pid, sig)
+        except (ProcessLookupError, PermissionError):
+            pass
+        for pid in pids:
+            try:
+                os.kill(pid, sig)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+    def kill(self, pids=None):
+        """Force-kill the whole tree."""
+        if pids is None:
+            pids = self.members()
+        with self._lock:
+            if self._job:
+                _kernel32.TerminateJobObject(self._job, 1)
+        if os.name == "nt":
+            if psutil is not None:
+                for pid in pids:
+                    try:
+                        psutil.Process(pid).kill()
+                    except psutil.Error:
+                        pass
+            elif self.process.poll() is None:
+                self.process.kill()
+        else:
+            self.signal(signal.SIGKILL, pids)
+        try:
+            self.process.wait(5)
+        except subprocess.TimeoutExpired:
+            pass
+
+    def stop(self, grace=10):
+        """Ask the tree to exit, then kill whatever is left after ``grace`` seconds.
+
+        The members are collected first: once hcmd exits, its children are
+        re-parented and can no longer be found through it. Windows has no
+        console to deliver a break signal to, so the tree is terminated
+        right away there.
+        """
+        pids = self.members()
+        if os.name != "nt":
+            self.signal(signal.SIGTERM, pids)
+            deadline = time.time() + grace
+            while time.time() < deadline:
+                self.process.poll()
+                if not any(pid_alive(pid) for pid in pids):
+                    self.process.wait()
+                    return True
+                time.sleep(0.1)
+        self.kill(pids)
+        return False
+
+    def close(self):
+        with self._lock:
+            if self._job:
+                _kernel32.CloseHandle(self._job)
+                self._job = None
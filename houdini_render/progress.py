@@ -0,0 +1,123 @@
+"""Turn render output into frames done, per-frame time, throughput and ETA."""
+import re
+import time
+
+# "ALF_PROGRESS 42%" from ROPs with Alfred-style progress enabled
+ALF_PROGRESS = re.compile(r"ALF_PROGRESS\s+(\d+(?:\.\d+)?)%")
+# husk/karma style "... 12 of 48 ..." or "Frame 12/48"
+FRAME_OF = re.compile(r"\bframe\s*:?\s*(-?\d+(?:\.\d+)?)\s*(?:of|/)\s*(\d+)", re.IGNORECASE)
+# render -V frame messages such as "Rendering frame 12" or "Wrote frame 12"
+FRAME_LINE = re.compile(r"\b(?:render(?:ing|ed)?|cook(?:ing|ed)?|writ(?:ing|e|ten)|wrote|saved?)"
+                        r"\s+frame\s+(-?\d+(?:\.\d+)?)", re.IGNORECASE)
+
+
+class ProgressTracker:
+    """Tracks progress of one job from its output lines.
+
+    Every distinct frame number that shows up in a frame message counts as
+    one frame done. ``ALF_PROGRESS`` percentages are used when they report
+    more progress than the frame messages do. Timing uses a rolling window
+    of the gaps between frame messages, so with parallel chunks it
+    reflects the combined throughput.
+    """
+
+    def __init__(self, total_frames=None, window=10):
+        self.total = total_frames
+        self.window = window
+        self.frames = set()
+        self.percent_reported = None
+        self.started = time.time()
+        self.last_frame_time = None
+        self.last_output = self.started
+        self.intervals = []
+        self.finished = False
+
+    def feed(self, line, at=None):
+        """Parse one output line printed at time ``at`` (default now); True if progress changed."""
+        now = at or time.time()
+        self.last_output = max(self.last_output, now)
+        match = ALF_PROGRESS.search(line)
+        if match:
+            percent = float(match.group(1))
+            changed = percent != self.percent_reported
+            self.percent_reported = percent
+            return changed
+        match = FRAME_OF.search(line) or FRAME_LINE.search(line)
+        if not match:
+            return False
+        frame = float(match.group(1))
+        if frame in self.frames:
+            return False
+        if self.total is None and match.re is FRAME_OF:
+            self.total = int(match.group(2))
+        self.frames.add(frame)
+        # Lines from remote workers arrive in batches, not always in order
+        last = self.last_frame_time or self.started
+        self.intervals.append(max(0.0, now - last))
+        self.intervals = self.intervals[-self.window:]
+        self.last_frame_time = max(last, now)
+        return True
+
+    @property
+    def frames_done(self):
+        if self.finished and self.total:
+            return self.total
+        done = len(self.frames)
+        if self.percent_reported is not None and self.total:
+            done = max(done, int(self.total * self.percent_reported / 100))
+        return min(done, self.total) if self.total else done
+
+    @property
+    def percent(self):
+        if self.total:
+            return 100.0 * self.frames_done / self.total
+        return self.percent_reported
+
+    @property
+    def seconds_per_frame(self):
+        if not self.intervals:
+            return None
+        return sum(self.intervals) / len(self.intervals)
+
+    @property
+    def frames_per_minute(self):
+        seconds = self.seconds_per_frame
+        return 60.0 / seconds if seconds else None
+
+    @property
+    def eta(self):
+        """Seconds until the remaining frames are done, if that can be estimated."""
+        seconds = self.seconds_per_frame
+        if seconds is None or not self.total:
+            return None
+        return max(0, self.total - self.frames_done) * seconds
+
+    def idle_seconds(self):
+        """Seconds since the job last printed anything."""
+        return time.time() - self.last_output
+
+    def finish(self):
+        """Mark every frame as done once the job succeeded."""
+        self.finished = True
+
+    def summary(self):
+        parts = []
+        if self.total:
+            parts.append(f"{self.frames_done}/{self.total}")
+        elif self.frames:
+            parts.append(f"{self.frames_done} frames")
+        if self.seconds_per_frame:
+            parts.append(f"{self.seconds_per_frame:.1f}s/f")
+            parts.append(f"{self.frames_per_minute:.1f} fpm")
+        if self.eta is not None and self.frames_done < (self.total or 0):
+            parts.append(f"ETA {format_duration(self.eta)}")
+        return " ".join(parts)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
@@ -0,0 +1,95 @@
+"""Work out which frames of a cache still need to be rendered."""
+import os
+import statistics
+
+
+def frame_numbers(frame_range):
+    start, end, step = frame_range
+    frames = []
+    frame = start
+    while frame <= end:
+        frames.append(frame)
+        frame += step
+    return frames
+
+
+def output_path(pattern, frame):
+    return pattern.format(frame=int(frame))
+
+
+def find_valid_frames(pattern, frame_range, hip_mtime, truncated_ratio=0.25,
+                      known_sizes=None):
+    """Return the set of frames whose output exists and looks complete.
+
+    A frame counts as valid if its file is non-empty and newer than the hip
+    file, and does not look truncated by an interrupted write; see
+    ``truncated_frames`` for ``truncated_ratio`` and ``known_sizes``.
+    """
+    sizes = {}
+    for frame in frame_numbers(frame_range):
+        try:
+            stat = os.stat(output_path(pattern, frame))
+        except OSError:
+            continue
+        if stat.st_size > 0 and stat.st_mtime >= hip_mtime:
+            sizes[frame] = stat.st_size
+    return set(sizes) - truncated_frames(sizes, truncated_ratio, known_sizes)
+
+
+def small_frames(sizes, truncated_ratio=0.25, neighbours=2):
+    """Frames of {frame: size} much smaller than the frames before them.
+
+    Each file is compared with the median of the ``neighbours`` files before
+    it (after it, for the first file), so a sim whose files grow or shrink
+    over the range is not flagged, only a sudden drop. This is a guess: a
+    sim that empties out legitimately drops too. With under 3 files
+    nothing is flagged.
+    """
+    if len(sizes) < 3:
+        return set()
+    frames = sorted(sizes)
+    small = set()
+    for index, frame in enumerate(frames):
+        nearby = frames[max(0, index - neighbours):index] or frames[1:1 + neighbours]
+        reference = statistics.median(sizes[other] for other in nearby)
+        if sizes[frame] < reference * truncated_ratio:
+            small.add(frame)
+    return small
+
+
+def shrunk_frames(sizes, known_sizes, truncated_ratio=0.25):
+    """Frames of {frame: size} below ``truncated_ratio`` of the size ``known_sizes`` records."""
+    return {frame for frame, size in sizes.items()
+            if known_sizes.get(frame) and size < known_sizes[frame] * truncated_ratio}
+
+
+def truncated_frames(sizes, truncated_ratio=0.25, known_sizes=None):
+    """Frames of {frame: size} to render again because they look cut short.
+
+    A frame ``known_sizes`` (e.g. an earlier manifest) has a size for is
+    trusted unless it shrank well below it; only the others fall back to
+    the ``small_frames`` guess.
+    """
+    known_sizes = known_sizes or {}
+    unknown = {frame for frame in small_frames(sizes, truncated_ratio)
+               if not known_sizes.get(frame)}
+    return shrunk_frames(sizes, known_sizes, truncated_ratio) | unknown
+
+
+def collapse_frames(frames, step=1):
+    """Group sorted frame numbers into contiguous (start, end) ranges."""
+    ranges = []
+    for frame in sorted(frames):
+        if ranges and frame - ranges[-1][1] == step:
+            ranges[-1][1] = frame
+        else:
+            ranges.append([frame, frame])
+    return [tuple(r) for r in ranges]
+
+
+def missing_frame_ranges(pattern, frame_range, hip_mtime, truncated_ratio=0.25,
+                         known_sizes=None):
+    """Frame ranges of ``frame_range`` that have no valid output on disk yet."""
+    valid = find_valid_frames(pattern, frame_range, hip_mtime, truncated_ratio, known_sizes)
+    missing = [frame for frame in frame_numbers(frame_range) if frame not in valid]
+    return collapse_frames(missing, frame_range[2])
@@ -0,0 +1,97 @@
+"""On-disk cache of scan results so unchanged hip files are not re-scanned."""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from .detection import detector_signature
+from .settings import write_file
+
+
+def file_hash(path, block_size=1024 * 1024):
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ScanCache:
+    """JSON index of scan results keyed by hip path, size and mtime.
+
+    With ``use_hash`` a file whose mtime changed but whose size and content
+    hash did not (e.g. a re-save or copy) still counts as a hit. Entries
+    written by a different detection script (``detector``) are ignored.
+    """
+
+    def __init__(self, path, use_hash=False, max_entries=2000):
+        self.path = path
+        self.use_hash = use_hash
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    self.entries = json.load(f).get("entries", {})
+            except (OSError, ValueError):
+                self.entries = {}
+
+    @staticmethod
+    def key(hip_path):
+        return os.path.normcase(os.path.abspath(hip_path))
+
+    def lookup(self, hip_path, detector=None):
+        """Return the cached node list for ``hip_path`` if it is still valid."""
+        detector = detector or detector_signature()
+        key = self.key(hip_path)
+        try:
+            stat = os.stat(key)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry or entry.get("detector") != detector:
+            return None
+        if entry["size"] != stat.st_size:
+            return None
+        if entry["mtime"] == stat.st_mtime:
+            return entry["nodes"]
+        if self.use_hash and entry.get("hash") and entry["hash"] == file_hash(key):
+            with self.lock:
+                entry["mtime"] = stat.st_mtime
+            self.save()
+            return entry["nodes"]
+        return None
+
+    def store(self, hip_path, nodes, detector=None):
+        key = self.key(hip_path)
+        stat = os.stat(key)
+        entry = {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime,
+            "hash": file_hash(key) if self.use_hash else None,
+            "detector": detector or detector_signature(),
+            "scanned_at": time.time(),
+            "nodes": nodes,
+        }
+        with self.lock:
+            self.entries[key] = entry
+            if len(self.entries) > self.max_entries:
+                oldest = sorted(self.entries, key=lambda k: self.entries[k]["scanned_at"])
+                for old_key in oldest[:len(self.entries) - self.max_entries]:
+                    del self.entries[old_key]
+        self.save()
+
+    def invalidate(self, hip_path):
+        with self.lock:
+            self.entries.pop(self.key(hip_path), None)
+        self.save()
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                data = json.dumps({"entries": self.entries})
+            write_file(self.path, data)
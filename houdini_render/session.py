@@ -0,0 +1,391 @@
+"""Warm hbatch sessions that can be reused across scans and renders."""
+import os
+import re
+import shlex
+import subprocess
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from .proctree import ProcessGroup, popen_options
+
+HBATCH_THREADS = 48
+# Launchers that are plain shells (Linux and macOS), as opposed to hcmd.exe
+SHELLS = ("bash", "sh", "zsh")
+# Characters hcmd's cmd.exe interprets even inside double quotes
+UNSAFE_HCMD_PATH = re.compile(r'["%^&|]')
+
+
+class SessionError(Exception):
+    """Raised when an hbatch session fails to start, dies or stops answering."""
+
+
+def session_key(hip_path):
+    """Key a session by hip file path and modification time."""
+    path = os.path.normcase(os.path.abspath(hip_path))
+    return path, os.path.getmtime(path)
+
+
+def hbatch_command(launcher, threads, hip_path):
+    """The line that starts hbatch on ``hip_path`` in a session's launcher.
+
+    A shell replaces itself with hbatch, so the session's process is
+    hbatch: when hbatch exits the session sees it die, instead of a bare
+    shell answering the next marker echo. The path is quoted for the
+    shell; for hcmd, paths it would interpret are refused with a
+    SessionError.
+    """
+    if "\n" in hip_path or "\r" in hip_path:
+        raise SessionError(f"Cannot open {hip_path!r}: line breaks in the path")
+    if os.path.basename(launcher[0]) in SHELLS:
+        return f"exec hbatch -i -j {threads} {shlex.quote(hip_path)}"
+    if UNSAFE_HCMD_PATH.search(hip_path):
+        raise SessionError(f"Cannot open {hip_path!r}: the path contains one of \" % ^ & |")
+    return f'hbatch -i -j {threads} "{hip_path}"'
+
+
+def is_marker_line(line, marker):
+    """True if ``line`` is hbatch's answer to ``echo <marker>``.
+
+    hbatch may prefix output with its prompt, and hcmd may echo the typed
+    command back, so match the marker at the end of the line but ignore
+    the echoed ``echo <marker>`` itself.
+    """
+    text = line.rstrip()
+    if not text.endswith(marker):
+        return False
+    return not text[:-len(marker)].rstrip().endswith("echo")
+
+
+class HbatchSession:
+    """One hcmd process running hbatch with a hip file loaded."""
+
+    load_timeout = 600
+    ping_timeout = 10
+    # Seconds a cancelled render gets to exit before its process tree is killed
+    kill_grace = 10
+
+    def __init__(self, launcher, hip_path, threads=HBATCH_THREADS, on_output=None,
+                 load_timeout=None, env=None):
+        self.launcher = list(launcher)
+        # Environment for the launcher, e.g. the one houdini_setup produces on Linux
+        self.env = env
+        self.hip_path = hip_path
+        self.key = session_key(hip_path)
+        self.threads = threads
+        self.on_output = on_output
+        if load_timeout is not None:
+            self.load_timeout = load_timeout
+        self.process = None
+        self.group = None
+        self.busy = False
+        self.created = time.time()
+        self.last_used = self.created
+        self._lock = threading.Lock()
+        self._marker = None
+        self._marker_event = threading.Event()
+        self._listener = None
+        self._captured = None
+        self._stdout_closed = False
+
+    def start(self):
+        """Launch hcmd, start hbatch on the hip file and wait until it is loaded.
+
+        hbatch only reads the next line of stdin once the hip file has been
+        loaded, so the session is ready as soon as a marker echo comes back.
+        """
+        command = hbatch_command(self.launcher, self.threads, self.hip_path)
+        self.process = subprocess.Popen(
+            self.launcher,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=self.env,
+            **popen_options()
+        )
+        self.group = ProcessGroup(self.process)
+        for pipe, is_error in ((self.process.stdout, False), (self.process.stderr, True)):
+            threading.Thread(target=self._read_output,
+                             args=(pipe, is_error),
+                             daemon=True).start()
+
+        self.send(command)
+        try:
+            self.run(None, timeout=self.load_timeout)
+        except SessionError as e:
+            raise SessionError(f"Failed to load {self.hip_path}: {e}")
+        return self
+
+    def _read_output(self, pipe, is_error):
+        for line in iter(pipe.readline, ""):
+            marker = self._marker
+            if not is_error and marker and is_marker_line(line, marker):
+                self._marker_event.set()
+                continue
+            captured = self._captured
+            if captured is not None and not is_error:
+                captured.append(line)
+            listener = self._listener or self.on_output
+            if listener:
+                listener(line, is_error)
+        pipe.close()
+        if not is_error:
+            self._stdout_closed = True
+            # Wake anyone waiting on a marker so they notice the process died. Only
+            # stdout counts: stderr may close first while the marker check still
+            # sees a live process
+            self._marker_event.set()
+
+    @property
+    def returncode(self):
+        """Exit code of hcmd once it has exited, otherwise None."""
+        return self.process.poll() if self.process else None
+
+    def is_alive(self):
+        return (self.process is not None and not self._stdout_closed
+                and self.process.poll() is None)
+
+    def send(self, command):
+        """Write a single command line to the session's stdin."""
+        if not self.is_alive():
+            raise SessionError("hbatch session is not running")
+        try:
+            self.process.stdin.write(command + "\n")
+            self.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            raise SessionError(f"Could not write to hbatch: {e}")
+
+    def run(self, command, on_output=None, timeout=None, capture=False):
+        """Send a command and block until hbatch has finished executing it.
+
+        Completion is detected by echoing a unique marker right after the
+        command; hbatch only reads it once the command has returned. With
+        ``capture`` the command's stdout lines are returned as a list.
+        """
+        with self._lock:
+            marker = f"__HCMD_DONE_{uuid.uuid4().hex}__"
+            self._marker = marker
+            self._marker_event.clear()
+            self._listener = on_output
+            self._captured = [] if capture else None
+            try:
+                if command:
+                    self.send(command)
+                self.send(f"echo {marker}")
+                if not self._marker_event.wait(timeout):
+                    raise SessionError(
+                        f"Timed out after {timeout}s waiting for {command or 'hbatch to respond'}")
+                if not self.is_alive():
+                    raise SessionError("hbatch session exited unexpectedly")
+                return self._captured
+            finally:
+                self._marker = None
+                self._listener = None
+                self._captured = None
+                self.last_used = time.time()
+
+    def ping(self, timeout=None):
+        """Health check: True if the session answers an echo in time."""
+        if not self.is_alive():
+            return False
+        try:
+            self.run(None, timeout=timeout or self.ping_timeout)
+            return True
+        except SessionError:
+            return False
+
+    def close(self, timeout=5):
+        """Quit hbatch and hcmd, killing the process if it does not exit."""
+        if self.process is None:
+            return
+        if self.is_alive():
+            try:
+                self.send("quit")
+                self.send("exit")
+                self.process.wait(timeout)
+            except (SessionError, subprocess.TimeoutExpired):
+                pass
+        # hbatch may have left husk or karma_cc running even if hcmd exited
+        self.group.kill()
+        self.group.close()
+
+    def terminate(self, grace=None):
+        """Stop the session's process tree, e.g. to cancel a running render.
+
+        The tree is asked to exit and killed after ``grace`` seconds, in the
+        background so the caller does not wait for the deadline.
+        """
+        if self.group is None or self.process.poll() is not None and not self.group.members():
+            return
+        grace = self.kill_grace if grace is None else grace
+        threading.Thread(target=self.group.stop, args=(grace,), daemon=True).start()
+
+
+class SessionPool:
+    """Keeps up to ``max_sessions`` warm hbatch sessions keyed by hip file.
+
+    A session whose hip file changed on disk is never reused. Sessions that
+    sit idle for longer than ``idle_timeout`` seconds are closed, and when
+    the pool is full the least recently used idle session is evicted.
+    """
+
+    def __init__(self, launcher, max_sessions=4, idle_timeout=600,
+                 threads=HBATCH_THREADS, on_output=None, load_timeout=None, env=None):
+        self.launcher = list(launcher)
+        self.env = env
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.threads = threads
+        self.on_output = on_output
+        self.load_timeout = load_timeout
+        self.sessions = []
+        self._starting = 0
+        self._closed = False
+        self._cond = threading.Condition()
+        self._reaper = threading.Thread(target=self._reap_idle, daemon=True)
+        self._reaper.start()
+
+    def acquire(self, hip_path, timeout=None, threads=None, install=None):
+        """Return a busy session with ``hip_path`` loaded, reusing a warm one if possible.
+
+        ``threads`` overrides the pool's hbatch ``-j`` value, and ``install``
+        (a HoudiniInstall) the Houdini build to use; only sessions started
+        with the same thread count, launcher and environment are reused.
+        """
+        key = session_key(hip_path)
+        threads = threads or self.threads
+        if install is None:
+            launcher, env = list(self.launcher), self.env
+        else:
+            launcher, env = list(install.launcher), install.env
+        deadline = None if timeout is None else time.time() + timeout
+        to_close = []
+        with self._cond:
+            while True:
+                if self._closed:
+                    raise SessionError("Session pool has been shut down")
+                session = self._take_idle(key, threads, launcher, env, to_close)
+                if session:
+                    break
+                if len(self.sessions) + self._starting < self.max_sessions:
+                    self._starting += 1
+                    break
+                idle = [s for s in self.sessions if not s.busy]
+                if idle:
+                    lru = min(idle, key=lambda s: s.last_used)
+                    self.sessions.remove(lru)
+                    to_close.append(lru)
+                    continue
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    raise SessionError("Timed out waiting for a free hbatch session")
+                self._cond.wait(remaining)
+
+        for stale in to_close:
+            stale.close()
+
+        if session is not None:
+            if session.ping():
+                return session
+            self.discard(session)
+            return self.acquire(hip_path, timeout, threads, install)
+
+        session = HbatchSession(launcher, hip_path, threads, self.on_output,
+                                load_timeout=self.load_timeout, env=env)
+        session.busy = True
+        try:
+            session.start()
+        except Exception:
+            session.close()
+            with self._cond:
+                self._starting -= 1
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            self._starting -= 1
+            self.sessions.append(session)
+        return session
+
+    def _take_idle(self, key, threads, launcher, env, to_close):
+        """Claim an idle session for ``key``; queue stale ones for closing."""
+        for session in list(self.sessions):
+            if session.busy:
+                continue
+            if not session.is_alive():
+                self.sessions.remove(session)
+                to_close.append(session)
+            elif session.key[0] == key[0] and session.key[1] != key[1]:
+                self.sessions.remove(session)
+                to_close.append(session)
+            elif (session.key == key and session.threads == threads
+                  and session.launcher == launcher and session.env == env):
+                session.busy = True
+                return session
+        return None
+
+    def release(self, session):
+        """Return a session to the pool so it can be reused."""
+        with self._cond:
+            session.busy = False
+            session.last_used = time.time()
+            if session not in self.sessions:
+                return
+            if self._closed or not session.is_alive():
+                self.sessions.remove(session)
+            else:
+                self._cond.notify_all()
+                return
+        session.close()
+
+    def discard(self, session):
+        """Close a session and drop it from the pool."""
+        with self._cond:
+            if session in self.sessions:
+                self.sessions.remove(session)
+            self._cond.notify_all()
+        session.close()
+
+    @contextmanager
+    def session(self, hip_path, timeout=None, threads=None, install=None):
+        """Context manager around acquire/release; broken sessions are discarded."""
+        session = self.acquire(hip_path, timeout, threads, install)
+        try:
+            yield session
+        except BaseException:
+            self.discard(session)
+            raise
+        else:
+            self.release(session)
+
+    def _reap_idle(self):
+        while True:
+            time.sleep(min(30, max(1, self.idle_timeout / 4)))
+            expired = []
+            with self._cond:
+                if self._closed:
+                    return
+                now = time.time()
+                for session in list(self.sessions):
+                    if not session.busy and (
+                            now - session.last_used > self.idle_timeout
+                            or not session.is_alive()):
+                        self.sessions.remove(session)
+                        expired.append(session)
+                if expired:
+                    self._cond.notify_all()
+            for session in expired:
+                session.close()
+
+    def shutdown(self):
+        """Close every session, including busy ones."""
+        with self._cond:
+            self._closed = True
+            sessions = list(self.sessions)
+            self.sessions.clear()
+            self._cond.notify_all()
+        for session in sessions:
+            # A rendering session will not read quit, so kill it straight away
+            session.close(timeout=0 if session.busy else 5)
@@ -0,0 +1,31 @@
+"""Locations of the tool's persistent state."""
+import os
+import threading
+
+STATE_DIR = os.environ.get("HOUDINI_RENDER_HOME",
+                           os.path.join(os.path.expanduser("~"), ".houdini_render"))
+
+
+def state_path(name):
+    """Return the path of ``name`` inside the state directory, creating the directory."""
+    os.makedirs(STATE_DIR, exist_ok=True)
+    return os.path.join(STATE_DIR, name)
+
+
+def write_file(path, text):
+    """Replace ``path`` with ``text`` in one step, so readers never see half a file.
+
+    The temporary file is named after the writing process and thread: two
+    writers of the same path never remove each other's.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
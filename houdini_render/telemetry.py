@@ -0,0 +1,312 @@
+"""Sample CPU, memory and I/O of a job's process tree and store the metrics in SQLite."""
+import csv
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from .proctree import proc_stat, process_tree, psutil
+from .progress import FRAME_LINE, FRAME_OF
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def _proc_io(pid):
+    read_bytes = write_bytes = 0
+    try:
+        with open(f"/proc/{pid}/io", "r") as f:
+            for line in f:
+                if line.startswith("read_bytes:"):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith("write_bytes:"):
+                    write_bytes = int(line.split()[1])
+    except OSError:
+        pass
+    return read_bytes, write_bytes
+
+
+def read_counters(pid):
+    """(cpu seconds, rss bytes, read bytes, write bytes) of one process, or None."""
+    if psutil is not None:
+        try:
+            process = psutil.Process(pid)
+            with process.oneshot():
+                times = process.cpu_times()
+                rss = process.memory_info().rss
+                try:
+                    io = process.io_counters()
+                    read_bytes, write_bytes = io.read_bytes, io.write_bytes
+                except (psutil.Error, AttributeError):
+                    read_bytes = write_bytes = 0
+            return times.user + times.system, rss, read_bytes, write_bytes
+        except psutil.Error:
+            return None
+    try:
+        _, ticks, pages = proc_stat(pid)
+    except (OSError, ValueError, IndexError):
+        return None
+    return (ticks / CLOCK_TICKS, pages * PAGE_SIZE) + _proc_io(pid)
+
+
+def telemetry_supported():
+    return psutil is not None or os.path.isdir("/proc")
+
+
+class JobTelemetry:
+    """Resource usage of one job, sampled every ``interval`` seconds.
+
+    ``get_pids`` returns the root processes of the job (the hcmd of every
+    session it currently uses); their descendants such as hbatch, husk
+    and karma_cc are found on each sample. Sessions are reused between
+    jobs, so CPU and I/O counters are measured from the first time a
+    process is seen by this job.
+
+    Frame messages passed to ``feed`` mark frames as finished. A frame's
+    duration runs from the previous frame message of the same chunk, or
+    from the chunk's start.
+
+    If the store fails (a locked or corrupt database), the job goes on
+    without it and the error is kept in ``store_error``.
+    """
+
+    def __init__(self, job, get_pids, interval=1.0, store=None):
+        self.job = job
+        self.get_pids = get_pids
+        self.interval = interval
+        self.store = store
+        self.store_error = None
+        self.started = time.time()
+        self.cpu_seconds = 0.0
+        self.cpu_percent = 0.0
+        self.peak_cpu_percent = 0.0
+        self.rss = 0
+        self.peak_rss = 0
+        self.read_bytes = 0
+        self.write_bytes = 0
+        self.samples = 0
+        self.frames = []
+        self._baseline = {}
+        self._latest = {}
+        self._lanes = {}
+        self._frame_peak_rss = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _record(self, method, *args):
+        if not self.store:
+            return
+        try:
+            getattr(self.store, method)(*args)
+        except sqlite3.Error as e:
+            self.store = None
+            self.store_error = e
+
+    def start(self):
+        self._record("start_job", self.job, self.started)
+        if telemetry_supported():
+            self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+            self._thread.start()
+        return self
+
+    def _sample_loop(self):
+        last_time, last_cpu = time.time(), 0.0
+        while not self._stop.wait(self.interval):
+            now = time.time()
+            self.sample()
+            self.cpu_percent = 100.0 * (self.cpu_seconds - last_cpu) / max(1e-6, now - last_time)
+            self.peak_cpu_percent = max(self.peak_cpu_percent, self.cpu_percent)
+            last_time, last_cpu = now, self.cpu_seconds
+            self._record("add_sample", self.job.id, now, self.cpu_percent, self.rss,
+                         self.read_bytes, self.write_bytes)
+
+    def sample(self):
+        rss = 0
+        for pid in process_tree(self.get_pids()):
+            counters = read_counters(pid)
+            if counters is None:
+                continue
+            self._baseline.setdefault(pid, counters)
+            self._latest[pid] = counters
+            rss += counters[1]
+        # Processes that exited keep contributing what they used while alive
+        totals = [0.0, 0, 0]
+        for pid, latest in self._latest.items():
+            base = self._baseline[pid]
+            totals[0] += max(0.0, latest[0] - base[0])
+            totals[1] += max(0, latest[2] - base[2])
+            totals[2] += max(0, latest[3] - base[3])
+        with self._lock:
+            self.cpu_seconds, self.read_bytes, self.write_bytes = totals
+            self.rss = rss
+            self.peak_rss = max(self.peak_rss, rss)
+            for lane in self._frame_peak_rss:
+                self._frame_peak_rss[lane] = max(self._frame_peak_rss[lane], rss)
+            self.samples += 1
+
+    def lane_started(self, lane):
+        """A chunk (or the whole job, lane None) started rendering."""
+        with self._lock:
+            self._lanes[lane] = time.time()
+            self._frame_peak_rss[lane] = self.rss
+
+    def feed(self, line, lane=None, at=None):
+        """A line of output printed at time ``at`` (default now)."""
+        match = FRAME_OF.search(line) or FRAME_LINE.search(line)
+        if not match:
+            return
+        frame = float(match.group(1))
+        now = at or time.time()
+        with self._lock:
+            started = self._lanes.get(lane, self.started)
+            peak = max(self._frame_peak_rss.get(lane, 0), self.rss)
+            self._lanes[lane] = max(started, now)
+            self._frame_peak_rss[lane] = self.rss
+            seconds = max(0.0, now - started)
+            self.frames.append((frame, seconds, peak))
+        self._record("add_frame", self.job.id, frame, seconds, peak)
+
+    def stop(self, state=None):
+        """Stop sampling, store the job summary and return it."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(self.interval + 1)
+        if telemetry_supported():
+            self.sample()
+        summary = self.summary()
+        self._record("finish_job", self.job.id, state or self.job.state, summary)
+        return summary
+
+    def summary(self):
+        elapsed = max(1e-6, time.time() - self.started)
+        durations = [duration for _, duration, _ in self.frames]
+        slowest = max(self.frames, key=lambda frame: frame[1]) if self.frames else None
+        hungriest = max(self.frames, key=lambda frame: frame[2]) if self.frames else None
+        return {
+            "seconds": elapsed,
+            "cpu_seconds": self.cpu_seconds,
+            "avg_cpu_percent": 100.0 * self.cpu_seconds / elapsed,
+            "peak_cpu_percent": self.peak_cpu_percent,
+            "peak_rss": self.peak_rss,
+            "read_bytes": self.read_bytes,
+            "write_bytes": self.write_bytes,
+            "frames": len(self.frames),
+            "avg_frame_seconds": sum(durations) / len(durations) if durations else None,
+            "slowest_frame": slowest[0] if slowest else None,
+            "slowest_frame_seconds": slowest[1] if slowest else None,
+            "peak_rss_frame": hungriest[0] if hungriest else None,
+        }
+
+
+def format_bytes(count):
+    count = float(count or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if count < 1024:
+            return f"{count:.1f} {unit}"
+        count /= 1024
+    return f"{count:.1f} TB"
+
+
+def format_summary(summary):
+    text = (f"CPU {summary['avg_cpu_percent']:.0f}% avg / {summary['peak_cpu_percent']:.0f}% peak, "
+            f"RSS peak {format_bytes(summary['peak_rss'])}, "
+            f"read {format_bytes(summary['read_bytes'])}, "
+            f"written {format_bytes(summary['write_bytes'])}")
+    if summary["frames"]:
+        text += (f", {summary['frames']} frames at {summary['avg_frame_seconds']:.1f}s avg, "
+                 f"slowest {summary['slowest_frame']:g} ({summary['slowest_frame_seconds']:.1f}s), "
+                 f"most memory at frame {summary['peak_rss_frame']:g}")
+    return text
+
+
+class MetricsStore:
+    """SQLite file with one row per job, its resource samples and its frame timings."""
+
+    tables = ("jobs", "samples", "frames")
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.executescript("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY, hip_path TEXT, node_type TEXT, node_path TEXT,
+                    state TEXT, started REAL, finished REAL, seconds REAL,
+                    cpu_seconds REAL, avg_cpu_percent REAL, peak_cpu_percent REAL,
+                    peak_rss INTEGER, read_bytes INTEGER, write_bytes INTEGER,
+                    frames INTEGER, avg_frame_seconds REAL,
+                    slowest_frame REAL, slowest_frame_seconds REAL, peak_rss_frame REAL);
+                CREATE TABLE IF NOT EXISTS samples (
+                    job_id TEXT, time REAL, cpu_percent REAL, rss INTEGER,
+                    read_bytes INTEGER, write_bytes INTEGER);
+                CREATE TABLE IF NOT EXISTS frames (
+                    job_id TEXT, frame REAL, seconds REAL, peak_rss INTEGER);
+                CREATE INDEX IF NOT EXISTS samples_job ON samples (job_id);
+                CREATE INDEX IF NOT EXISTS frames_job ON frames (job_id);
+            """)
+
+    def _execute(self, sql, params=()):
+        with self._lock, self._db:
+            self._db.execute(sql, params)
+
+    def start_job(self, job, started):
+        # A retried job starts its metrics over
+        with self._lock, self._db:
+            for table in self.tables:
+                self._db.execute(f"DELETE FROM {table} WHERE job_id = ?", (job.id,))
+            self._db.execute("INSERT INTO jobs (job_id, hip_path, node_type, node_path, state,"
+                             " started) VALUES (?, ?, ?, ?, ?, ?)",
+                             (job.id, job.hip_path, job.node_type, job.node_path, job.state,
+                              started))
+
+    def add_sample(self, job_id, when, cpu_percent, rss, read_bytes, write_bytes):
+        self._execute("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)",
+                      (job_id, when, cpu_percent, rss, read_bytes, write_bytes))
+
+    def add_frame(self, job_id, frame, seconds, peak_rss):
+        self._execute("INSERT INTO frames VALUES (?, ?, ?, ?)",
+                      (job_id, frame, seconds, peak_rss))
+
+    def finish_job(self, job_id, state, summary):
+        columns = ", ".join(f"{name} = ?" for name in summary)
+        self._execute(f"UPDATE jobs SET state = ?, finished = ?, {columns} WHERE job_id = ?",
+                      (state, time.time(), *summary.values(), job_id))
+
+    def rows(self, table="jobs", job_id=None, limit=None):
+        if table not in self.tables:
+            raise ValueError(f"Unknown metrics table: {table}")
+        sql = f"SELECT * FROM {table}"
+        params = []
+        if job_id:
+            sql += " WHERE job_id = ?"
+            params.append(job_id)
+        sql += " ORDER BY rowid DESC" if table == "jobs" else " ORDER BY rowid"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def export(self, path, table="jobs", job_id=None):
+        """Write a table to ``path`` as CSV or JSON, depending on the extension."""
+        rows = self.rows(table, job_id)
+        if path.lower().endswith(".json"):
+            with open(path, "w") as f:
+                json.dump(rows, f, indent=2)
+            return path
+        with self._lock:
+            names = [column[0] for column in
+                     self._db.execute(f"SELECT * FROM {table} LIMIT 0").description]
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=names)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+
+    def close(self):
+        with self._lock:
+            self._db.close()
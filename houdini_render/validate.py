@@ -0,0 +1,215 @@
+"""Check a finished cache or render on disk and write a checksum manifest next to it.
+
+Every expected output file of the frame range is checked for being
+missing, empty, older than the hip file or truncated (much smaller than
+the previous manifest recorded), and hashed in large chunks on a few
+threads. Files much smaller than the frames before them are only
+reported as a warning, since a sim can legitimately shrink. The
+result is saved as ``<name>.manifest.json`` in the output folder, so
+later runs can compare manifests instead of reading the files again:
+a file whose size and mtime match the previous manifest keeps its hash.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .resume import frame_numbers, output_path, shrunk_frames, small_frames
+from .settings import write_file
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+OK = "ok"
+MISSING = "missing"
+EMPTY = "empty"
+STALE = "stale"
+TRUNCATED = "truncated"
+
+PROBLEMS = (MISSING, EMPTY, STALE, TRUNCATED)
+# Warning for files much smaller than the frames before them, with nothing to compare to
+SMALL = "small"
+
+READ_SIZE = 4 * 1024 * 1024
+FRAME_FIELD = re.compile(r"[._-]?\{frame[^}]*\}")
+
+
+def default_algorithm():
+    return "xxh3_128" if xxhash is not None else "blake2b_128"
+
+
+def new_hash(algorithm):
+    if algorithm == "xxh3_128":
+        if xxhash is None:
+            raise ValueError("xxh3_128 checksums need the xxhash module")
+        return xxhash.xxh3_128()
+    if algorithm == "blake2b_128":
+        return hashlib.blake2b(digest_size=16)
+    raise ValueError(f"Unknown checksum algorithm: {algorithm}")
+
+
+def file_digest(path, algorithm=None):
+    """Hex digest of a file, read in READ_SIZE chunks into one reused buffer."""
+    digest = new_hash(algorithm or default_algorithm())
+    buffer = bytearray(READ_SIZE)
+    view = memoryview(buffer)
+    with open(path, "rb", buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+    return digest.hexdigest()
+
+
+def output_folder(pattern):
+    """Deepest folder of ``pattern`` that is the same for every frame."""
+    folder = os.path.dirname(pattern)
+    while "{frame" in folder:
+        folder = os.path.dirname(folder)
+    return folder
+
+
+def manifest_path(pattern):
+    """``cache.{frame:04d}.bgeo.sc`` -> ``cache.bgeo.sc.manifest.json`` in the same folder."""
+    name = FRAME_FIELD.sub("", os.path.basename(pattern)).lstrip("._-") or "output"
+    return os.path.join(output_folder(pattern), name + ".manifest.json")
+
+
+def can_validate(pattern, frame_range=None):
+    """True if the output files are known: a fixed path, or a per-frame one with a range."""
+    return bool(pattern) and (bool(frame_range) or "{frame" not in pattern)
+
+
+def expected_outputs(pattern, frame_range=None):
+    """[(frame, path)] of every output file; a pattern without {frame} is one file."""
+    if "{frame" not in pattern or not frame_range:
+        return [(None, pattern)]
+    return [(frame, output_path(pattern, frame)) for frame in frame_numbers(frame_range)]
+
+
+def load_manifest(path):
+    """A manifest dict, or None if there is no readable manifest at ``path``."""
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def manifest_sizes(manifest):
+    """{frame: size} of the files a manifest recorded as complete."""
+    return {entry["frame"]: entry["size"] for entry in (manifest or {}).get("files", [])
+            if entry.get("status") == OK and entry.get("frame") is not None}
+
+
+def write_manifest(manifest, path):
+    write_file(path, json.dumps(manifest, indent=2))
+    return path
+
+
+def validate_outputs(pattern, frame_range=None, hip_mtime=None, workers=4, algorithm=None,
+                     previous=None, truncated_ratio=0.25):
+    """Check and hash the outputs of ``pattern`` over ``frame_range``; returns a manifest dict.
+
+    ``previous`` is an earlier manifest of the same outputs; files whose
+    size and mtime did not change keep its hash instead of being read, and
+    files below ``truncated_ratio`` of the size it recorded as complete are
+    truncated. Other files much smaller than their neighbours are listed in
+    ``warnings``.
+    """
+    algorithm = algorithm or default_algorithm()
+    previous_sizes = {entry["path"]: entry["size"] for entry in (previous or {}).get("files", [])
+                      if entry.get("status") == OK}
+    known = {}
+    if previous and previous.get("algorithm") == algorithm:
+        known = {entry["path"]: entry for entry in previous.get("files", []) if entry.get("hash")}
+    # Paths are stored relative to the manifest, so a moved cache keeps its manifest
+    folder = output_folder(pattern)
+    entries = []
+    sizes = {}
+    for frame, path in expected_outputs(pattern, frame_range):
+        entry = {"frame": frame, "path": os.path.relpath(path, folder), "size": None,
+                 "mtime": None, "hash": None, "status": OK}
+        entries.append(entry)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            entry["status"] = MISSING
+            continue
+        entry["size"], entry["mtime"] = stat.st_size, stat.st_mtime
+        if not stat.st_size:
+            entry["status"] = EMPTY
+        elif hip_mtime is not None and stat.st_mtime < hip_mtime:
+            entry["status"] = STALE
+        else:
+            sizes[len(entries) - 1] = stat.st_size
+    known_sizes = {index: previous_sizes.get(entries[index]["path"]) for index in sizes}
+    for index in shrunk_frames(sizes, known_sizes, truncated_ratio):
+        entries[index]["status"] = TRUNCATED
+    small = [entries[index]["frame"] for index in sorted(small_frames(sizes, truncated_ratio))
+             if entries[index]["status"] == OK and not known_sizes[index]]
+
+    to_hash = []
+    for entry in entries:
+        if entry["size"] is None:
+            continue
+        old = known.get(entry["path"])
+        if old and old["size"] == entry["size"] and old["mtime"] == entry["mtime"]:
+            entry["hash"] = old["hash"]
+        else:
+            to_hash.append(entry)
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        digests = pool.map(lambda entry: file_digest(os.path.join(folder, entry["path"]),
+                                                     algorithm), to_hash)
+        for entry, digest in zip(to_hash, digests):
+            entry["hash"] = digest
+
+    problems = {status: [entry["frame"] if entry["frame"] is not None else entry["path"]
+                         for entry in entries if entry["status"] == status]
+                for status in PROBLEMS}
+    return {
+        "created": time.time(),
+        "pattern": pattern,
+        "frame_range": frame_range,
+        "algorithm": algorithm,
+        "files": entries,
+        "total_bytes": sum(entry["size"] or 0 for entry in entries),
+        "hashed": len(to_hash),
+        "hash_seconds": time.time() - started,
+        "problems": {status: frames for status, frames in problems.items() if frames},
+        "warnings": {SMALL: small} if small else {},
+    }
+
+
+def diff_manifests(old, new):
+    """Compare two manifests by file name: {"added", "removed", "changed", "unchanged"}."""
+    old_files = {entry["path"]: entry for entry in (old or {}).get("files", []) if entry["hash"]}
+    new_files = {entry["path"]: entry for entry in (new or {}).get("files", []) if entry["hash"]}
+    same_hash = (old or {}).get("algorithm") == (new or {}).get("algorithm")
+    diff = {"added": [], "removed": [], "changed": [], "unchanged": []}
+    for path, entry in new_files.items():
+        if path not in old_files:
+            diff["added"].append(path)
+        elif not same_hash or old_files[path]["hash"] != entry["hash"]:
+            diff["changed"].append(path)
+        else:
+            diff["unchanged"].append(path)
+    diff["removed"] = [path for path in old_files if path not in new_files]
+    return diff
+
+
+def format_problems(manifest, limit=10, key="problems"):
+    """Problems (or ``key="warnings"``) as text, e.g. "2 missing (12, 13), 1 truncated (20)"."""
+    parts = []
+    for status, frames in manifest.get(key, {}).items():
+        shown = ", ".join(f"{frame:g}" if isinstance(frame, (int, float)) else str(frame)
+                          for frame in frames[:limit])
+        more = f", +{len(frames) - limit} more" if len(frames) > limit else ""
+        parts.append(f"{len(frames)} {status} ({shown}{more})")
+    return ", ".join(parts)
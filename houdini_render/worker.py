@@ -0,0 +1,266 @@
+"""Render worker that pulls work from a coordinator on another machine.
+
+The worker registers its capacity (cores, RAM, Houdini builds and the
+number of renders it runs at once), then every slot keeps asking the
+coordinator for the next item and renders it in a warm local session.
+Output is sent back in small batches while the render runs, so progress
+and logs show up on the coordinator as if the render were local.
+"""
+import os
+import re
+import socket
+import threading
+import time
+
+from .coordinator import UNKNOWN_WORKER
+from .core import EngineError
+from .daemon import DEFAULT_PORT, DaemonClient
+from .installs import HoudiniInstall, InstallCache, version_text
+from .jobs import available_memory_gb
+from .session import SessionPool
+from .settings import state_path
+
+# The only commands a coordinator may send: a render of one node, optionally of a frame range
+# (see nodetypes.py and chunks.py). Anything else, e.g. ``unix``, is refused.
+RENDER_COMMAND = re.compile(r"render(?: -f [-+.\de]+ [-+.\de]+ -i [-+.\de]+)? -V /[\w./-]+")
+
+
+def total_memory_gb():
+    """Physical memory in GB, or None if it cannot be determined."""
+    try:
+        import psutil
+        return psutil.virtual_memory().total / 1024 ** 3
+    except ImportError:
+        pass
+    try:
+        with open("/proc/meminfo", "r") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) / 1024 ** 2
+    except OSError:
+        pass
+    return None
+
+
+def check_item(item):
+    """Raise EngineError unless ``item`` is a render the engine itself would send.
+
+    The hip path needs no check here: hbatch_command quotes or refuses it.
+    """
+    if not RENDER_COMMAND.fullmatch(item["command"]):
+        raise EngineError(f"Refusing to run {item['command']!r}: not a render command")
+
+
+def parse_address(text):
+    """(host, port) from "host" or "host:port"."""
+    host, sep, port = text.rpartition(":")
+    if not sep:
+        return text, DEFAULT_PORT
+    return host, int(port)
+
+
+class RenderWorker:
+    """Renders items from the coordinator at ``host:port`` on ``slots`` local sessions.
+
+    ``path_map`` is a list of (coordinator prefix, local prefix) pairs applied
+    to hip file paths, for shares mounted at different places. Items pinned to
+    a build are only handed to workers that have it; other items use the
+    ``launcher`` or the newest install.
+    """
+
+    heartbeat_interval = 5
+    flush_interval = 0.5
+    retry_interval = 5
+
+    def __init__(self, host, port=DEFAULT_PORT, launcher=None, houdini=None, slots=1,
+                 name=None, path_map=(), load_timeout=600, on_log=None):
+        self.client = DaemonClient(host, port, timeout=60)
+        self.address = f"{host}:{port}"
+        self.slots = max(1, slots)
+        self.name = name or socket.gethostname()
+        self.path_map = list(path_map)
+        self.on_log = on_log
+        self.installs = InstallCache(state_path("houdini_installs.json"))
+        if launcher:
+            # An explicit launcher renders everything and reports no versions
+            self.install = HoudiniInstall(None, None, launcher)
+            self.versions = []
+        else:
+            self.install = self.installs.resolve(houdini)
+            self.versions = [version_text(install.version)
+                             for install in self.installs.installs() if install.version]
+        if self.install is None:
+            raise EngineError("No Houdini installation found for this worker")
+        self.threads = max(1, (os.cpu_count() or 1) // self.slots)
+        self.pool = SessionPool(self.install.launcher, max_sessions=self.slots + 1,
+                                threads=self.threads, load_timeout=load_timeout,
+                                env=self.install.env)
+        self.worker_id = None
+        # item id -> session rendering it
+        self.running = {}
+        self._lock = threading.Lock()
+        self._register_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def log(self, message):
+        if self.on_log:
+            self.on_log(message)
+
+    def capacity(self):
+        return {"name": self.name, "host": socket.gethostname(), "cores": os.cpu_count(),
+                "memory_gb": total_memory_gb(), "free_memory_gb": available_memory_gb(),
+                "slots": self.slots, "versions": self.versions}
+
+    def register(self):
+        """Register with the coordinator, retrying until it answers."""
+        while not self._stopped.is_set():
+            try:
+                reply = self.client.request("register", **self.capacity())
+            except (OSError, EngineError) as e:
+                self.log(f"Cannot reach coordinator {self.address}: {e}\n")
+                self._stopped.wait(self.retry_interval)
+                continue
+            self.worker_id = reply["id"]
+            # Check in well within the time after which the coordinator gives up on us
+            self.heartbeat_interval = min(type(self).heartbeat_interval, reply["timeout"] / 3)
+            self.log(f"Registered with {self.address} as {self.name} ({self.slots} slots)\n")
+            return
+
+    def call(self, command, **params):
+        """Send a request as this worker, registering again if the coordinator forgot us."""
+        worker_id = self.worker_id
+        try:
+            return self.client.request(command, worker=worker_id, **params)
+        except EngineError as e:
+            if str(e).startswith(UNKNOWN_WORKER):
+                with self._register_lock:
+                    # Other slots may have hit the same error; register only once
+                    if self.worker_id == worker_id:
+                        self.register()
+            raise
+
+    def run(self):
+        """Serve until stop() is called."""
+        self.register()
+        threads = [threading.Thread(target=self._heartbeat_loop, daemon=True)]
+        threads.extend(threading.Thread(target=self._slot_loop, daemon=True)
+                       for _ in range(self.slots))
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stopped.wait(1):
+                pass
+        finally:
+            self.pool.shutdown()
+
+    def stop(self):
+        self._stopped.set()
+        with self._lock:
+            sessions = list(self.running.values())
+        for session in sessions:
+            session.terminate()
+
+    def map_path(self, path):
+        for source, target in self.path_map:
+            if path.startswith(source):
+                return target + path[len(source):]
+        return path
+
+    def _heartbeat_loop(self):
+        while not self._stopped.wait(self.heartbeat_interval):
+            with self._lock:
+                running = list(self.running)
+            try:
+                reply = self.call("heartbeat", running=running,
+                                  free_memory_gb=available_memory_gb())
+            except (OSError, EngineError):
+                continue
+            for item_id in reply["cancel"]:
+                with self._lock:
+                    session = self.running.get(item_id)
+                if session:
+                    session.terminate()
+
+    def _slot_loop(self):
+        while not self._stopped.is_set():
+            try:
+                item = self.call("pull", wait=min(10, self.heartbeat_interval))
+            except (OSError, EngineError):
+                self._stopped.wait(self.retry_interval)
+                continue
+            if item:
+                self._render(item)
+
+    def _install_for(self, houdini):
+        if not houdini or self.install.matches(houdini):
+            return None
+        install = self.installs.resolve(houdini)
+        if install is None:
+            raise EngineError(f"Houdini {houdini} is not installed on {self.name}")
+        return install
+
+    def _render(self, item):
+        hip_path = self.map_path(item["hip"])
+        self.log(f"Rendering {item['command']} of {hip_path}\n")
+        buffered = []
+        buffer_lock = threading.Lock()
+        finished = threading.Event()
+        session = None
+
+        def on_output(line, is_error=False):
+            # Stamped here: the coordinator only sees the lines every flush_interval
+            with buffer_lock:
+                buffered.append((line, is_error, time.time()))
+
+        def take_lines():
+            with buffer_lock:
+                lines = list(buffered)
+                buffered.clear()
+            return lines
+
+        def flush_loop():
+            while not finished.wait(self.flush_interval):
+                try:
+                    reply = self.call("report", item=item["id"], lines=take_lines(),
+                                      sent=time.time())
+                except (OSError, EngineError):
+                    continue
+                if reply["cancel"] and session:
+                    session.terminate()
+
+        flusher = threading.Thread(target=flush_loop, daemon=True)
+        flusher.start()
+        error = returncode = None
+        try:
+            check_item(item)
+            session = self.pool.acquire(hip_path, install=self._install_for(item["houdini"]))
+            with self._lock:
+                self.running[item["id"]] = session
+            session.run(item["command"], on_output=on_output)
+        except Exception as e:
+            error = str(e)
+            if session:
+                returncode = session.returncode
+                self.pool.discard(session)
+        else:
+            self.pool.release(session)
+        finally:
+            with self._lock:
+                self.running.pop(item["id"], None)
+            finished.set()
+            flusher.join()
+        self._report_done(item, take_lines(), error, returncode)
+
+    def _report_done(self, item, lines, error, returncode):
+        # Keep trying for as long as the coordinator would wait before handing the item on
+        deadline = time.time() + 30
+        while True:
+            try:
+                self.call("report", item=item["id"], lines=lines, done=True,
+                          error=error, returncode=returncode, sent=time.time())
+                return
+            except (OSError, EngineError) as e:
+                if time.time() > deadline or self._stopped.is_set():
+                    self.log(f"Could not report {item['id']} to the coordinator: {e}\n")
+                    return
+                self._stopped.wait(1)
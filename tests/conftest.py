@@ -0,0 +1,41 @@
+"""Shared fixtures: every test gets its own state folder and runs against tools/stub_hbatch.py."""
+import os
+import sys
+
+import pytest
+
+from benchmarks.scenes import make_scene
+from houdini_render import settings
+from houdini_render.core import RenderEngine
+
+STUB = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                    "tools", "stub_hbatch.py")
+LAUNCHER = [sys.executable, STUB]
+
+
+@pytest.fixture(autouse=True)
+def state_dir(tmp_path, monkeypatch):
+    path = str(tmp_path / "state")
+    monkeypatch.setattr(settings, "STATE_DIR", path)
+    monkeypatch.delenv("HOUDINI_RENDER_TOKEN", raising=False)
+    monkeypatch.setenv("STUB_HBATCH_LOAD_DELAY", "0")
+    monkeypatch.setenv("STUB_HBATCH_FRAME_TIME", "0")
+    for name in ("LOG_LINES", "OUTPUT_SIZE", "FAIL", "FAIL_FRAME", "FAIL_RATE"):
+        monkeypatch.delenv("STUB_HBATCH_" + name, raising=False)
+    return path
+
+
+@pytest.fixture
+def scene(tmp_path):
+    """A stub hip file with one filecache of 5 frames."""
+    path = str(tmp_path / "shot.hip")
+    make_scene(path, caches=1, frames=5)
+    return path
+
+
+@pytest.fixture
+def engine():
+    engine = RenderEngine(launcher=LAUNCHER, persist_queue=False)
+    engine.start()
+    yield engine
+    engine.shutdown()
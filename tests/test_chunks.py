@@ -0,0 +1,38 @@
+import pytest
+
+from houdini_render.chunks import chunk_command, split_frame_range, split_frame_ranges
+
+
+def ranges(chunks):
+    return [(chunk.start, chunk.end) for chunk in chunks]
+
+
+def test_split_frame_range():
+    assert ranges(split_frame_range(1, 24, 10)) == [(1, 10), (11, 20), (21, 24)]
+    assert ranges(split_frame_range(1, 10, 10)) == [(1, 10)]
+    assert ranges(split_frame_range(5, 5, 3)) == [(5, 5)]
+
+
+def test_split_frame_range_with_step():
+    chunks = split_frame_range(1, 19, 3, step=2)
+    assert ranges(chunks) == [(1, 5), (7, 11), (13, 17), (19, 19)]
+    assert [chunk.frame_count for chunk in chunks] == [3, 3, 3, 1]
+
+
+def test_chunk_size_below_one_is_one_frame():
+    assert ranges(split_frame_range(1, 3, 0)) == [(1, 1), (2, 2), (3, 3)]
+
+
+def test_split_frame_ranges_numbers_chunks_consecutively():
+    chunks = split_frame_ranges([(1, 4), (10, 12)], 2)
+    assert ranges(chunks) == [(1, 2), (3, 4), (10, 11), (12, 12)]
+    assert [chunk.index for chunk in chunks] == [0, 1, 2, 3]
+
+
+def test_chunk_command():
+    assert (chunk_command("render -V /obj/geo1/filecache1/render", 1, 10)
+            == "render -f 1 10 -i 1 -V /obj/geo1/filecache1/render")
+    assert (chunk_command("render -V /out/karma1", 1.5, 3, 0.5)
+            == "render -f 1.5 3 -i 0.5 -V /out/karma1")
+    with pytest.raises(ValueError):
+        chunk_command("unix rm -rf /", 1, 10)
@@ -0,0 +1,78 @@
+import json
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+from houdini_render.core import EngineError
+from houdini_render.daemon import DaemonClient, RenderDaemon, token_path
+from houdini_render.jobs import DONE
+
+
+@pytest.fixture
+def daemon(engine):
+    server = RenderDaemon(engine, "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(daemon):
+    return DaemonClient("127.0.0.1", daemon.server_address[1], timeout=30)
+
+
+def raw_request(daemon, request):
+    with socket.create_connection(daemon.server_address, timeout=10) as sock:
+        sock.sendall((json.dumps(request) + "\n").encode("utf-8"))
+        return json.loads(sock.makefile("r", encoding="utf-8").readline())
+
+
+def test_local_daemon_writes_a_private_token(daemon, client):
+    path = token_path(daemon.server_address[1])
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert client.token == daemon.token
+    assert client.available()
+
+
+def test_token_file_is_removed_on_close(engine):
+    server = RenderDaemon(engine, "127.0.0.1", 0)
+    path = token_path(server.server_address[1])
+    server.server_close()
+    assert not os.path.exists(path)
+
+
+@pytest.mark.parametrize("token", [None, "wrong"])
+def test_requests_without_the_token_are_refused(daemon, token):
+    request = {"command": "shutdown"}
+    if token:
+        request["token"] = token
+    assert raw_request(daemon, request) == {"ok": False, "error": "Invalid or missing token"}
+
+
+def test_shared_token_is_required_off_localhost(engine):
+    with pytest.raises(EngineError):
+        RenderDaemon(engine, "0.0.0.0", 0)
+
+
+def test_errors_come_back_as_replies(daemon, client):
+    with pytest.raises(EngineError, match="Unknown command"):
+        client.request("explode")
+    reply = raw_request(daemon, {"token": daemon.token})
+    assert reply["ok"] is False
+    # The connection still answers after a bad request
+    assert client.request("ping") == "pong"
+
+
+def test_scan_enqueue_and_list(engine, client, scene):
+    nodes = client.request("scan", hip=scene)["nodes"]
+    assert [node["path"] for node in nodes] == ["/obj/geo1/filecache1"]
+    info = client.request("enqueue", hip=scene, node=nodes[0]["path"])
+    job = engine.get_job(info["id"])
+    engine.wait([job], 0.05)
+    assert job.state == DONE
+    listed = {entry["id"]: entry for entry in client.request("list")}
+    assert listed[job.id]["state"] == DONE
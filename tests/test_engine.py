@@ -0,0 +1,134 @@
+import json
+import os
+import sqlite3
+import time
+
+from houdini_render.core import RenderEngine
+from houdini_render.failures import DEPENDENCY, LICENSE, MISSING_FILE
+from houdini_render.jobs import DONE, FAILED, HELD, QUEUED
+from houdini_render.validate import load_manifest, manifest_path
+
+from .conftest import LAUNCHER
+
+
+def write_chain(path):
+    """A cache read back by a File SOP that feeds a second cache."""
+    nodes = [
+        {"type": "filecache::2.0", "path": "/obj/geo1/filecache1",
+         "parms": {"trange": 1, "f1": 1, "f2": 3, "f3": 1,
+                   "sopoutput": "$HIP/cache/a.$F4.bgeo.sc"}},
+        {"type": "file", "path": "/obj/geo2/file1",
+         "parms": {"file": "$HIP/cache/a.$F4.bgeo.sc"}},
+        {"type": "filecache::2.0", "path": "/obj/geo2/filecache1", "inputs": ["/obj/geo2/file1"],
+         "parms": {"trange": 1, "f1": 1, "f2": 3, "f3": 1,
+                   "sopoutput": "$HIP/cache/b.$F4.bgeo.sc"}},
+    ]
+    with open(path, "w") as f:
+        json.dump({"frame": 1, "nodes": nodes}, f)
+    return path
+
+
+def render(engine, hip, **options):
+    nodes, _ = engine.scan(hip)
+    job = engine.enqueue(engine.make_job(hip, nodes[0], **options))
+    engine.wait([job], 0.05)
+    return job
+
+
+def test_render_validates_and_writes_a_manifest(engine, scene):
+    job = render(engine, scene)
+    assert job.state == DONE, job.error
+    manifest = load_manifest(manifest_path(job.output_pattern))
+    assert len(manifest["files"]) == 5
+    assert manifest["problems"] == {}
+
+
+def test_chunked_render(engine, scene):
+    job = render(engine, scene, chunk_size=2)
+    assert job.state == DONE, job.error
+    assert sorted(engine.queue.done_chunks(job.id)) == [(1, 2), (3, 4), (5, 5)]
+
+
+def test_resume_renders_only_missing_frames(engine, scene):
+    job = render(engine, scene)
+    os.remove(job.output_pattern.format(frame=4))
+    resumed = render(engine, scene, resume=True)
+    assert resumed.state == DONE, resumed.error
+    assert sorted(engine.queue.done_chunks(resumed.id)) == [(4, 4)]
+
+
+def test_hip_saved_during_the_render_is_not_stale(engine, scene, monkeypatch):
+    monkeypatch.setenv("STUB_HBATCH_FRAME_TIME", "0.1")
+    nodes, _ = engine.scan(scene)
+    job = engine.enqueue(engine.make_job(scene, nodes[0]))
+    time.sleep(0.3)
+    os.utime(scene)
+    engine.wait([job], 0.05)
+    assert job.state == DONE, job.error
+
+
+def test_failure_is_classified(engine, scene, monkeypatch):
+    monkeypatch.setenv("STUB_HBATCH_FAIL", "missing")
+    monkeypatch.setenv("STUB_HBATCH_FAIL_FRAME", "3")
+    job = render(engine, scene)
+    assert (job.state, job.failure) == (FAILED, MISSING_FILE)
+
+
+def test_transient_failure_is_retried_later(engine, scene, monkeypatch):
+    monkeypatch.setenv("STUB_HBATCH_FAIL", "license")
+    monkeypatch.setenv("STUB_HBATCH_FAIL_FRAME", "3")
+    nodes, _ = engine.scan(scene)
+    job = engine.enqueue(engine.make_job(scene, nodes[0]))
+    deadline = time.time() + 30
+    while job.retry_at is None and time.time() < deadline:
+        time.sleep(0.05)
+    assert (job.state, job.failure, job.attempts) == (QUEUED, LICENSE, 1)
+    assert job.retry_at > time.time()
+
+
+def test_wait_returns_jobs_blocked_by_a_held_input(tmp_path):
+    hip = write_chain(str(tmp_path / "chain.hip"))
+    engine = RenderEngine(launcher=LAUNCHER, persist_queue=False)
+    try:
+        nodes, _ = engine.scan(hip)
+        last = [node for node in nodes if node["path"] == "/obj/geo2/filecache1"]
+        upstream, downstream = engine.make_jobs(hip, last, include_inputs=True)
+        assert downstream.depends_on == [upstream.id]
+        for job in (upstream, downstream):
+            engine.enqueue(job)
+        engine.hold(upstream)
+        engine.start()
+        blocked = engine.wait([upstream, downstream], 0.05)
+        assert upstream.state == HELD
+        assert blocked == {downstream: upstream}
+    finally:
+        engine.shutdown()
+
+
+def test_failed_input_fails_its_dependents(tmp_path, monkeypatch):
+    monkeypatch.setenv("STUB_HBATCH_FAIL", "error")
+    monkeypatch.setenv("STUB_HBATCH_FAIL_FRAME", "2")
+    hip = write_chain(str(tmp_path / "chain.hip"))
+    engine = RenderEngine(launcher=LAUNCHER, persist_queue=False)
+    try:
+        nodes, _ = engine.scan(hip)
+        last = [node for node in nodes if node["path"] == "/obj/geo2/filecache1"]
+        jobs = [engine.enqueue(job) for job in engine.make_jobs(hip, last, include_inputs=True)]
+        engine.start()
+        engine.wait(jobs, 0.05)
+        # The dispatcher fails the dependent on its next pass
+        deadline = time.time() + 10
+        while jobs[1].state == QUEUED and time.time() < deadline:
+            time.sleep(0.05)
+        assert jobs[0].state == FAILED
+        assert (jobs[1].state, jobs[1].failure) == (FAILED, DEPENDENCY)
+    finally:
+        engine.shutdown()
+
+
+def test_metrics_database_errors_do_not_stop_the_job(engine, scene, monkeypatch):
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(engine.metrics, "start_job", locked)
+    job = render(engine, scene)
+    assert job.state == DONE, job.error
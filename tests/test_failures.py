@@ -0,0 +1,37 @@
+import pytest
+
+from houdini_render.failures import (CRASH, ERROR, LICENSE, MISSING_FILE, OOM, TIMEOUT, classify,
+                                     is_transient, retry_delay)
+
+
+@pytest.mark.parametrize("returncode, lines, message, failure", [
+    (1, ["Error: No licenses available from hserver"], "", LICENSE),
+    (1, ["std::bad_alloc: out of memory at frame 12"], "", OOM),
+    (1, ["Error: Unable to open file stub_missing.0003.bgeo.sc"], "", MISSING_FILE),
+    (None, ["Caught signal 11 (Segmentation fault)"], "", CRASH),
+    (None, [], "Timed out after 30s waiting for hbatch", TIMEOUT),
+    (-9, [], "", OOM),
+    (137, [], "", OOM),
+    (139, [], "", CRASH),
+    (-11, [], "", CRASH),
+    (0xC0000005, [], "", CRASH),
+    (1, ["Error: Cook error in the stub scene"], "", ERROR),
+    (None, [], "", ERROR),
+])
+def test_classify(returncode, lines, message, failure):
+    assert classify(returncode, lines, message) == failure
+
+
+def test_log_signature_wins_over_exit_code():
+    assert classify(137, ["Error: No licenses available"]) == LICENSE
+
+
+def test_transient_failures():
+    assert all(is_transient(failure) for failure in (OOM, LICENSE, CRASH, TIMEOUT))
+    assert not any(is_transient(failure) for failure in (ERROR, MISSING_FILE))
+
+
+def test_retry_delay_backs_off_up_to_the_cap():
+    assert 24 <= retry_delay(1) <= 36
+    assert 48 <= retry_delay(2) <= 72
+    assert retry_delay(20, cap=900) <= 900 * 1.2
@@ -0,0 +1,104 @@
+import json
+import threading
+
+from houdini_render.chunks import FrameChunk
+from houdini_render.jobs import DONE, QUEUED, RUNNING, JobQueue, RenderJob
+from houdini_render.journal import Journal
+
+
+def make_job(node="/obj/geo1/filecache1", **extra):
+    return RenderJob("/show/shot.hip", "filecache::2.0", node, f"render -V {node}/render",
+                     frame_range=(1, 20, 1), **extra)
+
+
+def open_queue(tmp_path):
+    path = str(tmp_path / "queue.json")
+    return JobQueue(path, Journal(str(tmp_path / "queue.journal")))
+
+
+def test_jobs_survive_a_restart(tmp_path):
+    queue = open_queue(tmp_path)
+    done, running, waiting = (queue.add(make_job(f"/obj/geo{i}/filecache1")) for i in range(3))
+    queue.set_state(done, RUNNING)
+    queue.set_state(done, DONE)
+    queue.set_state(running, RUNNING)
+    queue.set_priority(waiting, 5)
+
+    restored = open_queue(tmp_path)
+    states = {job.id: job for job in restored.snapshot()}
+    assert states[done.id].state == DONE
+    # Whatever was running when the tool went away starts over
+    assert states[running.id].state == QUEUED
+    assert states[running.id].started is None
+    assert states[waiting.id].priority == 5
+
+
+def test_journal_keeps_finished_chunks(tmp_path):
+    queue = open_queue(tmp_path)
+    job = queue.add(make_job(chunk_size=5))
+    for start, state in ((1, DONE), (6, DONE), (11, RUNNING)):
+        chunk = FrameChunk(0, start, start + 4)
+        chunk.state = state
+        queue.record_chunk(job, chunk)
+
+    restored = open_queue(tmp_path)
+    assert sorted(restored.done_chunks(job.id)) == [(1, 5), (6, 10)]
+
+
+def test_journal_is_newer_than_the_snapshot(tmp_path):
+    queue = open_queue(tmp_path)
+    job = queue.add(make_job())
+    with open(queue.path, "r") as f:
+        snapshot = f.read()
+    queue.set_state(job, RUNNING)
+    queue.set_state(job, DONE)
+    # A crash between the journal write and the snapshot leaves an older snapshot
+    with open(queue.path, "w") as f:
+        f.write(snapshot)
+
+    assert open_queue(tmp_path).get(job.id).state == DONE
+
+
+def test_torn_last_journal_line_is_ignored(tmp_path):
+    queue = open_queue(tmp_path)
+    job = queue.add(make_job())
+    queue.set_state(job, RUNNING)
+    queue.set_state(job, DONE)
+    queue.journal.close()
+    with open(queue.journal.path, "a") as f:
+        f.write(json.dumps({"event": "update", "id": job.id, "fields": {"state": "x"}})[:20])
+
+    assert open_queue(tmp_path).get(job.id).state == DONE
+
+
+def test_hip_mtime_is_recorded_when_a_job_starts(tmp_path):
+    hip = tmp_path / "shot.hip"
+    hip.write_text("{}")
+    queue = open_queue(tmp_path)
+    job = queue.add(RenderJob(str(hip), "filecache::2.0", "/obj/a", "render -V /obj/a"))
+    queue.set_state(job, RUNNING)
+    assert job.hip_mtime == hip.stat().st_mtime
+    assert open_queue(tmp_path).get(job.id).hip_mtime == job.hip_mtime
+
+
+def test_concurrent_saves_do_not_fail(tmp_path):
+    queue = open_queue(tmp_path)
+    jobs = [queue.add(make_job(f"/obj/geo{i}/filecache1")) for i in range(8)]
+    errors = []
+
+    def flip(job):
+        try:
+            for count in range(50):
+                queue.set_state(job, RUNNING if count % 2 else QUEUED)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=flip, args=(job,)) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert [path.name for path in tmp_path.iterdir() if path.suffix == ".tmp"] == []
+    with open(queue.path, "r") as f:
+        assert len(json.load(f)["jobs"]) == len(jobs)
@@ -0,0 +1,82 @@
+import os
+import stat
+
+import pytest
+
+from houdini_render.session import HbatchSession, SessionError, SessionPool, hbatch_command
+
+from .conftest import LAUNCHER, STUB
+
+
+@pytest.fixture
+def pool():
+    pool = SessionPool(LAUNCHER, max_sessions=2, load_timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def test_acquire_loads_the_hip_and_renders(pool, scene):
+    session = pool.acquire(scene)
+    assert session.is_alive()
+    lines = session.run("render -V /obj/geo1/filecache1/render", capture=True)
+    assert any("frame 5" in line.lower() for line in lines)
+    assert os.path.exists(os.path.join(os.path.dirname(scene), "cache", "geo1.0005.bgeo.sc"))
+    pool.release(session)
+
+
+def test_released_session_is_reused(pool, scene):
+    first = pool.acquire(scene)
+    pool.release(first)
+    second = pool.acquire(scene)
+    assert second is first
+    assert second.ping()
+    pool.release(second)
+
+
+def test_changed_hip_is_not_reused(pool, scene):
+    first = pool.acquire(scene)
+    pool.release(first)
+    os.utime(scene, (os.path.getmtime(scene) + 10,) * 2)
+    second = pool.acquire(scene)
+    assert second is not first
+    pool.release(second)
+
+
+def test_shell_launcher_quotes_the_hip_path(tmp_path, monkeypatch):
+    folder = tmp_path / "x$(touch injected)"
+    folder.mkdir()
+    hip = str(folder / "a b.hip")
+    with open(hip, "w") as f:
+        f.write('{"frame": 1, "nodes": []}')
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    hbatch = bin_dir / "hbatch"
+    hbatch.write_text(f'#!/bin/sh\nexec "{LAUNCHER[0]}" "{STUB}" "$@"\n')
+    hbatch.chmod(hbatch.stat().st_mode | stat.S_IEXEC)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+    monkeypatch.chdir(tmp_path)
+    session = HbatchSession(["bash", "--noprofile", "--norc"], hip, load_timeout=30)
+    session.start()
+    try:
+        assert session.ping()
+    finally:
+        session.close()
+    assert not (tmp_path / "injected").exists()
+
+
+@pytest.mark.parametrize("path", ['a"b.hip', "a%PATH%.hip", "a^b.hip", "a&b.hip", "a|b.hip"])
+def test_hcmd_refuses_paths_it_would_interpret(path):
+    with pytest.raises(SessionError):
+        hbatch_command(["hcmd.exe"], 4, path)
+
+
+def test_line_breaks_are_refused_for_every_launcher():
+    for launcher in (["hcmd.exe"], ["bash"]):
+        with pytest.raises(SessionError):
+            hbatch_command(launcher, 4, "a\nb.hip")
+
+
+def test_shell_command_execs_hbatch():
+    assert (hbatch_command(["/bin/bash"], 8, "/show/a b.hip")
+            == "exec hbatch -i -j 8 '/show/a b.hip'")
+    assert hbatch_command(["hcmd.exe"], 8, "C:/show/a b.hip") == 'hbatch -i -j 8 "C:/show/a b.hip"'
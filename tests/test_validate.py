@@ -0,0 +1,100 @@
+import os
+
+import pytest
+
+from houdini_render.resume import find_valid_frames, missing_frame_ranges, truncated_frames
+from houdini_render.validate import (EMPTY, MISSING, SMALL, STALE, TRUNCATED, load_manifest,
+                                     manifest_path, manifest_sizes, validate_outputs,
+                                     write_manifest)
+
+# Sizes that shrink or grow legitimately over a sim; neither is truncated by itself
+GROWING = {1: 300, 2: 40000, 3: 90000, 4: 150000}
+EMPTYING = {1: 50000, 2: 52000, 3: 1000, 4: 900, 5: 950}
+
+
+@pytest.fixture
+def outputs(tmp_path):
+    """Write one file per frame of {frame: size}; returns the output pattern."""
+    pattern = str(tmp_path / "cache" / "geo.{frame}.bgeo.sc")
+    os.makedirs(os.path.dirname(pattern))
+
+    def write(sizes):
+        for frame, size in sizes.items():
+            with open(pattern.format(frame=frame), "wb") as f:
+                f.write(b"x" * size)
+        return pattern
+    return write
+
+
+def test_complete_outputs(outputs):
+    pattern = outputs({frame: 1000 for frame in range(1, 6)})
+    manifest = validate_outputs(pattern, (1, 5, 1), hip_mtime=0)
+    assert manifest["problems"] == {}
+    assert manifest["warnings"] == {}
+    assert manifest["total_bytes"] == 5000
+    assert all(entry["hash"] for entry in manifest["files"])
+
+
+def test_missing_empty_and_stale_frames(outputs):
+    pattern = outputs({1: 1000, 2: 0, 4: 1000, 5: 1000})
+    os.utime(pattern.format(frame=5), (100, 100))
+    manifest = validate_outputs(pattern, (1, 5, 1), hip_mtime=1000)
+    assert manifest["problems"] == {MISSING: [3], EMPTY: [2], STALE: [5]}
+
+
+@pytest.mark.parametrize("sizes, small", [(GROWING, [1]), (EMPTYING, [3, 4])])
+def test_small_frames_are_only_a_warning(outputs, sizes, small):
+    pattern = outputs(sizes)
+    manifest = validate_outputs(pattern, (1, len(sizes), 1), hip_mtime=0)
+    assert manifest["problems"] == {}
+    assert manifest["warnings"] == {SMALL: small}
+
+
+def test_frame_that_shrank_since_the_last_manifest_is_truncated(outputs):
+    pattern = outputs(EMPTYING)
+    previous = validate_outputs(pattern, (1, 5, 1), hip_mtime=0)
+    outputs({3: 10})
+    manifest = validate_outputs(pattern, (1, 5, 1), hip_mtime=0, previous=previous)
+    assert manifest["problems"] == {TRUNCATED: [3]}
+    assert manifest["warnings"] == {}
+
+
+def test_unchanged_files_keep_their_hash(outputs):
+    pattern = outputs({frame: 1000 for frame in range(1, 4)})
+    path = write_manifest(validate_outputs(pattern, (1, 3, 1)), manifest_path(pattern))
+    outputs({2: 2000})
+    manifest = validate_outputs(pattern, (1, 3, 1), previous=load_manifest(path))
+    assert manifest["hashed"] == 1
+
+
+def test_resume_skips_complete_frames(outputs):
+    pattern = outputs({1: 1000, 2: 1000, 4: 1000})
+    assert find_valid_frames(pattern, (1, 5, 1), hip_mtime=0) == {1, 2, 4}
+    assert missing_frame_ranges(pattern, (1, 5, 1), hip_mtime=0) == [(3, 3), (5, 5)]
+
+
+def test_resume_renders_stale_frames_again(outputs):
+    pattern = outputs({1: 1000, 2: 1000})
+    os.utime(pattern.format(frame=1), (100, 100))
+    assert missing_frame_ranges(pattern, (1, 2, 1), hip_mtime=1000) == [(1, 1)]
+
+
+@pytest.mark.parametrize("sizes", [GROWING, EMPTYING])
+def test_resume_trusts_the_manifest(outputs, sizes):
+    pattern = outputs(sizes)
+    frame_range = (1, len(sizes), 1)
+    known = manifest_sizes(validate_outputs(pattern, frame_range, hip_mtime=0))
+    assert find_valid_frames(pattern, frame_range, 0, known_sizes=known) == set(sizes)
+
+
+def test_resume_renders_frames_that_shrank(outputs):
+    pattern = outputs(EMPTYING)
+    known = manifest_sizes(validate_outputs(pattern, (1, 5, 1), hip_mtime=0))
+    outputs({2: 10})
+    assert missing_frame_ranges(pattern, (1, 5, 1), 0, known_sizes=known) == [(2, 2)]
+
+
+def test_truncated_frames_guesses_without_known_sizes():
+    assert truncated_frames({1: 1000, 2: 1000, 3: 10, 4: 1000}) == {3}
+    assert truncated_frames({1: 1000, 2: 10}) == set()
+    assert truncated_frames({1: 1000, 2: 1000, 3: 10, 4: 1000}, known_sizes={3: 12}) == set()
@@ -0,0 +1,361 @@
+"""Stand-in for hcmd.exe/hbatch that speaks the same stdin/stdout protocol.
+
+It starts in "hcmd" mode and waits for an ``hbatch ... "<hip>"`` line, or
+runs as hbatch directly when given ``hbatch``'s arguments. It then
+loads the hip file, which for the stub is a JSON scene description, and
+accepts a small subset of hscript: ``echo``, ``render``, ``python`` and
+``quit``. A fake ``hou`` module built from the scene is injected for
+``python`` scripts, so the real detection script runs unchanged.
+
+Scene file layout::
+
+    {"frame": 1,
+     "nodes": [{"type": "filecache::2.0", "path": "/obj/geo1/filecache1",
+                "parms": {"trange": 1, "f1": 1, "f2": 240, "f3": 1,
+                          "sopoutput": "$HIP/geo/cache.$F4.bgeo.sc"}},
+               {"type": "sopimport", "path": "/stage/sopimport1",
+                "parms": {"soppath": "/obj/geo1/filecache1"}},
+               {"type": "usdrender_rop", "path": "/stage/usdrender_rop1",
+                "inputs": ["/stage/sopimport1"], "parms": {...}}]}
+
+``inputs`` lists the nodes wired into a node. A string parm naming another
+node is a node reference; any other string parm is read as a file path.
+
+Rendering a node with a ``sopoutput``, ``outputimage`` or ``picture`` parm
+writes a small file per frame to the expanded path. Without ``-f`` the
+node's own frame range is rendered.
+
+Environment knobs:
+
+    STUB_HBATCH_LOAD_DELAY   seconds spent "loading" the hip (default 0.5)
+    STUB_HBATCH_FRAME_TIME   seconds per rendered frame (default 0.05)
+    STUB_HBATCH_LOG_LINES    extra log lines printed per frame (default 0)
+    STUB_HBATCH_OUTPUT_SIZE  bytes written per output file (default: a short line)
+    STUB_HBATCH_FAIL         how a render fails: error, missing, license, oom or crash;
+                             oom and crash make the whole process exit (default error)
+    STUB_HBATCH_FAIL_FRAME   frame at which every render fails
+    STUB_HBATCH_FAIL_RATE    chance (0-1) that a render fails at a random frame
+"""
+import json
+import os
+import random
+import re
+import shlex
+import sys
+import time
+import types
+
+# Failure mode -> (message, exit code or None to keep hbatch running)
+FAILURES = {
+    "error": ("Error: Cook error in the stub scene at frame {frame}", None),
+    "missing": ("Error: Unable to open file stub_missing.{frame}.bgeo.sc", None),
+    "license": ("Error: No licenses available from hserver", None),
+    "oom": ("std::bad_alloc: out of memory at frame {frame}", 137),
+    "crash": ("Caught signal 11 (Segmentation fault) at frame {frame}", 139),
+}
+
+
+def env_float(name, default):
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        return default
+
+
+class FakeNodeType:
+    def __init__(self, name, scene=None, category=None):
+        self._name = name
+        self._scene = scene
+        self._category = category
+
+    def name(self):
+        return self._name
+
+    def instances(self):
+        return tuple(node for node in self._scene.nodes
+                     if node._data["type"] == self._name and node.category() == self._category)
+
+
+OUTPUT_PARMS = ("sopoutput", "outputimage", "picture")
+
+
+def expand(value, scene, frame):
+    if not isinstance(value, str):
+        return value
+    value = value.replace("$HIP", os.path.dirname(os.path.abspath(scene.hip_path)))
+    return re.sub(r"\$F(\d*)",
+                  lambda m: str(int(frame)).zfill(int(m.group(1) or 0)), value)
+
+
+class FakeParmTemplate:
+    def __init__(self, parm):
+        self._parm = parm
+
+    def type(self):
+        return "String" if isinstance(self._parm._value, str) else "Float"
+
+    def stringType(self):
+        # A string that names a node is a node reference, anything else a file path
+        if self._parm.evalAsNode() is not None:
+            return "NodeReference"
+        return "FileReference"
+
+
+class FakeParm:
+    def __init__(self, scene, value, name=None):
+        self._scene = scene
+        self._value = value
+        self._name = name
+
+    def name(self):
+        return self._name
+
+    def eval(self):
+        return self.evalAtFrame(self._scene.data.get("frame", 1))
+
+    def evalAtFrame(self, frame):
+        return expand(self._value, self._scene, frame)
+
+    def evalAsNode(self):
+        if not isinstance(self._value, str) or not self._value.startswith("/"):
+            return None
+        return self._scene.node(self._value)
+
+    def parmTemplate(self):
+        return FakeParmTemplate(self)
+
+
+class FakeParmTuple:
+    def __init__(self, values):
+        self._values = values
+
+    def eval(self):
+        return tuple(self._values)
+
+
+class FakeNode:
+    def __init__(self, scene, data):
+        self._scene = scene
+        self._data = data
+
+    def path(self):
+        return self._data["path"]
+
+    def name(self):
+        return self._data["path"].rsplit("/", 1)[-1]
+
+    def type(self):
+        return FakeNodeType(self._data["type"], self._scene, self.category())
+
+    def category(self):
+        """Node type category; defaults to the one implied by the network."""
+        if "category" in self._data:
+            return self._data["category"]
+        if self.path().startswith("/out/"):
+            return "Driver"
+        if self.path().startswith("/stage/"):
+            return "Lop"
+        return "Sop"
+
+    def parm(self, name):
+        parms = self._data.get("parms", {})
+        if name not in parms:
+            return None
+        return FakeParm(self._scene, parms[name], name)
+
+    def parms(self):
+        return [FakeParm(self._scene, value, name)
+                for name, value in self._data.get("parms", {}).items()]
+
+    def inputs(self):
+        return tuple(self._scene.node(path) for path in self._data.get("inputs", []))
+
+    def references(self):
+        """Nodes named by this node's parms."""
+        nodes = (parm.evalAsNode() for parm in self.parms())
+        return tuple(node for node in nodes if node is not None)
+
+    def parmTuple(self, name):
+        parms = self._data.get("parms", {})
+        names = [f"{name}{i}" for i in (1, 2, 3)]
+        if not all(n in parms for n in names):
+            return None
+        return FakeParmTuple([parms[n] for n in names])
+
+    def allSubChildren(self):
+        prefix = self.path().rstrip("/") + "/"
+        return [node for node in self._scene.nodes if node.path().startswith(prefix)]
+
+
+class Scene:
+    def __init__(self, hip_path):
+        self.load(hip_path)
+
+    def load(self, hip_path, **kwargs):
+        self.hip_path = hip_path
+        with open(hip_path, "r") as f:
+            data = json.load(f)
+        self.data = data
+        self.nodes = [FakeNode(self, node) for node in data.get("nodes", [])]
+        # Benchmark scenes have thousands of nodes; look them up by path
+        self.by_path = {node.path(): node for node in self.nodes}
+
+    def node(self, path):
+        if path == "/":
+            return FakeNode(self, {"type": "root", "path": "/"})
+        return self.by_path.get(path)
+
+
+def make_hou(scene):
+    hou = types.ModuleType("hou")
+    hou.node = scene.node
+    hou.frame = lambda: scene.data.get("frame", 1)
+    hou.sopNodeTypeCategory = lambda: "Sop"
+    hou.ropNodeTypeCategory = lambda: "Driver"
+    hou.lopNodeTypeCategory = lambda: "Lop"
+    hou.nodeType = lambda category, name: FakeNodeType(name, scene, category)
+    hou.parmTemplateType = types.SimpleNamespace(String="String", Float="Float")
+    hou.stringParmType = types.SimpleNamespace(FileReference="FileReference",
+                                               NodeReference="NodeReference")
+
+    def load(hip_path, **kwargs):
+        time.sleep(env_float("STUB_HBATCH_LOAD_DELAY", 0.5))
+        scene.load(hip_path)
+
+    hou.hipFile = types.SimpleNamespace(load=load, path=lambda: scene.hip_path)
+    return hou
+
+
+def emit(text):
+    sys.stdout.write(text + "\n")
+    sys.stdout.flush()
+
+
+def run_python(scene, script_path):
+    sys.modules["hou"] = make_hou(scene)
+    namespace = {"__name__": "__main__", "__file__": script_path}
+    try:
+        with open(script_path, "r") as f:
+            code = compile(f.read(), script_path, "exec")
+        exec(code, namespace)
+    except Exception as e:
+        sys.stderr.write(f"Traceback: {e}\n")
+        sys.stderr.flush()
+
+
+def frame_args(node, args):
+    """(start, end, step) from ``-f``/``-i`` or the node's own frame range."""
+    start, end, step = 1, 10, 1
+    parm_range = node.parmTuple("f")
+    trange = node.parm("trange")
+    if parm_range is not None and (trange is None or trange.eval()):
+        start, end, step = (int(float(value)) for value in parm_range.eval())
+    if "-f" in args:
+        i = args.index("-f")
+        start, end = int(float(args[i + 1])), int(float(args[i + 2]))
+    if "-i" in args:
+        step = int(float(args[args.index("-i") + 1]))
+    return start, end, max(1, step)
+
+
+def fail_frame(frames):
+    """Frame at which this render fails according to the knobs, or None."""
+    if os.environ.get("STUB_HBATCH_FAIL_FRAME"):
+        return int(env_float("STUB_HBATCH_FAIL_FRAME", 0))
+    if frames and random.random() < env_float("STUB_HBATCH_FAIL_RATE", 0):
+        return random.choice(frames)
+    return None
+
+
+def write_output(path, frame, size):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        if size is None:
+            f.write(b"stub frame %d\n" % frame)
+            return
+        block = b"%08d" % frame * 8192
+        while size > 0:
+            f.write(block[:size])
+            size -= len(block)
+
+
+def run_render(scene, args):
+    frame_time = env_float("STUB_HBATCH_FRAME_TIME", 0.05)
+    log_lines = int(env_float("STUB_HBATCH_LOG_LINES", 0))
+    size = os.environ.get("STUB_HBATCH_OUTPUT_SIZE")
+    size = int(float(size)) if size else None
+    rop = args[-1] if args else ""
+    node = scene.node(rop) or scene.node(rop.rsplit("/", 1)[0])
+    if node is None:
+        sys.stderr.write(f"Error: Invalid ROP: {rop}\n")
+        sys.stderr.flush()
+        return
+    start, end, step = frame_args(node, args)
+    frames = list(range(start, end + 1, step))
+    failing = fail_frame(frames)
+    output = None
+    for name in OUTPUT_PARMS:
+        output = output or node.parm(name)
+    for frame in frames:
+        time.sleep(frame_time)
+        if frame == failing:
+            message, exit_code = FAILURES.get(os.environ.get("STUB_HBATCH_FAIL", "error"),
+                                              FAILURES["error"])
+            sys.stderr.write(message.format(frame=frame) + "\n")
+            sys.stderr.flush()
+            if exit_code is not None:
+                sys.stdout.flush()
+                os._exit(exit_code)
+            return
+        # Filler that the progress and telemetry parsers do not take for frame messages
+        for line in range(log_lines):
+            emit(f"Stub output line {line + 1} of {log_lines} for {rop}")
+        if output is not None:
+            write_output(output.evalAtFrame(frame), frame, size)
+        emit(f"Rendering frame {frame} (rop {rop})")
+
+
+def hbatch_loop(hip_path):
+    time.sleep(env_float("STUB_HBATCH_LOAD_DELAY", 0.5))
+    scene = Scene(hip_path)
+    emit(f"Loaded {hip_path}")
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            parts = shlex.split(line)
+        except ValueError:
+            parts = line.split()
+        command, args = parts[0], parts[1:]
+        if command == "echo":
+            emit(" ".join(args))
+        elif command == "render":
+            run_render(scene, args)
+        elif command == "python":
+            run_python(scene, args[-1])
+        elif command in ("quit", "exit", "q"):
+            return
+        else:
+            sys.stderr.write(f"Unknown command: {command}\n")
+            sys.stderr.flush()
+
+
+def main():
+    if len(sys.argv) > 1:
+        # Started as "hbatch -i -j N hip", e.g. from a shell on Linux
+        hbatch_loop(sys.argv[-1])
+        return
+    emit("Houdini command line stub")
+    for line in sys.stdin:
+        parts = shlex.split(line.strip()) if line.strip() else []
+        if not parts:
+            continue
+        if parts[0] == "hbatch":
+            hbatch_loop(parts[-1])
+        elif parts[0] == "exit":
+            return
+
+
+if __name__ == "__main__":
+    main()